@@ -1,6 +1,9 @@
 #! /usr/bin/env python
 #-*- coding: UTF-8 -*-
+import bisect
 import pygame
+from collections import OrderedDict, deque
+from timeit import default_timer
 from herramientas import *
 from locales import *
 from exceptions import *
@@ -17,12 +20,19 @@ Controles incluidos en este módulo:
 
 class Screen(object):
     """Clase que agrupa un conjunto de controles que define una pantalla. Recibe solo un parámetro, que es un string
-    con el nombre de la pantalla, que debe ser único entre todas las pantallas."""
+    con el nombre de la pantalla, que debe ser único entre todas las pantallas.
+
+    Los controles hablan con su pantalla a través de un protocolo de contenedor, que también implementa Panel para
+    sus hijos: el contenedor asigna la pantalla del control con Control._set_container() al agregarlo (None al
+    quitarlo), y el control le avisa sus cambios con _reindex(control) (posición o visibilidad), _refocus(control)
+    (focusable o enable) y _reorder(control, viejo) (focusOrder). Estos métodos no son para uso de la aplicación."""
 
     __screens = {}
     __current = None
     __prev = None
 
+    grid_size = 64  # Lado en pixeles de las celdas del índice espacial usado para ubicar controles bajo el mouse
+
 
     @staticmethod
     def set_current(name):
@@ -30,13 +40,16 @@ class Screen(object):
 
         if Screen.__current != None:
             if name != Screen.__current.name:  # Si el nombre de current es igual a la que cambio, entonces no hago nada
+                Screen.__current.__suspend()
                 Screen.__prev = Screen.__current
                 Screen.__current = Screen.__screens[name]
                 Screen.__current.clean_focus()
+                Screen.__current.invalidate()
         else:
             # Si inicialmente el current era None estoy comenzado, entonces inicializo las dos con la pantalla pasada
             Screen.__current = Screen.__screens[name]
             Screen.__prev = Screen.__current
+            Screen.__current.invalidate()
 
 
 
@@ -50,9 +63,18 @@ class Screen(object):
     @staticmethod
     def set_prev():
         '''Cambia la pantalla actual por la anterior'''
+        if Screen.__current != None:
+            Screen.__current.__suspend()
         aux = Screen.__current
         Screen.__current = Screen.__prev
         Screen.__prev = aux
+        Screen.__current.invalidate()
+
+    def __suspend(self):
+        '''Detiene las animaciones del control con el foco cuando la pantalla deja de ser la actual, ya que no se va a
+        dibujar. Se reanudan al volver a dibujarlo. Es de uso privado'''
+        if self.__focus != None:
+            self.__focus.stop_animations()
 
     @staticmethod
     def screens():
@@ -65,6 +87,20 @@ class Screen(object):
         # Propiedades principales: nombre y controles
         self.__name = name
         self.__controls = {}
+        self.__order = []  # Controles en orden Z: el último se dibuja encima de los demás
+        self.__z = {}      # Posición en el orden Z de cada control, por nombre
+        self.__zcount = 0
+
+        # Orden del foco: lista ordenada de claves (focusOrder, z, nombre) de los controles que pueden recibir el foco,
+        # y cantidad de controles que usan cada focusOrder
+        self.__focus_list = []
+        self.__focus_keys = {}
+        self.__orders = {}
+        self.__free = 1  # Ningún orden menor que éste está libre
+
+        # Índice espacial: cada celda de la grilla guarda los controles visibles que la tocan
+        self.__grid = {}
+        self.__cells = {}  # Celdas ocupadas por cada control, por nombre
 
         # Establezco el fondo y sus caracteristicas
         self.__background_type = T_DRAW
@@ -72,6 +108,10 @@ class Screen(object):
         self.__background_image = None
 
 
+        # Estado del mouse, tomado una vez por frame y compartido por todos los controles
+        self.__input = InputState()
+        self.__capture = None  # Control que recibe el movimiento del mouse mientras arrastra (ver capture_mouse)
+
         # Establezco el foco y sus caracteristicas
         self.__focus = None
         self.__focus_border = Border()
@@ -80,6 +120,11 @@ class Screen(object):
         self.__focus_border.size = 1
         self.__focus_border.style = S_SOLID
         self.__focus_border.show = True
+
+        # Dibujado por regiones sucias. Si dirty_mode es False se dibujan todos los controles en cada frame
+        self.__dirty_mode = False
+        self.__redraw_all = True    # Fuerza el redibujado completo en el proximo render
+        self.__pending_rects = []   # Regiones a limpiar que no pertenecen a ningun control (ej: controles quitados)
         
 
         # Agrego la pantalla al diccionario. Si ya existe lanzo una excepcion
@@ -104,6 +149,7 @@ class Screen(object):
     @background_color.setter
     def background_color(self, color):
         self.__background_color = color
+        self.invalidate()
     
     @property
     def background_image(self):
@@ -114,6 +160,7 @@ class Screen(object):
     @background_image.setter
     def background_image(self, image):
         self.__background_image = image
+        self.invalidate()
     
     @property
     def background_type(self):
@@ -124,8 +171,27 @@ class Screen(object):
     @background_type.setter
     def background_type(self, tipo):
         self.__background_type = tipo
+        self.invalidate()
+
+    @property
+    def dirty_mode(self):
+        '''Si es True, render() solo redibuja las regiones de los controles que cambiaron desde el frame anterior y
+        devuelve la lista de rectangulos modificados, para pasarla a pygame.display.update(rects). En este modo la
+        pantalla dibuja su propio fondo.'''
+        return self.__dirty_mode
+    
+    
+    @dirty_mode.setter
+    def dirty_mode(self, val):
+        self.__dirty_mode = val
+        self.invalidate()
 
 
+    @property
+    def input(self):
+        '''Objeto InputState con el estado del mouse del frame actual. Solo lectura'''
+        return self.__input
+
     @property
     def focus_border(self):
         '''Borde del control que tiene el foco'''
@@ -144,25 +210,34 @@ class Screen(object):
     # FUNCIONES PARA EL MANEJO DE CONTROLES
 
 
-    def addControl(self, control):
-        '''Agrega el control pasado a la lista de controles de la pantalla'''
+    def __add(self, control):
+        '''Registra el control en la pantalla sin ordenar la lista de foco. Devuelve la clave de foco del control, o
+        None si no puede recibir el foco. Es de uso privado'''
 
         # Agrega el control solo si no existe en el diccionario
         if control.name in self.__controls:  
             raise controlExistente(control.name)
 
+        # Verifica que el orden del foco en el control sea valido
+        if self.__orders.get(control.focusOrder): # Si el orden del control ya existe ...
+            control.focusOrder = self.__free_order()  # ... le asigno el menor orden libre
+
         self.__controls[control.name] = control
-        control._Control__screen = self
+        self.__order.append(control)
+        self.__z[control.name] = self.__zcount
+        self.__zcount += 1
+        control._set_container(self)
+        self._reindex(control)
 
-        # Verifica que el orden del foco en el control sea valido
-        fo = [c.focusOrder for c in self.get_controls()]  # Lista de focusOrder usados
+        self.__orders[control.focusOrder] = self.__orders.get(control.focusOrder, 0) + 1
+        return self.__focus_key(control)
 
-        if control.focusOrder in fo: # Si el orden del control ya existe ...
-            n = 1
-            while n in fo:           # ... Busco un orden nuevo que sea valido ...
-                n += 1
+    def addControl(self, control):
+        '''Agrega el control pasado a la lista de controles de la pantalla'''
 
-            control.focusOrder = n   # ... y se lo asigno al control
+        clave = self.__add(control)
+        if clave != None:
+            bisect.insort(self.__focus_list, clave)
 
     def addControls(self, *controles):
         '''Agrega los controles pasados a la lista de controles de la pantalla'''
@@ -170,25 +245,20 @@ class Screen(object):
         if len(controles)==0:  # Si no paso ningún control lanzo una excepción
             raise TypeError('addControls() takes at least 1 argument (0 given)')
 
+        # Se validan los nombres antes de tocar nada, para no dejar la pantalla a medio agregar
+        nombres = set(self.__controls)
         for control in controles:
-            # Agrega el control solo si no existe en el diccionario
-            if control.name in self.__controls:  
+            if control.name in nombres:
                 raise controlExistente(control.name)
+            nombres.add(control.name)
 
-            self.__controls[control.name] = control
-            control._Control__screen = self
-
-            # Verifica que el orden del foco en el control sea valido
-            fo = [c.focusOrder for c in self.get_controls()]  # Lista de focusOrder usados
-
-            if control.focusOrder in fo: # Si el orden del control ya existe ...
-                n = 1
-                while n in fo:           # ... Busco un orden nuevo que sea valido ...
-                    n += 1
-
-                control.focusOrder = n   # ... y se lo asigno al control
-
-
+        try:
+            for control in controles:
+                clave = self.__add(control)
+                if clave != None:
+                    self.__focus_list.append(clave)
+        finally:
+            self.__focus_list.sort()  # Se ordena una sola vez al final, aunque algún control falle
 
 
     def removeControl(self, name):
@@ -196,15 +266,31 @@ class Screen(object):
 
         if name in self.__controls:
             c = self.__controls.pop(name)
-            c._Controls__screen = None
+            self.__focus_discard(c)
+            self.__release_order(c.focusOrder)
+            self.__order.remove(c)
+            del self.__z[name]
+            self.__unindex(c)
+            c._set_container(None)
+
+            # La region que ocupaba el control debe limpiarse en el proximo render
+            if c.last_rect != None:
+                self.__pending_rects.append(c.last_rect)
+
+            if c == self.__focus:
+                self.__focus = None
+            c.stop_animations()
+            if c is self.__capture:
+                self.__capture = None
+
             return c
         else:
             raise controlInexistente(name)
 
 
     def get_controls(self):
-        '''Devuelve una lista con los controles de la pantalla'''
-        return self.__controls.values()
+        '''Devuelve una lista con los controles de la pantalla, en orden Z (de atrás hacia adelante)'''
+        return list(self.__order)
 
 
     def get_control(self, name, raiseErr=True):
@@ -220,14 +306,172 @@ class Screen(object):
 
 
 
+    # FUNCIONES DEL ÍNDICE ESPACIAL
+
+
+    def __cells_of(self, rect):
+        '''Devuelve la lista de celdas de la grilla que toca el rectángulo. Es de uso privado'''
+
+        g = Screen.grid_size
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+
+        return [(x, y) for x in range(rect.left // g, (rect.right - 1) // g + 1)
+                       for y in range(rect.top // g, (rect.bottom - 1) // g + 1)]
+
+    def __unindex(self, control):
+        '''Quita el control del índice espacial. Es de uso privado'''
+
+        for celda in self.__cells.pop(control.name, []):
+            grupo = self.__grid[celda]
+            grupo.discard(control)
+            if not grupo:
+                del self.__grid[celda]
+
+    def _reindex(self, control):
+        '''Actualiza la ubicación del control en el índice espacial. Lo llama el control cuando cambia su posición o
+        su visibilidad (protocolo de contenedor)'''
+
+        self.__unindex(control)
+
+        if control.visible:
+            celdas = self.__cells_of(control.get_rect())
+            for celda in celdas:
+                self.__grid.setdefault(celda, set()).add(control)
+            self.__cells[control.name] = celdas
+
+    def controls_in(self, rect):
+        '''Devuelve los controles visibles que se superponen con el rectángulo pasado, en orden Z'''
+
+        rect = pygame.Rect(rect)
+        encontrados = set()
+        for celda in self.__cells_of(rect):
+            encontrados.update(self.__grid.get(celda, ()))
+
+        encontrados = [c for c in encontrados if rect.colliderect(c.get_rect())]
+        encontrados.sort(key=lambda c: self.__z[c.name])
+        return encontrados
+
+    def control_at(self, point):
+        '''Devuelve el control visible que está en el punto pasado. Si hay varios superpuestos devuelve el de más arriba
+        en el orden Z. Si no hay ninguno devuelve None'''
+
+        g = Screen.grid_size
+        candidatos = self.__grid.get((point[0] // g, point[1] // g))
+        if not candidatos:
+            return None
+
+        arriba = None
+        for c in candidatos:
+            if c.get_rect().collidepoint(point):
+                if arriba == None or self.__z[c.name] > self.__z[arriba.name]:
+                    arriba = c
+
+        return arriba
+
+    def dispatch_click(self, event):
+        '''Entrega el evento MOUSEBUTTONDOWN pasado solo al control que está bajo el puntero y lo devuelve. Si no hay
+        ningún control en esa posición quita el foco y devuelve None'''
+
+        self.__input.update(event)
+
+        control = self.control_at(event.pos)
+        if control != None:
+            control.click(event)
+        else:
+            self.clean_focus()  # Un click en un lugar vacío quita el foco, como antes hacía cada control
+
+        return control
+
+
+
+    # FUNCIONES PARA EL MANEJO DE EVENTOS
+
+
+    def handle_event(self, event):
+        '''Entrega el evento pasado al control que corresponde y lo devuelve. Los clicks van al control que está bajo el
+        puntero, las teclas al control con el foco y TAB (o SHIFT+TAB) mueve el foco. Si ningún control usó el
+        evento devuelve None'''
+
+        if event.type == pygame.MOUSEMOTION:
+            self.__input.update(event)
+
+            if self.__capture != None:
+                self.__capture.mouse_move(event)
+                return self.__capture
+
+        elif event.type == pygame.MOUSEBUTTONUP:
+            self.__input.update(event)
+
+            if self.__capture != None:
+                control = self.__capture
+                self.__capture = None
+                control.mouse_up(event)
+                return control
+
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            return self.dispatch_click(event)
+
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_TAB:
+                if event.mod & pygame.KMOD_SHIFT:
+                    self.focus_prev()
+                else:
+                    self.focus_next()
+                return self.__focus
+
+            if self.__focus != None and self.__focus.keydown(event):
+                return self.__focus
+
+        return None
+
+    def capture_mouse(self, control):
+        '''Hace que el control pasado reciba el movimiento del mouse (mouse_move) y la liberación del botón (mouse_up)
+        aunque el puntero salga de él, por ejemplo mientras se arrastra. La captura termina al soltar el botón'''
+        self.__capture = control
+
+    def release_mouse(self):
+        '''Termina la captura del mouse sin avisar al control'''
+        self.__capture = None
+
+    @property
+    def captured(self):
+        '''Control que tiene capturado el mouse, o None. Solo lectura'''
+        return self.__capture
+
+    def process_events(self, events=None):
+        '''Toma el estado del mouse una sola vez para el frame y reparte los eventos pasados (o los de la cola de pygame
+        si no se pasa ninguno) con handle_event(). Devuelve la lista de eventos que ningún control usó, por ejemplo
+        QUIT, para que los procese la aplicación'''
+
+        self.__input.snapshot()
+
+        if events == None:
+            events = pygame.event.get()
+
+        return [e for e in events if self.handle_event(e) == None]
+
+
+
     # FUNCIONES PARA EL MANEJO DEL FOCO
 
     
+    def __move_focus(self, control):
+        '''Mueve el foco al control pasado, marcando como sucios el control que lo pierde y el que lo gana. Es de uso
+        privado'''
+        if control is not self.__focus:
+            if self.__focus != None:
+                self.__focus.mark_dirty()
+                self.__focus.stop_animations()
+            if control != None:
+                control.mark_dirty()
+            self.__focus = control
+
     def set_focus(self, control):
         '''Pongo el foco en el control pasado'''
         if control != None:
             if control.focusable and control.enable:
-                self.__focus = control
+                self.__move_focus(control)
 
     def get_focus(self):
         '''Devuelvo el control que tiene el foco'''
@@ -235,73 +479,101 @@ class Screen(object):
 
     def clean_focus(self):
         '''Quito el foco de los controles'''
-        self.__focus = None
+        self.__move_focus(None)
+
+    def __focus_key(self, control):
+        '''Devuelve la clave del control en la lista de foco, o None si no puede recibir el foco. Es de uso privado'''
+
+        if control.focusable and control.enable:
+            clave = (control.focusOrder, self.__z[control.name], control.name)
+            self.__focus_keys[control.name] = clave
+            return clave
+
+        return None
+
+    def __focus_discard(self, control):
+        '''Quita el control de la lista de foco, si estaba. Es de uso privado'''
+
+        clave = self.__focus_keys.pop(control.name, None)
+        if clave != None:
+            i = bisect.bisect_left(self.__focus_list, clave)
+            del self.__focus_list[i]
+
+    def _refocus(self, control):
+        '''Actualiza la posición del control en la lista de foco. Lo llama el control cuando cambian focusable o
+        enable (protocolo de contenedor)'''
+
+        self.__focus_discard(control)
+
+        clave = self.__focus_key(control)
+        if clave != None:
+            bisect.insort(self.__focus_list, clave)
+
+    def __release_order(self, orden):
+        '''Descuenta un uso del focusOrder pasado. Es de uso privado'''
+
+        self.__orders[orden] -= 1
+        if not self.__orders[orden]:
+            del self.__orders[orden]
+            if 1 <= orden < self.__free:
+                self.__free = orden
+
+    def _reorder(self, control, viejo):
+        '''Actualiza los órdenes usados cuando cambia el focusOrder de un control, que antes era viejo. Lo llama el
+        control (protocolo de contenedor)'''
+
+        self.__release_order(viejo)
+        self.__orders[control.focusOrder] = self.__orders.get(control.focusOrder, 0) + 1
+        self._refocus(control)
+
+    def __free_order(self):
+        '''Devuelve el menor focusOrder mayor o igual que 1 que no usa ningún control. Es de uso privado'''
+
+        while self.__free in self.__orders:
+            self.__free += 1
+
+        return self.__free
 
     def focus_next(self):
         '''Pasa el foco al siguiente control de la lista, o al siguiente elemento del control si lo tuviera.'''
 
-        def cmp(x, y): 
-            if x.focusOrder < y.focusOrder:
-                return -1
-            elif x.focusOrder > y.focusOrder:
-                return 1
-            else:
-                return 0
+        lo = self.__focus_list  # Lista ordenada
+        if not lo:
+            return
 
-        lo = [ c for c in self.get_controls() if c.focusable and c.enable]
-        lo.sort(cmp= cmp)  # Lista ordenada
-        
         if self.__focus != None:
             if self.__focus.change_focus(D_NEXT):
-                fin = True # Variable auxiliar que me sirve para saber si llegue al final de la lista
+                clave = (self.__focus.focusOrder, self.__z[self.__focus.name], self.__focus.name)
+                i = bisect.bisect_right(lo, clave)  # Primer control con un orden mayor que el actual
 
-                for c in lo:
-                    if c.focusOrder > self.__focus.focusOrder:  # Si durante el bucle el focusOrder es mayor que el actual...
-                        self.__focus = c                        # ... asigno el encontrado como actual ...
-                        fin = False                             # ... cambio la bandera a False para indicar que no llegué hasta el final...
-                        break                                   # ... y salgo del bucle
+                if i == len(lo):  # Si el actual era el de orden mas alto vuelvo al primero
+                    i = 0
 
-
-                if fin:                        # Si en el bucle había llegado hasta el final, es xq el focusOrder actual era el mas alto ...
-                    self.__focus = lo[0]       # ... y por lo tanto salió del bucle normalmente. En este caso asigno el primer control.
+                self.__move_focus(self.__controls[lo[i][2]])
 
         else:
-            self.__focus = lo[0]  # Si no había ningún control en foco, coloco el primero de la lista de orden
-
-
-
+            self.__move_focus(self.__controls[lo[0][2]])  # Si no había ningún control en foco, coloco el primero de la lista de orden
 
 
     def focus_prev(self):
         '''Pasa el foco al control anterior de la lista, o al elemento anterior del control si lo tuviera.'''
 
-        def cmp(x, y): 
-            if x.focusOrder > y.focusOrder:
-                return -1
-            elif x.focusOrder < y.focusOrder:
-                return 1
-            else:
-                return 0
+        lo = self.__focus_list  # Lista ordenada
+        if not lo:
+            return
 
-        lo = [ c for c in self.get_controls() if c.focusable and c.enable]
-        lo.sort(cmp=cmp) # Lista ordenada en reversa
-        
         if self.__focus != None:
             if self.__focus.change_focus(D_PREV):
-                fin = True # Variable auxiliar que me sirve para saber si llegue al final de la lista
-            
-                for c in lo:
-                    if c.focusOrder < self.__focus.focusOrder:  # Si durante el bucle el focusOrder es menor que el actual...
-                        self.__focus = c                        # ... asigno el encontrado como actual ...
-                        fin = False                             # ... cambio la bandera a False para indicar que no llegué hasta el final...
-                        break                                   # ... y salgo del bucle
+                clave = (self.__focus.focusOrder, self.__z[self.__focus.name], self.__focus.name)
+                i = bisect.bisect_left(lo, clave) - 1  # Último control con un orden menor que el actual
 
+                if i < 0:  # Si el actual era el de orden mas bajo voy al último
+                    i = len(lo) - 1
+
+                self.__move_focus(self.__controls[lo[i][2]])
 
-                if fin:                        # Si en el bucle había llegado hasta el final, es xq el focusOrder actual era el mas bajo ...
-                    self.__focus = lo[0]       # ... y por lo tanto salió del bucle normalmente. En este caso asigno el primer control ...
-                                              # ... ya que al estar ordenada en reversa el primer elemento de la lista es el mayor
         else:
-            self.__focus = lo[0]  # Si no había ningún control en foco, coloco el primero de la lista de orden
+            self.__move_focus(self.__controls[lo[-1][2]])  # Si no había ningún control en foco, coloco el último de la lista de orden
 
 
     @property
@@ -318,16 +590,144 @@ class Screen(object):
 
     # FUNCIONES DE DIBUJADO
 
+    def invalidate(self):
+        '''Fuerza el redibujado completo de la pantalla en el proximo render'''
+        self.__redraw_all = True
+
+    def __draw_background(self, display, rect):
+        '''Dibuja el fondo de la pantalla en la region rect del display. Es de uso privado'''
+
+        if self.__background_type == T_IMAGE and self.__background_image != None:
+            display.fill(Color.Black, rect)
+            display.blit(self.__background_image, rect.topleft, rect)
+        else:
+            display.fill(self.__background_color, rect)
+
+    def __dirty_regions(self):
+        '''Devuelve la lista de rectangulos que deben redibujarse, uniendo los que se superponen. Es de uso privado'''
+
+        rects = self.__pending_rects
+        self.__pending_rects = []
+
+        for ctl in self.__order:
+            if ctl.is_dirty():
+                if ctl.last_rect != None:
+                    rects.append(ctl.last_rect)   # Donde estaba dibujado
+                if ctl.visible:
+                    rects.append(ctl.get_rect())  # Donde se va a dibujar
+                else:
+                    ctl.clean_dirty()             # Los controles ocultos no se dibujan, solo se limpia su region
+
+        # Uno los rectangulos que se superponen para no dibujar dos veces la misma zona
+        unidos = []
+        for r in rects:
+            r = pygame.Rect(r)
+            i = r.collidelist(unidos)
+            while i != -1:
+                r.union_ip(unidos.pop(i))
+                i = r.collidelist(unidos)
+            unidos.append(r)
+
+        return unidos
+
     def render(self, display):
-        '''Dibuja todos los controles de la pantalla en el display pasado'''
+        '''Dibuja todos los controles de la pantalla en el display pasado. Devuelve la lista de rectangulos del display
+        que fueron modificados. Si dirty_mode es True solo se redibujan las regiones de los controles que cambiaron.'''
+
+        # Entrego las imágenes que terminaron de cargarse en segundo plano y avanzo las animaciones al frame actual
+        ImageCache.poll()
+        Animator.tick()
+
+        # Si la aplicación no llamó a process_events() en este frame, tomo aquí el estado del mouse
+        if not self.__input.fresh:
+            self.__input.snapshot()
+        self.__input.fresh = False
+
+        if not self.__dirty_mode:
+            self.__render_controls(display, self.__order)
+
+            return [display.get_rect()]
+
+        if self.__redraw_all:
+            self.__redraw_all = False
+            self.__pending_rects = []
+
+            self.__draw_background(display, display.get_rect())
+            self.__render_controls(display, self.__order)
+
+            return [display.get_rect()]
+
+        rects = self.__dirty_regions()
+
+        # Cada region se limpia con el fondo y se redibujan, recortados, todos los controles que la tocan
+        clip = display.get_clip()
+        for r in rects:
+            display.set_clip(r)
+            self.__draw_background(display, r)
 
-        for ctl in self.get_controls():
-            ctl.render(display)
+            self.__render_controls(display, self.controls_in(r))
+
+        display.set_clip(clip)
+
+        return rects
+
+    @staticmethod
+    def __batchable(cls):
+        '''Devuelve True si los controles de la clase pasada se dibujan con el render() de Control, sin cambios. Es de
+        uso privado'''
+
+        for k in cls.__mro__:
+            if 'render' in k.__dict__:
+                # Un render envuelto (por ejemplo por el perfilador) se llama como cualquier otro
+                return k is Control and not hasattr(k.__dict__['render'], '__wrapped__')
+        return False
+
+    @staticmethod
+    def __blits(display, lote):
+        '''Dibuja todas las superficies del lote con una sola llamada. Es de uso privado'''
+
+        if hasattr(display, 'blits'):
+            display.blits(lote, False)
+        else:  # pygame anterior a 1.9.4
+            for sup, pos in lote:
+                display.blit(sup, pos)
+
+    def __render_controls(self, display, controles):
+        '''Dibuja los controles pasados, en orden. Los que usan el render() de Control se juntan en una sola llamada a
+        display.blits(). Si uno de ellos dibuja algo encima (foco, cursor, ver has_overlay) el lote se dibuja hasta él
+        y enseguida lo de encima, para que los controles siguientes lo tapen como corresponde. Los que redefinen
+        render() se dibujan con el suyo, respetando el orden. Es de uso privado'''
+
+        lote = []
+        clases = {}
+
+        for ctl in controles:
+            cls = type(ctl)
+            junto = clases.get(cls)
+            if junto == None:
+                junto = clases[cls] = Screen.__batchable(cls)
+
+            if junto:
+                item = ctl.get_blit()
+                if item != None:
+                    lote.append(item)
+                    if ctl.has_overlay():
+                        Screen.__blits(display, lote)
+                        lote = []
+                        ctl.render_overlay(display)
+            else:
+                if lote:
+                    Screen.__blits(display, lote)
+                    lote = []
+                ctl.render(display)
+
+        if lote:
+            Screen.__blits(display, lote)
 
     def update(self):
         '''Realiza update de todos los controles de la pantalla'''
 
-        for ctl in self.get_controls():
+        for ctl in self.__order:
             ctl.update()
 
 
@@ -370,6 +770,7 @@ class Control(pygame.Surface):
         self.__name = name
         self.__pos = (rect[0], rect[1])
         self.__size = (rect[2], rect[3])
+        self.__rect = pygame.Rect(self.__pos, self.__size)
         self.__border = Border()
         self.__visible = True
         self.__enable = True
@@ -382,6 +783,18 @@ class Control(pygame.Surface):
         self.__tag = None
         self.__focusOrder = 0
 
+        # Estado del ultimo dibujado, para el dibujado por regiones sucias de la pantalla
+        self.__dirty = True
+        self.__last_state = None
+        self.__last_rect = None
+
+        # Superficies ya compuestas (fondo + medio + frente) de cada estado, para dibujar con un solo blit. Se dibujan
+        # recién cuando se muestran y los estados que se ven iguales comparten la misma superficie
+        self.__composite = {}   # estado -> superficie
+        self.__shared = {}      # clave del estado (ver state_key) -> superficie
+        self.__composite_sig = None
+        self.__composite_epoch = None  # style_epoch() con el que se comparó la firma por última vez
+
         
 
     # PROPIEDADES
@@ -399,6 +812,11 @@ class Control(pygame.Surface):
     @pos.setter
     def pos(self, val):
         self.__pos = val
+        self.__rect = pygame.Rect(self.__pos, self.__size)
+        self.mark_dirty()
+
+        if self.__screen != None:
+            self.__screen._reindex(self)
 
     @property
     def left(self):
@@ -430,7 +848,7 @@ class Control(pygame.Surface):
         '''Devuelve un objeto pygame.Rect() con el rectángulo del control'''
 
         # Este método sobreescribe la funcion del mismo nombre de la clase pygame.Surface()
-        return pygame.Rect(self.pos, self.size)
+        return self.__rect.copy()
 
     @property
     def border(self):
@@ -440,6 +858,7 @@ class Control(pygame.Surface):
     @border.setter
     def border(self, val):
         self.__border = val
+        self.mark_dirty()
 
     @property
     def visible(self):
@@ -449,6 +868,10 @@ class Control(pygame.Surface):
     @visible.setter
     def visible(self, val):
         self.__visible = val
+        self.mark_dirty()
+
+        if self.__screen != None:
+            self.__screen._reindex(self)
     
     
     @property
@@ -459,6 +882,10 @@ class Control(pygame.Surface):
     @enable.setter
     def enable(self, val):
         self.__enable = val
+        self.mark_dirty()
+
+        if self.__screen != None:
+            self.__screen._refocus(self)
     
 
     @property
@@ -469,6 +896,9 @@ class Control(pygame.Surface):
     @focusable.setter
     def focusable(self, val):
         self.__focusable = val
+
+        if self.__screen != None:
+            self.__screen._refocus(self)
     
     
     @property
@@ -485,6 +915,7 @@ class Control(pygame.Surface):
     @background.setter
     def background(self, val):
         self.__background = val
+        self.mark_dirty()
     
     @property
     def midground(self):
@@ -495,6 +926,7 @@ class Control(pygame.Surface):
     @midground.setter
     def midground(self, val):
         self.__midground = val
+        self.mark_dirty()
     
 
     @property
@@ -505,6 +937,7 @@ class Control(pygame.Surface):
     @foreground.setter
     def foreground(self, val):
         self.__foreground = val
+        self.mark_dirty()
     
     @property
     def font(self):
@@ -514,6 +947,7 @@ class Control(pygame.Surface):
     @font.setter
     def font(self, val):
         self.__font = val
+        self.mark_dirty()
 
     # @property
     # def font_color(self):
@@ -527,6 +961,11 @@ class Control(pygame.Surface):
     
     
     
+    @property
+    def last_rect(self):
+        '''Rectángulo del display donde se dibujó el control por última vez, o None si no está dibujado. Solo lectura'''
+        return self.__last_rect
+
     @property
     def tag(self):
         '''Propiedad utilizada para guardar cualquier tipo de dato'''
@@ -546,12 +985,28 @@ class Control(pygame.Surface):
     def focusOrder(self, val):
         if val < 0: 
             val = 0
+
+        viejo = self.__focusOrder
         self.__focusOrder = val
+
+        if self.__screen != None:
+            self.__screen._reorder(self, viejo)
     
                                         
    
     # VERIFICACIONES
 
+    def get_input(self):
+        '''Devuelve el estado del mouse del frame actual (InputState) de la pantalla del control. Si el control no
+        pertenece a ninguna pantalla lo lee directamente de pygame'''
+
+        if self.__screen != None:
+            return self.__screen.input
+
+        estado = InputState()
+        estado.snapshot()
+        return estado
+
     def is_hover(self):
         '''Devuelve un entero indicando si el mouse está sobre el control. Si el resultado es 0 el mouse se encuentra
         fuera del control, si es distinto de 0 está sobre el control.'''
@@ -560,7 +1015,7 @@ class Control(pygame.Surface):
         # indicando sobre que zona se encuentra. 
 
         if self.visible:  
-            return int(self.get_rect().collidepoint(pygame.mouse.get_pos()))
+            return int(self.__rect.collidepoint(self.get_input().pos))
 
     def is_down(self):
         '''Devuelve un entero indicando si algún botón del mouse está presionado sobre el control. Si el resultado es 0
@@ -577,14 +1032,109 @@ class Control(pygame.Surface):
             Middle + Left + Right = 7
             '''
         if self.is_hover() and self.enable:
-
-            btns = pygame.mouse.get_pressed()
-
-            return (int(btns[0]) + int(btns[1])*2 + int(btns[2])*4)
+            return self.get_input().pressed
         else:   
             return 0
             
 
+    def get_state(self):
+        '''Devuelve el estado visual actual del control: ST_NORMAL, ST_HOVER, ST_DOWN o ST_DISABLE'''
+
+        if not self.enable:
+            return ST_DISABLE
+        if self.is_hover():
+            if self.is_down():
+                return ST_DOWN
+            return ST_HOVER
+        return ST_NORMAL
+
+    def __signature(self):
+        '''Tupla que identifica las capas, el borde y la fuente del control junto con sus versiones. Si cambia, las
+        superficies compuestas dejan de ser validas. Es de uso privado'''
+
+        return (id(self.__background), self.__background.version,
+                id(self.__midground), self.__midground.version,
+                id(self.__foreground), self.__foreground.version,
+                id(self.__border), self.__border.version,
+                id(self.__font), self.__font.version)
+
+    def invalidate(self):
+        '''Descarta las superficies ya dibujadas de cada estado, que se volverán a dibujar la próxima vez que se
+        muestren'''
+        self.__composite = {}
+        self.__shared = {}
+        self.mark_dirty()
+
+    def get_surface(self, estado):
+        '''Devuelve la superficie del estado indicado, con todas las capas dibujadas. Se dibuja recién la primera vez
+        que se muestra ese estado y se guarda hasta que cambie alguna capa, el borde o la fuente. Los estados con la
+        misma clave (ver state_key) comparten la misma superficie'''
+
+        epoca = style_epoch()
+        sig = self.__signature()
+        if sig != self.__composite_sig:
+            self.__composite = {}
+            self.__shared = {}
+            self.__composite_sig = sig
+        self.__composite_epoch = epoca
+
+        sup = self.__composite.get(estado)
+        if sup == None:
+            clave = self.state_key(estado)
+            sup = self.__shared.get(clave)
+
+            if sup == None:
+                sup = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
+                sup.fill(Color.Transparent)
+                self.draw_state(estado, sup)
+                self.__shared[clave] = sup
+
+            self.__composite[estado] = sup
+
+        return sup
+
+    def mark_dirty(self):
+        '''Indica que el control debe redibujarse en el próximo render de la pantalla'''
+        self.__dirty = True
+
+    def clean_dirty(self):
+        '''Indica que el control ya fue dibujado con su estado actual'''
+        self.__dirty = False
+        if self.visible:
+            self.__last_rect = self.get_rect()
+        else:
+            self.__last_rect = None
+            self.__last_state = None
+
+    def has_changed(self):
+        '''Devuelve True si el control fue marcado como sucio o si cambió alguna de sus capas, su borde o su fuente
+        desde el último dibujado. A diferencia de is_dirty() no revisa el estado visual, que depende del mouse'''
+
+        if self.__dirty:
+            return True
+        if not self.visible:
+            return False
+
+        # Si no cambió ningún estilo desde la última comparación, la firma sigue siendo la misma
+        epoca = style_epoch()
+        if epoca == self.__composite_epoch:
+            return False
+
+        if self.__signature() != self.__composite_sig:
+            return True
+        self.__composite_epoch = epoca
+        return False
+
+    def is_dirty(self):
+        '''Devuelve True si el control cambió desde el último dibujado, ya sea por una propiedad o por su estado visual
+        (normal, hover, down o disable). Extender en los controles que tengan otros motivos para redibujarse'''
+
+        if self.has_changed():
+            return True
+        if self.visible:
+            return self.get_state() != self.__last_state
+        return False
+
     def is_focus(self):
         '''Devuelve True si el foco está situado sobre el control, de lo contrario devuelve False'''
 
@@ -606,88 +1156,87 @@ class Control(pygame.Surface):
 
     def update(self):
         '''Actualiza los gráficos del control. Debe llamarse a este método cuando cambia alguna propiedad relacionada a 
-        los gráficos'''
-        
-        # Inicializo las superficies del control
-        self.background.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-
-        self.midground.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.midground.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.midground.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.midground.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-
-        self.foreground.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.foreground.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.foreground.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.foreground.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-
-        # Limpio los background
-        self.background.normal_image.fill(self.background.normal_color)
-        self.background.hover_image.fill(self.background.hover_color)
-        self.background.down_image.fill(self.background.down_color)
-        self.background.disable_image.fill(self.background.disable_color)
-        # Los midground son transparentes
-        self.midground.normal_image.fill(Color.Transparent)
-        self.midground.hover_image.fill(Color.Transparent)
-        self.midground.down_image.fill(Color.Transparent)
-        self.midground.disable_image.fill(Color.Transparent)
-        # Los foreground tambien son transparentes
-        self.foreground.normal_image.fill(Color.Transparent)
-        self.foreground.hover_image.fill(Color.Transparent)
-        self.foreground.down_image.fill(Color.Transparent)
-        self.foreground.disable_image.fill(Color.Transparent)
+        los gráficos. Las superficies de cada estado se vuelven a dibujar recién cuando se muestran. Ya no llena las
+        imágenes de las capas (background.normal_image, etc.): la superficie de un estado se obtiene con get_surface()'''
 
+        self.invalidate()
 
+    def state_key(self, estado):
+        '''Devuelve una tupla con todo lo que cambia el aspecto del control entre un estado y otro. Dos estados con la
+        misma clave se ven iguales y comparten la superficie. Extender en las clases derivadas que dibujen algo
+        distinto según el estado'''
 
-        # Dibuja el borde del control
+        clave = [tuple(self.background.get_color(estado))]
+        for capa in (self.background, self.midground, self.foreground):
+            if capa.type == T_IMAGE:
+                clave.append(id(capa.get_image(estado)))
+
+        return tuple(clave)
+
+    def draw_state(self, estado, superficie):
+        '''Dibuja el control en el estado indicado sobre la superficie pasada, que tiene el tamaño del control. Las
+        clases derivadas deben extender este método para dibujar su contenido sobre lo que dibuja la clase base'''
+
+        # Fondo
+        superficie.fill(self.background.get_color(estado))
+
+        # Las capas de tipo T_IMAGE dibujan su imagen. En el tipo T_DRAW el medio y el frente son transparentes
+        for capa in (self.background, self.midground, self.foreground):
+            if capa.type == T_IMAGE and capa.get_image(estado) != None:
+                superficie.blit(capa.get_image(estado), (0, 0))
 
+        # Dibuja el borde del control
         if self.border.show:
-              # Normal
-            pygame.draw.rect(self.midground.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.midground.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.midground.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.midground.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
 
 
 
 
-    def render(self, display):
-        '''Dibuja el control en el display pasado'''
-        
-        if self.visible:
-            if not self.enable:
-                display.blit(self.background.disable_image, self.pos)
-                display.blit(self.midground.disable_image, self.pos)
-                display.blit(self.foreground.disable_image, self.pos)
-            else:
-                if self.is_hover():
-                    if self.is_down():
-                        display.blit(self.background.down_image, self.pos)
-                        display.blit(self.midground.down_image, self.pos)
-                        display.blit(self.foreground.down_image, self.pos)
-                    else:
-                        display.blit(self.background.hover_image, self.pos)
-                        display.blit(self.midground.hover_image, self.pos)
-                        display.blit(self.foreground.hover_image, self.pos)
-                else:
-                    display.blit(self.background.normal_image, self.pos)
-                    display.blit(self.midground.normal_image, self.pos)
-                    display.blit(self.foreground.normal_image, self.pos)
+    def get_blit(self):
+        '''Devuelve la tupla (superficie, posición) con la que se dibuja el control en su estado actual, o None si no
+        está visible. El control queda registrado como dibujado, igual que con render()'''
 
-            # Dibujo el rectángulo que indica que tiene el foco
-            if self.is_focus(): 
-                pygame.draw.rect(display, self.screen.focus_border.color, (self.left, self.top ,self.get_width(),self.get_height()), self.screen.focus_border.size)
+        if self.visible:
+            estado = self.get_state()
+            sup = self.get_surface(estado)
 
-            return True
+            self.__last_state = estado
+            self.clean_dirty()
+            return sup, self.pos
         else:
+            self.clean_dirty()
+            return None
+
+    def stop_animations(self):
+        '''Detiene lo que el control anima por su cuenta mientras se dibuja, como el parpadeo del cursor. Lo llama la
+        pantalla cuando el control pierde el foco, cuando se quita y cuando la pantalla deja de ser la actual.
+        Extender en los controles que animen algo'''
+        pass
+
+    def has_overlay(self):
+        '''Devuelve True si render_overlay() va a dibujar algo encima del control. En la clase base solo el rectángulo
+        del foco. Redefinir en las clases que dibujen algo más en render_overlay()'''
+        return self.is_focus()
+
+    def render_overlay(self, display):
+        '''Dibuja en el display lo que va encima de la superficie del control, como el rectángulo del foco. Se llama
+        después de dibujar el control'''
+
+        # Dibujo el rectángulo que indica que tiene el foco
+        if self.is_focus(): 
+            pygame.draw.rect(display, self.screen.focus_border.color, (self.left, self.top ,self.get_width(),self.get_height()), self.screen.focus_border.size)
+
+    def render(self, display):
+        '''Dibuja el control en el display pasado'''
+        
+        item = self.get_blit()
+        if item == None:
             return False
 
+        display.blit(item[0], item[1])
+        self.render_overlay(display)
+        return True
+
 
 
 
@@ -716,6 +1265,14 @@ class Control(pygame.Surface):
         '''Método a llamar cuando se presiona una tecla'''
         pass
 
+    def mouse_move(self, event):
+        '''Método a llamar cuando se mueve el mouse mientras el control lo tiene capturado (ver Screen.capture_mouse)'''
+        pass
+
+    def mouse_up(self, event):
+        '''Método a llamar cuando se suelta el botón del mouse que el control tenía capturado'''
+        pass
+
 
     # METODOS Y FUNCIONES PARA MANEJO DE LA PANTALLA DEL CONTROL
 
@@ -728,6 +1285,12 @@ class Control(pygame.Surface):
         '''Obtiene la pantalla del control. Es el mismo resultado que la propiedad screen'''
         return self.screen
 
+    def _set_container(self, pantalla):
+        '''Guarda la pantalla (o el panel) a la que pertenece el control, o None si deja de pertenecer a una. Lo llama
+        el contenedor al agregar o quitar el control (protocolo de contenedor, ver Screen); para asignar la pantalla
+        desde la aplicación se usa set_screen()'''
+        self.__screen = pantalla
+
     def set_screen(self, pantalla):
         '''Asigna el control a la pantalla pasada'''
 
@@ -768,6 +1331,7 @@ class Button(Control):
     @caption.setter
     def caption(self, val):
         self.__caption = val
+        self.mark_dirty()
 
     @property
     def action(self):
@@ -783,6 +1347,7 @@ class Button(Control):
     @align.setter
     def align(self, val):
         self.__align = val
+        self.mark_dirty()
     
     
 
@@ -802,24 +1367,26 @@ class Button(Control):
         return hover
         
 
-    def update(self):
-        '''Actualiza los gráficos del control'''
-        super(Button, self).update()
+    def __text_color(self, estado):
+        '''Color del texto en el estado indicado. En normal se usa el color de la fuente, en el resto los colores del
+        foreground. Es de uso privado'''
+        if estado == ST_NORMAL:
+            return self.font.color
+        return self.foreground.get_color(estado)
 
+    def state_key(self, estado):
+        '''Agrega a la clave el color del texto'''
+        return super(Button, self).state_key(estado) + (tuple(self.__text_color(estado)),)
 
-        # Colores del texto para hover, down y disable
-        fontHover = Font(self.font.get_fontsize(), self.foreground.hover_color)
-        fontDown = Font(self.font.get_fontsize(), self.foreground.down_color)
-        fontDisable = Font(self.font.get_fontsize(), self.foreground.disable_color)
+    def draw_state(self, estado, superficie):
+        '''Dibuja el texto del botón sobre la superficie del estado indicado'''
+        super(Button, self).draw_state(estado, superficie)
 
-        # Texto renderizado
-        imgtexto = self.font.render(self.caption, True)
-        imgtexto_hover = fontHover.render(self.caption, True)
-        imgtexto_down = fontDown.render(self.caption, True)
-        imgtexto_disable = fontDisable.render(self.caption, True)
+        # Texto renderizado. Para hover, down y disable se usan los colores del foreground
+        imgtexto = self.font.render(self.caption, True, self.__text_color(estado))
         
         # Obtiene las dimensiones del texto
-        imgtextoWidth, imgtextoHeight = self.font.size(self.caption) 
+        imgtextoWidth, imgtextoHeight = imgtexto.get_size()
 
         # Calculo la posicion
             # Valor del usuario
@@ -847,23 +1414,12 @@ class Button(Control):
             posY = self.get_height() - imgtextoHeight
 
 
-        # Dibuja el texto sobre las superficies del midground
-        self.foreground.normal_image.blit(imgtexto, (posX, posY))
-        self.foreground.hover_image.blit(imgtexto_hover, (posX, posY))
-        self.foreground.down_image.blit(imgtexto_down, (posX, posY))
-        self.foreground.disable_image.blit(imgtexto_disable, (posX, posY))
+        # Dibuja el texto
+        superficie.blit(imgtexto, (posX, posY))
 
         # Dibuja el borde del control, para que no quede por detras de los textos
-
         if self.border.show:
-              # Normal
-            pygame.draw.rect(self.foreground.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.foreground.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.foreground.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.foreground.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
 
 
 class Label(Control):
@@ -902,6 +1458,7 @@ class Label(Control):
     def text(self, texto):
         
         self.__text = texto
+        self.mark_dirty()
 
     @property
     def pos_text(self):
@@ -912,6 +1469,7 @@ class Label(Control):
     @pos_text.setter
     def pos_text(self, val):
         self.__pos_text = val
+        self.mark_dirty()
 
 
     @property
@@ -923,26 +1481,30 @@ class Label(Control):
     @align.setter
     def align(self, val):
         self.__align = val
+        self.mark_dirty()
 
 
-    def update(self):
-        '''Actualiza los gráficos del control'''
+    def __text_color(self, estado):
+        '''Color del texto en el estado indicado. En normal se usa el color de la fuente, en el resto los colores del
+        foreground. Es de uso privado'''
+        if estado == ST_NORMAL:
+            return self.font.color
+        return self.foreground.get_color(estado)
 
-        super(Label, self).update()
+    def state_key(self, estado):
+        '''Agrega a la clave el color del texto. Con los colores por defecto hover y down comparten la superficie; normal
+        no, porque su texto usa el color de la fuente'''
+        return super(Label, self).state_key(estado) + (tuple(self.__text_color(estado)),)
 
-        # Colores del texto para hover, down y disable
-        fontHover = Font(self.font.get_fontsize(), self.foreground.hover_color)
-        fontDown = Font(self.font.get_fontsize(), self.foreground.down_color)
-        fontDisable = Font(self.font.get_fontsize(), self.foreground.disable_color)
+    def draw_state(self, estado, superficie):
+        '''Dibuja el texto de la etiqueta sobre la superficie del estado indicado'''
+        super(Label, self).draw_state(estado, superficie)
 
-        # Texto renderizado
-        imgtexto = self.font.render(self.text, True)
-        imgtexto_hover = fontHover.render(self.text, True)
-        imgtexto_down = fontDown.render(self.text, True)
-        imgtexto_disable = fontDisable.render(self.text, True)
+        # Texto renderizado. Para hover, down y disable se usan los colores del foreground
+        imgtexto = self.font.render(self.text, True, self.__text_color(estado))
         
         # Obtiene las dimensiones del texto
-        imgtextoWidth, imgtextoHeight = self.font.size(self.text) 
+        imgtextoWidth, imgtextoHeight = imgtexto.get_size()
 
         # Calculo la posicion
             # Valor del usuario
@@ -970,31 +1532,27 @@ class Label(Control):
             posY = self.get_height() - imgtextoHeight
 
 
-        # Dibuja el texto sobre las superficies del foreground
-        self.foreground.normal_image.blit(imgtexto, (posX, posY))
-        self.foreground.hover_image.blit(imgtexto_hover, (posX, posY))
-        self.foreground.down_image.blit(imgtexto_down, (posX, posY))
-        self.foreground.disable_image.blit(imgtexto_disable, (posX, posY))
+        # Dibuja el texto
+        superficie.blit(imgtexto, (posX, posY))
 
         # Dibuja el borde del control, para que no quede por detras de los textos
-
         if self.border.show:
-              # Normal
-            pygame.draw.rect(self.foreground.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.foreground.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.foreground.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.foreground.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
 
 
 class Image(Control):
     '''Contenedor para mostrar una imagen'''
 
+    variants_size = 8  # Cantidad de versiones ajustadas que se guardan de una imagen que no se cargó de archivo
+
     def __init__(self, rect, name, imagen=None):
         super(Image, self).__init__(rect, name)
-        self.__image = imagen
+        self.__image = imagen      # Imagen que se muestra: la original o una versión ajustada
+        self.__original = imagen   # Imagen sin ajustar, de la que salen todas las versiones ajustadas
+        self.__variants = OrderedDict()  # (tamaño, modo, smooth) -> versión ajustada, si no se cargó de archivo
+        self.__path = None  # Archivo del que se cargó la imagen, para obtener de la cache sus versiones ajustadas
+        self.__pending = None  # (archivo, tamaño, modo, smooth) que se está cargando en segundo plano
+        self.__placeholder = None
         self.__align = A_CENTER
         self.__pos_image = (0, 0)
 
@@ -1012,13 +1570,47 @@ class Image(Control):
 
     @property
     def image(self):
-        '''Imagen que mostrará el control'''
+        '''Imagen que mostrará el control. Después de fit_image() es la versión ajustada'''
         return self.__image
     
     
     @image.setter
     def image(self, val):
         self.__image = val
+        self.__original = val
+        self.__variants = OrderedDict()
+        self.__path = None
+        self.__pending = None  # Una carga en segundo plano ya no reemplaza esta imagen
+        self.invalidate()  # La imagen se vuelve a dibujar en el próximo render
+
+    @property
+    def original(self):
+        '''Imagen sin ajustar. Solo lectura'''
+        if self.__original == None and self.__path != None:
+            self.__original = ImageCache.load(self.__path)  # Solo se cargó en segundo plano la versión ajustada
+        return self.__original
+
+    def __show(self, sup):
+        '''Muestra la superficie pasada sin cambiar la imagen original. Es de uso privado'''
+        self.__image = sup
+        self.__pending = None
+        self.invalidate()
+
+    @property
+    def placeholder(self):
+        '''Imagen que se muestra mientras se carga en segundo plano la imagen pedida con load_image(). Si es None se
+        muestra la imagen anterior, o solo el fondo si no había ninguna'''
+        return self.__placeholder
+
+    @placeholder.setter
+    def placeholder(self, val):
+        self.__placeholder = val
+        self.invalidate()
+
+    @property
+    def loading(self):
+        '''True mientras se carga la imagen en segundo plano. Solo lectura'''
+        return self.__pending != None
     
     @property
     def pos_image(self):
@@ -1029,6 +1621,7 @@ class Image(Control):
     @pos_image.setter
     def pos_image(self, val):
         self.__pos_image = val
+        self.mark_dirty()
 
     @property
     def align(self):
@@ -1039,11 +1632,12 @@ class Image(Control):
     @align.setter
     def align(self, val):
         self.__align = val
+        self.mark_dirty()
     
     
     
     
-    def load_image(self, path):
+    def load_image(self, path, asynchronous=False):
         '''Carga una imagen en el control desde un archivo. Los tipos de archivo soportados son los siguientes:
             *  JPG
             *  PNG
@@ -1070,35 +1664,103 @@ class Image(Control):
            Caso 2:
                 rect_control = (posX, posY, img_width, img_height)  # Las dimensiones de la imagen deben conocerse de antemano
                 control_img = Image(rect_control, nombre_control)
-                control_img.load_image("img.png") '''
+                control_img.load_image("img.png")
+
+           La imagen se obtiene de ImageCache, así que varios controles que cargan el mismo archivo comparten una sola
+           superficie, ya convertida al formato del display. No debe dibujarse sobre ella.
+
+           Con asynchronous=True el archivo se decodifica en segundo plano y mientras tanto se muestra el placeholder.
+           La imagen se asigna en el hilo principal, durante el render de la pantalla, y el control se redibuja solo.'''
+
+        if asynchronous:
+            self.__request(path, None)
+            return self.image
 
-        self.image = pygame.image.load(path)
+        self.image = ImageCache.load(path)
+        self.__path = path
         return self.image
 
 
-    def fit_image(self):
-        '''Ajusta la imagen a las dimensiones del control. Esto no modifica las dimensiones del control. Luego de llamar
-        a esta funcion se debe llamar a update() para que tengan efecto los cambios.'''
+    def __request(self, path, size, mode=F_STRETCH, smooth=True):
+        '''Pide a ImageCache la imagen sin bloquear. Es de uso privado'''
 
-        if self.image != None:
-            # El mismo tamño del control, las mismas caracteristicas que la imagen actual
-            #print self.size
-            #print self.image
-            nueva = pygame.Surface(self.size, 0, self.image)  
-            pygame.transform.smoothscale(self.image, self.size, nueva)
-            self.image = nueva
-            return self.image
+        pedido = (path, size, mode, smooth)
+        sup = ImageCache.load_async(path, lambda sup: self.__loaded(pedido, sup), size, mode, smooth)
 
-    def update(self):
-        '''Actualiza los gráficos del control'''
-        super(Image, self).update()
+        if sup != None:
+            self.__loaded(pedido, sup, True)  # Ya estaba en la cache
+        else:
+            self.__pending = pedido
+            self.invalidate()  # Muestra el placeholder
+
+    def __loaded(self, pedido, sup, inmediato=False):
+        '''Asigna la imagen cargada en segundo plano, si todavía es la que se espera. Es de uso privado'''
+
+        if pedido != self.__pending and not inmediato:
+            return  # Mientras tanto se pidió o se asignó otra imagen
+
+        if sup == None:
+            self.__show(self.__image)  # No se pudo cargar, queda la imagen anterior
+        elif pedido[1] == None:
+            self.image = sup
+            self.__path = pedido[0]
+        else:
+            # Solo llegó la versión ajustada, el original se pide a la cache si hace falta
+            self.__original = None
+            self.__variants = OrderedDict()
+            self.__path = pedido[0]
+            self.__show(sup)
+
+    def fit_image(self, mode=F_STRETCH, smooth=True):
+        '''Ajusta la imagen a las dimensiones del control. Esto no modifica las dimensiones del control. mode indica como
+        se ajusta: F_STRETCH (estirada al tamaño del control), F_FIT (completa y sin deformar) o F_FILL (cubre todo el
+        control sin deformar, recortada). Con smooth=False se escala más rápido pero con menos calidad.
+
+        Siempre se ajusta a partir de la imagen original, que se conserva, y cada versión ajustada se guarda para no
+        volver a escalar si se pide otra vez el mismo ajuste (por ejemplo al cambiar entre dos disposiciones de la
+        pantalla). Si la imagen se está cargando en segundo plano, el ajuste también se hace en segundo plano.'''
+
+        if self.__pending != None:
+            self.__request(self.__pending[0], self.size, mode, smooth)
+            return None
+
+        if self.__path != None:
+            # Cargada desde archivo: la versión ajustada sale de ImageCache
+            self.__show(ImageCache.load(self.__path, self.size, mode, smooth))
+            return self.__image
+
+        if self.__original != None:
+            clave = (tuple(self.size), mode, bool(smooth))
+            sup = self.__variants.pop(clave, None)
+
+            if sup == None:
+                sup = ImageCache.scale(self.__original, self.size, mode, smooth)
+                while len(self.__variants) >= self.variants_size:
+                    self.__variants.popitem(last=False)  # Descarto la usada hace más tiempo
+
+            self.__variants[clave] = sup  # Queda al final como la más reciente
+            self.__show(sup)
+            return sup
+
+    def restore_image(self):
+        '''Vuelve a mostrar la imagen original, sin ajustar'''
+        self.__show(self.original)
+        return self.__image
+
+    def draw_state(self, estado, superficie):
+        '''Dibuja la imagen sobre la superficie del estado indicado'''
+        super(Image, self).draw_state(estado, superficie)
         
-        # Obtiene las dimensiones de la imagen
-        if self.image == None:
-            self.image = pygame.Surface(self.get_size(), pygame.HWSURFACE|pygame.SRCALPHA)
-            self.image.fill(Color.Transparent)
+        # Mientras se carga en segundo plano se muestra el placeholder
+        imagen = self.image
+        if self.__pending != None and self.__placeholder != None:
+            imagen = self.__placeholder
+
+        # Sin imagen solo se dibujan el fondo y el borde
+        if imagen == None:
+            return
 
-        imgWidth, imgHeight = self.image.get_size() 
+        imgWidth, imgHeight = imagen.get_size() 
 
         # Calculo la posicion
             # Valor del usuario
@@ -1126,23 +1788,13 @@ class Image(Control):
             posY = self.get_height() - imgHeight
 
 
-        # Dibuja el texto sobre las superficies del midground
-        self.midground.normal_image.blit(self.image, (posX, posY))
-        self.midground.hover_image.blit(self.image, (posX, posY))
-        self.midground.down_image.blit(self.image, (posX, posY))
-        self.midground.disable_image.blit(self.image, (posX, posY))
-
-        # Dibuja el borde del control, para que no quede por detras de los textos
+        # Dibuja la imagen
+        superficie.blit(imagen, (posX, posY))
 
+        # Dibuja el borde del control, para que no quede por detras de la imagen
         if self.border.show:
-              # Normal
-            pygame.draw.rect(self.midground.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.midground.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.midground.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.midground.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
+
 
 
 ###########################################################################################################################################
@@ -1163,10 +1815,6 @@ class CheckBox(Control):
         # Valor del CheckBox
         self.__value = value
 
-        # Capas intermedias para tener los gráficos checked, unchecked. (ver método render)
-        self.__checked = Layer()
-        self.__unchecked = Layer()
-
         # Puntos que definen la marca de checked
         self.__p1 = (self.get_width()*0.2, self.get_height()*0.5)
         self.__p2 = (self.get_width()*0.4, self.get_height()*0.8)
@@ -1196,6 +1844,7 @@ class CheckBox(Control):
     @value.setter
     def value(self, val):
         self.__value = val
+        self.invalidate()
 
 
     @property
@@ -1207,6 +1856,7 @@ class CheckBox(Control):
     @border_mark_normal.setter
     def border_mark_normal(self, val):
         self.__border_mark_normal = val
+        self.mark_dirty()
 
     @property
     def border_mark_hover(self):
@@ -1217,6 +1867,7 @@ class CheckBox(Control):
     @border_mark_hover.setter
     def border_mark_hover(self, val):
         self.__border_mark_hover = val
+        self.mark_dirty()
     
     @property
     def border_mark_down(self):
@@ -1227,6 +1878,7 @@ class CheckBox(Control):
     @border_mark_down.setter
     def border_mark_down(self, val):
         self.__border_mark_down = val
+        self.mark_dirty()
 
     @property
     def border_mark_disable(self):
@@ -1237,88 +1889,47 @@ class CheckBox(Control):
     @border_mark_disable.setter
     def border_mark_disable(self, val):
         self.__border_mark_disable = val
+        self.mark_dirty()
     
     
     
     
 
 
-    def update(self):
-        '''Actualiza como se mostrara nuestro control segun el modo grafico establecido'''
-
-        # Dibujo los bords con la llamada a la funcion de la clase base
-        super(CheckBox, self).update()
-
-
-        # Superficies para  checked
-        self.__checked.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__checked.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__checked.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__checked.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__checked.normal_image.fill(Color.Transparent)
-        self.__checked.hover_image.fill(Color.Transparent)
-        self.__checked.down_image.fill(Color.Transparent)
-        self.__checked.disable_image.fill(Color.Transparent)
-
-        # Superficies para unchecked. En la version dibujada no tiene importancia, pero cobra valor en la version gráfica
-        self.__unchecked.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__unchecked.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__unchecked.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__unchecked.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__unchecked.normal_image.fill(Color.Transparent)
-        self.__unchecked.hover_image.fill(Color.Transparent)
-        self.__unchecked.down_image.fill(Color.Transparent)
-        self.__unchecked.disable_image.fill(Color.Transparent)
-
-
-        # Dibujo el checked
-        pygame.draw.line(self.__checked.normal_image, self.__border_mark_normal.color, self.__p1, self.__p2, self.__border_mark_normal.size)
-        pygame.draw.line(self.__checked.hover_image, self.__border_mark_hover.color, self.__p1, self.__p2, self.__border_mark_hover.size)
-        pygame.draw.line(self.__checked.down_image, self.__border_mark_down.color, self.__p1, self.__p2, self.__border_mark_down.size)
-        pygame.draw.line(self.__checked.disable_image, self.__border_mark_disable.color, self.__p1, self.__p2, self.__border_mark_disable.size)
-        pygame.draw.line(self.__checked.normal_image, self.__border_mark_normal.color, self.__p2, self.__p3, self.__border_mark_normal.size)
-        pygame.draw.line(self.__checked.hover_image, self.__border_mark_hover.color, self.__p2, self.__p3, self.__border_mark_hover.size)
-        pygame.draw.line(self.__checked.down_image, self.__border_mark_down.color, self.__p2, self.__p3, self.__border_mark_down.size)
-        pygame.draw.line(self.__checked.disable_image, self.__border_mark_disable.color, self.__p2, self.__p3, self.__border_mark_disable.size)
-
-        # Dibujo el unchecked
-        # pygame.draw.line(self.__unchecked.normal_image, self.__border_mark_normal.color, self.__p2, self.__p3, self.__border_mark_normal.size)
-        # pygame.draw.line(self.__unchecked.hover_image, self.__border_mark_hover.color, self.__p2, self.__p3, self.__border_mark_hover.size)
-        # pygame.draw.line(self.__unchecked.down_image, self.__border_mark_down.color, self.__p2, self.__p3, self.__border_mark_down.size)
-        # pygame.draw.line(self.__unchecked.disable_image, self.__border_mark_disable.color, self.__p2, self.__p3, self.__border_mark_disable.size)
-        # pygame.draw.line(self.__unchecked.normal_image, self.__border_mark_normal.color, self.__p3, self.__p1, self.__border_mark_normal.size)
-        # pygame.draw.line(self.__unchecked.hover_image, self.__border_mark_hover.color, self.__p3, self.__p1, self.__border_mark_hover.size)
-        # pygame.draw.line(self.__unchecked.down_image, self.__border_mark_down.color, self.__p3, self.__p1, self.__border_mark_down.size)
-        # pygame.draw.line(self.__unchecked.disable_image, self.__border_mark_disable.color, self.__p3, self.__p1, self.__border_mark_disable.size)
-    
+    def __mark(self, estado):
+        '''Borde con el que se dibuja la marca de checked en el estado indicado. Es de uso privado'''
+        if estado == ST_DISABLE:
+            return self.__border_mark_disable
+        if estado == ST_DOWN:
+            return self.__border_mark_down
+        if estado == ST_HOVER:
+            return self.__border_mark_hover
+        return self.__border_mark_normal
 
-        # Dibuja el borde del control
-        if self.border.show:
-              # Normal
-            pygame.draw.rect(self.__checked.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-            pygame.draw.rect(self.__unchecked.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.__checked.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-            pygame.draw.rect(self.__unchecked.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.__checked.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-            pygame.draw.rect(self.__unchecked.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.__checked.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-            pygame.draw.rect(self.__unchecked.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
+    def state_key(self, estado):
+        '''Agrega a la clave el aspecto de la marca de checked'''
+        clave = super(CheckBox, self).state_key(estado)
 
+        if self.__value:
+            marca = self.__mark(estado)
+            clave += (tuple(marca.color), marca.size)
 
-    def render(self, display):
-        '''Dibuja el control en la superficie pasada'''
+        return clave
 
-        # Verifico el estado, para saber cual dibujar
-        if self.__value :
-            self.midground = self.__checked
-        else:
-            self.midground = self.__unchecked
+    def draw_state(self, estado, superficie):
+        '''Dibuja la marca de checked, si corresponde, sobre la superficie del estado indicado'''
+
+        # Dibujo el fondo y los bordes con la llamada a la funcion de la clase base
+        super(CheckBox, self).draw_state(estado, superficie)
 
+        if self.__value:
+            marca = self.__mark(estado)
+            pygame.draw.line(superficie, marca.color, self.__p1, self.__p2, marca.size)
+            pygame.draw.line(superficie, marca.color, self.__p2, self.__p3, marca.size)
 
-        return super(CheckBox, self).render(display)
+            # Dibuja el borde del control sobre la marca
+            if self.border.show:
+                pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
 
 
 
@@ -1335,8 +1946,6 @@ class CheckBox(Control):
 
 class TextBox(Control): 
     '''Caja de texto'''
-    __tiempo = pygame.time.get_ticks() # Para usar en el parpadeo del cursor
-    __parpadeo = True # Para usar en el parpadeo del cursor
 
     def __init__(self, rect, name, texto=""):
 
@@ -1350,6 +1959,18 @@ class TextBox(Control):
         self.__cursorPos = len(texto)
         self.__pos_text = (5,0)
         self.__align = A_RIGHT
+        self.__blinkDrawn = False  # Estado del parpadeo con el que se dibujó el cursor la última vez
+
+        # Tabla de anchos: __advances[i] es el avance del caracter i y __widths[i] el ancho de text[:i]. Se actualiza
+        # en cada edición a partir del caracter modificado, y se reconstruye si cambia la fuente
+        self.__advances = []
+        self.__widths = [0]
+        self.__widths_sig = None
+
+        # Parte visible del texto ya renderizada, por color: color -> [superficie, primer caracter desactualizado o None,
+        # desplazamiento con el que se dibujó]. Al editar solo se vuelven a dibujar las palabras desde la edición en adelante
+        self.__text_layers = {}
+        self.__scroll = 0  # Desplazamiento horizontal de la vista, en pixeles, para que el cursor siempre se vea
 
         # Hago blanco los colores del fondo para todos los estados
         self.background.normal_color = Color.White
@@ -1375,6 +1996,7 @@ class TextBox(Control):
     @align.setter
     def align(self, val):
         self.__align = val
+        self.mark_dirty()
     
     
 
@@ -1389,31 +2011,191 @@ class TextBox(Control):
     @text.setter
     def text(self, texto):
         self.__text = texto
-    
+        self.__widths_sig = None  # La tabla de anchos y el texto renderizado se reconstruyen cuando se necesiten
+        self.invalidate()  # El texto se vuelve a dibujar en el próximo render
 
-        # Construye el bitmap de texto 
-        bitmap_normal = self.font.render(texto, True)
-        bitmap_hover = self.font.render(texto, True)
-        bitmap_down = self.font.render(texto, True)
-        bitmap_disable = self.font.render(texto, True, self.midground.disable_color)
-        bitmapWidth, bitmapHeight = self.font.size(texto) 
+    def __layout(self):
+        '''Devuelve la tabla de anchos acumulados del texto, reconstruyéndola si cambió la fuente o el texto completo.
+        Es de uso privado'''
+
+        sig = (id(self.font), self.font.version)
+        if sig != self.__widths_sig:
+            self.__advances = self.font.advances(self.__text)
+            self.__widths = [0]
+            self.__accumulate(0)
+            self.__widths_sig = sig
+            self.__text_layers = {}  # Todo el texto debe volver a renderizarse
+
+        return self.__widths
+
+    def __accumulate(self, desde):
+        '''Recalcula los anchos acumulados a partir del caracter desde. Es de uso privado'''
+
+        del self.__widths[desde+1:]
+        total = self.__widths[desde]
+        for a in self.__advances[desde:]:
+            total += a
+            self.__widths.append(total)
+
+    def __edit(self, inicio, fin, nuevo):
+        '''Reemplaza text[inicio:fin] por nuevo, midiendo solo las palabras que toca la edición. Es de uso privado'''
+
+        self.__layout()
+
+        self.__text = self.__text[:inicio] + nuevo + self.__text[fin:]
+
+        # El kerning depende de las letras vecinas, así que se vuelven a medir las palabras que tocan la edición
+        desde = Font.word_start(self.__text, inicio)
+        hasta = self.__text.find(' ', inicio + len(nuevo))
+        hasta = len(self.__text) if hasta == -1 else hasta + 1
+        corrido = len(nuevo) - (fin - inicio)  # Cuánto se corrió el texto que sigue a la edición
+        self.__advances[desde:hasta - corrido] = self.font.advances(self.__text[desde:hasta])
+        self.__accumulate(desde)
+
+        # El texto renderizado queda desactualizado desde la edición
+        for capa in self.__text_layers.values():
+            if capa[1] == None or inicio < capa[1]:
+                capa[1] = inicio
+
+        self.invalidate()
+
+    def __area(self):
+        '''Ancho en pixeles del área visible del texto, dentro del borde. Es de uso privado'''
+        return max(self.get_width() - 2 * self.border.size, 1)
+
+    def __follow_caret(self):
+        '''Desplaza la vista para que el cursor quede dentro del área visible. Devuelve True si el desplazamiento cambió.
+        Es de uso privado'''
+
+        anchos = self.__layout()
+        area = self.__area()
+        x = anchos[max(0, min(self.__cursorPos, len(anchos) - 1))]
+
+        scroll = self.__scroll
+        if x - scroll > area:
+            scroll = x - area
+        elif x < scroll:
+            scroll = x
+        scroll = max(0, min(scroll, anchos[-1] - area))  # Si el texto se achica no deja espacio vacío a la derecha
+
+        cambio = scroll != self.__scroll
+        self.__scroll = scroll
+        return cambio
+
+    def __text_x(self):
+        '''Posición X, desde el lado izquierdo del control, donde empieza la parte visible del texto. Cuando el texto no
+        entra en el área visible se muestra desde el borde izquierdo, sin importar la alineación. Es de uso privado'''
+
+        ancho = min(self.text_width(), self.__area())
 
-        # Calculo la posicion
-            # Valor del usuario
         if self.align == A_MANUAL:
-            posX, posY = self.pos_text
-            posX += self.border.size
-            posY += self.border.size
-        
-            # Posicion X
+            return self.__pos_text[0] + self.border.size
+
         if self.align == A_LEFT or self.align == A_TOPLEFT or self.align == A_BOTTOMLEFT:
-            posX = 0 + self.border.size
-        
-        if self.align == A_CENTER or self.align == A_TOP or self.align == A_BOTTOM:
-            posX = self.get_width()/2 - bitmapWidth/2
+            return self.border.size
 
-        if self.align == A_RIGHT or self.align == A_BOTTOMRIGHT or self.align == A_TOPRIGHT:
-            posX = self.get_width() - bitmapWidth - self.border.size
+        if self.align == A_RIGHT or self.align == A_TOPRIGHT or self.align == A_BOTTOMRIGHT:
+            return self.get_width() - ancho - self.border.size
+
+        return self.get_width()/2 - ancho/2
+
+    @property
+    def scroll(self):
+        '''Desplazamiento horizontal en pixeles de la vista del texto. Sigue al cursor'''
+        return self.__scroll
+
+    def __text_layer(self, color):
+        '''Devuelve una superficie del tamaño del área visible con la parte del texto que se ve, renderizada en el color
+        pasado. Solo se dibujan las palabras visibles, así que el costo depende del ancho del control y no del largo del
+        texto. Si la vista no se movió, solo se actualiza la parte desactualizada desde la última edición. Las palabras
+        se obtienen de la cache de textos de Font, así que las que no cambiaron no se vuelven a renderizar. Es de uso
+        privado'''
+
+        anchos = self.__layout()
+        ancho, alto = self.__area(), max(self.font.get_height(), self.font.get_linesize())
+        scroll = self.__scroll
+        clave = tuple(color)
+
+        capa = self.__text_layers.get(clave)
+        if capa == None:
+            capa = self.__text_layers[clave] = [None, 0, scroll]
+
+        sup, desde, origen = capa
+        if sup == None or sup.get_size() != (ancho, alto):
+            sup = capa[0] = pygame.Surface((ancho, alto), pygame.SRCALPHA)
+            desde = 0
+        if origen != scroll:  # La vista se movió, todo lo visible se vuelve a dibujar
+            desde = 0
+            capa[2] = scroll
+
+        if desde != None:
+            # Vuelvo a dibujar desde el inicio de la palabra editada, pero nunca antes de la primera palabra visible
+            primero = max(bisect.bisect_right(anchos, scroll) - 1, 0)
+            desde = Font.word_start(self.__text, max(desde, primero))
+            x = max(anchos[desde] - scroll, 0)
+            sup.fill(Color.Transparent, (x, 0, ancho - x, alto))
+
+            # Cada palabra se renderiza igual que la midió advances(), así que anchos[inicio] es el size() de todas
+            # las palabras anteriores y el cursor coincide con las letras dibujadas. Las palabras muy largas se
+            # dividen en los mismos tramos, para no renderizar lo que queda fuera de la vista
+            limite = scroll + ancho
+            for inicio, fin in Font.words(self.__text, desde):
+                if anchos[inicio] >= limite:
+                    break
+                sup.blit(self.font.render(self.__text[inicio:fin], True, color), (anchos[inicio] - scroll, 0))
+
+            capa[1] = None
+
+        return sup
+
+    def text_width(self, hasta=None):
+        '''Devuelve el ancho en pixeles del texto, o de sus primeros hasta caracteres si se indica'''
+
+        anchos = self.__layout()
+        if hasta == None:
+            return anchos[-1]
+        return anchos[max(0, min(hasta, len(anchos) - 1))]
+
+    def char_at(self, x):
+        '''Devuelve la posición de cursor más cercana a x, medido en pixeles desde el inicio del texto'''
+
+        anchos = self.__layout()
+        i = bisect.bisect_left(anchos, x)
+
+        if i >= len(anchos):
+            return len(anchos) - 1
+        if i > 0 and x - anchos[i-1] < anchos[i] - x:  # Más cerca del límite anterior
+            return i - 1
+        return i
+    
+    def _text_color(self, estado):
+        '''Color del texto en el estado indicado. Deshabilitado usa el color del midground, el resto el de la fuente.
+        Las subclases que dibujan su propio texto lo usan para respetar los mismos colores'''
+        if estado == ST_DISABLE:
+            return self.midground.disable_color
+        return self.font.color
+
+    def state_key(self, estado):
+        '''Agrega a la clave el color del midground y el del texto'''
+        return super(TextBox, self).state_key(estado) + (tuple(self.midground.get_color(estado)),
+                                                          tuple(self._text_color(estado)))
+
+    def draw_state(self, estado, superficie):
+        '''Dibuja el texto sobre la superficie del estado indicado'''
+        super(TextBox, self).draw_state(estado, superficie)
+
+        # Obtiene el bitmap con la parte visible del texto, que solo se actualiza desde la última edición
+        self.__follow_caret()
+        bitmap = self.__text_layer(self._text_color(estado))
+        bitmapWidth, bitmapHeight = min(self.text_width(), bitmap.get_width()), self.font.get_height()
+
+        # Calculo la posicion
+            # Posicion X
+        posX = self.__text_x()
+
+            # Valor del usuario
+        if self.align == A_MANUAL:
+            posY = self.pos_text[1] + self.border.size
 
             # Posicion Y
         if self.align == A_TOPLEFT or self.align == A_TOP or self.align == A_TOPRIGHT:
@@ -1426,31 +2208,12 @@ class TextBox(Control):
             posY = self.get_height() - bitmapHeight - self.border.size
 
         # Dibujo el texto sobre el midground
-        self.midground.normal_image.fill(self.midground.normal_color)
-        self.midground.normal_image.blit(bitmap_normal, (posX, posY))
-        self.midground.hover_image.fill(self.midground.hover_color)
-        self.midground.hover_image.blit(bitmap_hover, (posX, posY))
-        self.midground.down_image.fill(self.midground.down_color)
-        self.midground.down_image.blit(bitmap_down, (posX, posY))
-        self.midground.disable_image.fill(self.midground.disable_color)
-        self.midground.disable_image.blit(bitmap_disable, (posX, posY))
-
-        
-
+        blend_fill(superficie, self.midground.get_color(estado))
+        superficie.blit(bitmap, (posX, posY), (0, 0, bitmapWidth, bitmap.get_height()))
 
         # Dibuja el borde del control
-
         if self.border.show:
-              # Normal
-            pygame.draw.rect(self.midground.normal_image, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
-              # Hover
-            pygame.draw.rect(self.midground.hover_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Down
-            pygame.draw.rect(self.midground.down_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-              # Disable
-            pygame.draw.rect(self.midground.disable_image, self.border.color, (0,0,self.get_width(),self.get_height()),self.border.size)
-
-
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
 
 
 
@@ -1463,6 +2226,7 @@ class TextBox(Control):
     @pos_text.setter
     def pos_text(self, val):
         self.__pos_text = val
+        self.mark_dirty()
 
 
     @property
@@ -1473,13 +2237,23 @@ class TextBox(Control):
     @cursorPos.setter
     def cursorPos(self, pos):
         self.__cursorPos = pos
+        self.__scroll_to_caret()
     
 
+    def __scroll_to_caret(self):
+        '''Marca el control para redibujar el cursor. Si el cursor salió del área visible la vista se desplaza y el texto
+        se vuelve a dibujar. Es de uso privado'''
+        if self.__follow_caret():
+            self.invalidate()
+        else:
+            self.mark_dirty()
+
     def movCursorIzq(self):
         '''Mueve el cursor un caracter hacia la izquierda'''
         self.__cursorPos -= 1
         if self.__cursorPos < 0:
             self.__cursorPos = 0
+        self.__scroll_to_caret()
 
         return self.cursorPos
 
@@ -1489,6 +2263,7 @@ class TextBox(Control):
         self.__cursorPos += 1
         if self.__cursorPos > len(self.text):
             self.__cursorPos = len(self.text)
+        self.__scroll_to_caret()
 
         return self.cursorPos
 
@@ -1508,73 +2283,89 @@ class TextBox(Control):
                 self.movCursorDer()
 
             elif k.key == pygame.K_BACKSPACE:
-                self.text = self.text[:self.__cursorPos][:-1] + self.text[self.__cursorPos:]
+                if self.__cursorPos > 0:
+                    self.__edit(self.__cursorPos-1, self.__cursorPos, '')
                 self.movCursorIzq()
 
             elif k.key == pygame.K_DELETE:
-                self.text = self.text[:self.__cursorPos] + self.text[self.__cursorPos+1:]
+                if self.__cursorPos < len(self.__text):
+                    self.__edit(self.__cursorPos, self.__cursorPos+1, '')
             
             else:
-                self.text = self.text[:self.__cursorPos] + k.unicode + self.text[self.__cursorPos:]
-                if str(k.unicode) != '':  # Verifico que lo que se este presionando no sea solo un mods (shift, ctrl, alt)
+                if k.unicode != '':  # Verifico que lo que se este presionando no sea solo un mods (shift, ctrl, alt)
+                    self.__edit(self.__cursorPos, self.__cursorPos, k.unicode)
                     self.movCursorDer()
             
 
         return esKeyDown
 
-    def render(self, display):
-        '''Dibuja el control en la superficie pasada'''
+    def __blink(self):
+        '''Devuelve el estado del parpadeo del cursor, que lleva el reloj de Animator. Es de uso privado'''
+        return Animator.blink(self.__cursorFreq).on
+
+    def is_dirty(self):
+        '''Además de los cambios del control, el parpadeo del cursor obliga a redibujarlo mientras tiene el foco'''
+
+        if super(TextBox, self).is_dirty():
+            return True
 
+        return self.visible and self.enable and self.is_focus() and self.__blink() != self.__blinkDrawn
 
-        textoListo = super(TextBox, self).render(display)
+    def caret_line(self):
+        '''Devuelve los extremos ((x, y0), (x, y1)) en el display de la línea del cursor, o None si el cursor no se ve'''
 
-        tiemporTranscurrido = pygame.time.get_ticks() - TextBox.__tiempo
-        if tiemporTranscurrido > self.__cursorFreq:
-            TextBox.__tiempo = pygame.time.get_ticks()
-            TextBox.__parpadeo = not TextBox.__parpadeo
+        anchoTexto = self.text_width(self.__cursorPos) - self.__scroll
+        altoTexto = self.font.get_height()
 
-        if  textoListo and self.enable and self.is_focus() and TextBox.__parpadeo and self.__cursor.show:
-            anchoTexto, altoTexto = self.font.size(self.__text[0:self.__cursorPos])
+        # Defino la posición X del cursor según la alineación y el desplazamiento de la vista
+        posXcur = self.left + self.__text_x() + anchoTexto
 
-            # Defino la posición X del cursor según la alineación
-            if self.align == A_MANUAL:
-                posXcur = self.left + self.__pos_text[0] + anchoTexto + self.border.size
+        # Defino la posición Y del cursor según la alineación
+        if self.align == A_MANUAL:
+            posYcur0 = self.top + self.__pos_text[1] + self.border.size
+            posYcur1 = self.top + self.__pos_text[1] + altoTexto + self.border.size
 
-            elif self.align == A_LEFT or self.align == A_TOPLEFT or self.align == A_BOTTOMLEFT:
-                posXcur = self.left + anchoTexto + self.border.size
 
+        elif self.align == A_TOPLEFT or self.align == A_TOP or self.align == A_TOPRIGHT:
+            posYcur0 = self.top + self.border.size
+            posYcur1 = self.top + altoTexto + self.border.size
 
-            elif self.align == A_RIGHT or self.align == A_TOPRIGHT or self.align == A_BOTTOMRIGHT:
-                posXcur = self.left + self.get_width() - self.font.size(self.__text)[0] + anchoTexto - self.border.size
 
-            elif self.align == A_CENTER or self.align == A_TOP or self.align == A_BOTTOM:
-                posXcur = self.left + self.get_width()/2 - self.font.size(self.__text)[0]/2 + anchoTexto
+        elif self.align == A_LEFT or self.align == A_CENTER or self.align == A_RIGHT:
+            posYcur0 = self.top + self.get_height()/2 - altoTexto/2
+            posYcur1 = self.top + self.get_height()/2 + altoTexto/2
 
-            # Defino la posición Y del cursor según la alineación
-            if self.align == A_MANUAL:
-                posYcur0 = self.top + self.__pos_text[1] + self.border.size
-                posYcur1 = self.top + self.__pos_text[1] + altoTexto + self.border.size
+        elif self.align == A_BOTTOMLEFT or self.align == A_BOTTOM or self.align == A_BOTTOMRIGHT:
+            posYcur0 = self.top + self.get_height() - altoTexto - self.border.size
+            posYcur1 = self.top + self.get_height() - self.border.size 
 
+        return (posXcur, posYcur0), (posXcur, posYcur1)
 
-            elif self.align == A_TOPLEFT or self.align == A_TOP or self.align == A_TOPRIGHT:
-                posYcur0 = self.top + self.border.size
-                posYcur1 = self.top + altoTexto + self.border.size
+    def stop_animations(self):
+        '''Deja de seguir el parpadeo del cursor'''
+        Animator.blink(self.__cursorFreq).unwatch(self)
 
+    def render_overlay(self, display):
+        '''Además del foco, dibuja el cursor si el control tiene el foco y el parpadeo lo muestra'''
 
-            elif self.align == A_LEFT or self.align == A_CENTER or self.align == A_RIGHT:
-                posYcur0 = self.top + self.get_height()/2 - altoTexto/2
-                posYcur1 = self.top + self.get_height()/2 + altoTexto/2
+        super(TextBox, self).render_overlay(display)
 
-            elif self.align == A_BOTTOMLEFT or self.align == A_BOTTOM or self.align == A_BOTTOMRIGHT:
-                posYcur0 = self.top + self.get_height() - altoTexto - self.border.size
-                posYcur1 = self.top + self.get_height() - self.border.size 
+        # Mientras tiene el foco y se dibuja, el parpadeo lo marca como sucio en cada cambio. Deja de hacerlo en
+        # stop_animations()
+        parpadeo = Animator.blink(self.__cursorFreq)
+        enfocado = self.enable and self.is_focus()
+        if enfocado:
+            parpadeo.watch(self)
+        else:
+            parpadeo.unwatch(self)  # Tiene el foco pero está deshabilitado
 
-            
+        self.__blinkDrawn = parpadeo.on
 
-            if posXcur < self.left + self.get_width():
-                pygame.draw.line(display, self.__cursor.color , (posXcur , posYcur0), (posXcur , posYcur1) , self.__cursor.size)
+        if enfocado and self.__blinkDrawn and self.__cursor.show:
+            linea = self.caret_line()
 
-        return textoListo
+            if linea != None and linea[0][0] < self.left + self.get_width():
+                pygame.draw.line(display, self.__cursor.color , linea[0], linea[1] , self.__cursor.size)
 
     def click(self, c=None):  
         ''' '''
@@ -1589,47 +2380,159 @@ class TextBox(Control):
         if hover:
             posClick = c.pos
 
-            dimText = self.font.size(self.__text)
-
             # Defino la posición del cursor según la alineación. iniText será el pixel horizontal donde inicia el texto, contando desde el
-            # lado izquierdo del control
-            if self.align == A_MANUAL:
-                iniText = self.__pos.text[0]  
+            # lado izquierdo del control y teniendo en cuenta el desplazamiento de la vista
+            iniText = self.__text_x() - self.__scroll
 
-            elif self.align == A_LEFT or self.align == A_TOPLEFT or self.align == A_BOTTOMLEFT:
-                iniText = 0
+            # Busco en la tabla de anchos el límite entre caracteres más cercano al click
+            self.cursorPos = self.char_at(posClick[0] - self.left - iniText)
 
-            elif self.align == A_RIGHT or self.align == A_TOPRIGHT or self.align == A_BOTTOMRIGHT:
-                iniText = self.get_width() - dimText[0]
+        return hover
 
-            elif self.align == A_CENTER or self.align == A_TOP or self.align == A_BOTTOM:
-                iniText = self.get_width()/2 - dimText[0]/2
 
+class Runner(object):
+    '''Bucle principal de la aplicación. Reparte los eventos a la pantalla actual, la dibuja y actualiza el display.
 
+    Mientras hay interacción (durante boost milisegundos después de cada evento) o animaciones en curso corre a fps
+    frames por segundo. El resto del tiempo duerme en pygame.event.wait() hasta que llega un evento o una animación
+    necesita un frame (un timer o el parpadeo del cursor, ver Animator.next_event()), así una pantalla quieta casi no
+    usa CPU. Conviene usar las pantallas con dirty_mode = True para que cada frame solo redibuje lo que cambió.
 
-            # Analizo donde se produjo el click
+    Los eventos que la pantalla no usa se pasan a on_event, si se indica. QUIT además termina el bucle.'''
 
-            if posClick[0] > self.left + iniText + dimText[0]:
-                self.__cursorPos = len(self.__text)
-                return hover
-            
-            if posClick[0] < self.left + iniText:
-                self.__cursorPos = 0
-                return hover
+    history = 120  # Cantidad de frames que se guardan para las estadísticas
 
-            else:
-                tamizqant = 0
+    def __init__(self, display, fps=60, boost=500, on_event=None):
+        self.display = display
+        self.fps = fps
+        self.boost = boost
+        self.on_event = on_event
 
-                for i in range(0,len(self.__text)+1):
-                    izq = self.__text[0:i]
-                    tamizq = self.font.size(izq)[0]
-                    if posClick[0] > self.left + iniText + tamizqant + (tamizq-tamizqant)/2:
-                        tamizqant = tamizq
-                    else:    
-                        self.__cursorPos = len(izq) -1
-                        break    
+        self.__running = False
+        self.__clock = pygame.time.Clock()
+        self.__times = deque(maxlen=Runner.history)  # Milisegundos de trabajo de cada frame, sin contar la espera
+        self.__frames = 0
+        self.__wakeups = 0      # Veces que despertó después de dormir
+        self.__slept = 0.0      # Segundos dormidos, esperando eventos o limitando los fps
+        self.__started = None
+        self.__last_input = None
+        self.__redraw = True    # El próximo frame no espera: la aplicación pudo cambiar algo antes de correr el bucle
+
+    @property
+    def running(self):
+        '''True mientras el bucle está corriendo. Solo lectura'''
+        return self.__running
+
+    def stop(self):
+        '''Termina el bucle al final del frame actual'''
+        self.__running = False
+
+    def is_active(self):
+        '''Devuelve True si hay que correr a fps frames por segundo: hay animaciones en curso, un control tiene
+        capturado el mouse o pasaron menos de boost milisegundos desde el último evento'''
+
+        if Animator.animating():
+            return True
+
+        pantalla = Screen.get_current()
+        if pantalla != None and pantalla.captured != None:
+            return True
+
+        return self.__last_input != None and (default_timer() - self.__last_input) * 1000 < self.boost
+
+    def __sleep(self, funcion, *args):
+        '''Llama a funcion sumando su duración al tiempo dormido y devuelve su resultado. Es de uso privado'''
+
+        inicio = default_timer()
+        try:
+            return funcion(*args)
+        finally:
+            self.__slept += default_timer() - inicio
+
+    def step(self):
+        '''Ejecuta un frame: espera los eventos (durmiendo si no hay actividad), los reparte y dibuja la pantalla
+        actual. Devuelve False si el bucle debe terminar'''
+
+        activo = self.is_active()
+        if activo or self.__redraw:
+            self.__redraw = False
+            eventos = pygame.event.get()
+        else:
+            # Las imágenes que se cargan en segundo plano no generan eventos: mientras haya alguna se revisa cada frame
+            espera = int(1000 / self.fps) if ImageCache.pending() else None
+            eventos = self.__sleep(Animator.wait, espera)
+            self.__wakeups += 1
+
+        inicio = default_timer()
+        if eventos:
+            self.__last_input = inicio
+
+        pantalla = Screen.get_current()
+        resto = pantalla.process_events(eventos) if pantalla != None else eventos
+
+        for e in resto:
+            if self.on_event != None:
+                self.on_event(e)
+            if e.type == pygame.QUIT:
+                self.stop()
+
+        pantalla = Screen.get_current()  # Un evento pudo cambiar de pantalla
+        if pantalla != None:
+            rects = pantalla.render(self.display)
+            if rects:
+                pygame.display.update(rects)
+
+        self.__times.append((default_timer() - inicio) * 1000)
+        self.__frames += 1
+
+        if activo:
+            self.__sleep(self.__clock.tick, self.fps)
+
+        return self.__running
+
+    def run(self, frames=None):
+        '''Corre el bucle hasta que se llame a stop() o llegue QUIT, o durante la cantidad de frames indicada'''
+
+        self.__running = True
+        self.__redraw = True
+        if self.__started == None:
+            self.__started = default_timer()
+
+        while self.__running:
+            self.step()
+            if frames != None:
+                frames -= 1
+                if frames <= 0:
+                    break
+
+        self.__running = False
+
+    def stats(self):
+        '''Devuelve un diccionario con las estadísticas de los frames: cantidad de frames (frames), veces que despertó
+        después de dormir (wakeups), tiempo de trabajo promedio, máximo y percentil 95 en ms de los últimos frames
+        (avg_ms, max_ms, p95_ms), frames por segundo promedio desde el comienzo (fps) y fracción del tiempo que pasó
+        durmiendo (idle)'''
+
+        tiempos = sorted(self.__times)
+        total = default_timer() - self.__started if self.__started != None else 0
+
+        return {'frames': self.__frames,
+                'wakeups': self.__wakeups,
+                'avg_ms': sum(tiempos) / len(tiempos) if tiempos else 0.0,
+                'max_ms': tiempos[-1] if tiempos else 0.0,
+                'p95_ms': tiempos[int(len(tiempos) * 0.95)] if tiempos else 0.0,
+                'fps': self.__frames / total if total > 0 else 0.0,
+                'idle': self.__slept / total if total > 0 else 0.0}
+
+
+def run(display, fps=60, boost=500, on_event=None, frames=None):
+    '''Corre el bucle principal con un Runner (ver Runner) y lo devuelve al terminar, para consultar sus estadísticas
+    con stats()'''
+
+    runner = Runner(display, fps, boost, on_event)
+    runner.run(frames)
+    return runner
 
-        return hover
 
 
 ###########################################################################################################################################
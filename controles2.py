@@ -1,6 +1,8 @@
 #! /usr/bin/env python
 #-*- coding: UTF-8 -*-
+import bisect
 import pygame
+from collections import OrderedDict
 from controles import *
 from herramientas import *
 from locales import *
@@ -8,100 +10,106 @@ from exceptions import *
 
 '''Módulo con controles avanzados en la implementación de una interfaz gráfica.
 Controloes incluidos en este módulo:
-  SliderV:   Barra deslizable vertical'''
-
-class SliderV(Control):
-    '''Barra deslizable vertical'''
-    
-
-    def __init__(self, rect, name):
-        super(SliderV,self).__init__(rect, name)
-    
-    
+  Slider:    Barra deslizable horizontal o vertical
+  SliderH:   Barra deslizable horizontal
+  SliderV:   Barra deslizable vertical
+  TextArea:  Caja de texto de varias líneas
+  ListBox:   Lista de elementos que solo dibuja las filas visibles
+  DataGrid:  Tabla con encabezado y columnas, basada en ListBox
+  Panel:     Contenedor de controles que se dibuja como una sola superficie'''
+
+class Slider(Control):
+    '''Barra deslizable. Recibe un Rect con su tamaño y posición, un nombre que debe ser único, la orientación
+    (O_HORIZONTAL u O_VERTICAL) y opcionalmente una función on_change que recibe el valor nuevo.
+
+    El fondo, el borde y la línea central se dibujan una sola vez en las superficies de cada estado, como en cualquier
+    control. El cursor es una superficie aparte, ya dibujada para cada estado. Lo que se muestra es una copia de la
+    superficie del estado con el cursor pegado en su posición, que se rearma solo cuando cambian el estado, el cursor o
+    su posición: mover el cursor no vuelve a dibujar el resto del control. Como el cursor forma parte de esa superficie,
+    los controles que están encima lo tapan como a cualquier otro.
+
+    Mientras se arrastra el valor cambia con cada movimiento del mouse, pero on_change se llama como máximo una vez por
+    frame (al dibujar el control) y solo si el valor cambió desde el último aviso'''
+
+    def __init__(self, rect, name, orientation=O_HORIZONTAL, on_change=None):
+        super(Slider, self).__init__(rect, name)
+
+        self.__orientation = orientation
         self.__max = 100
         self.__min = 0
+        self.__step = 0  # 0 para valores continuos
         self.__value = 50
-        self.__orientation = O_VERTICAL
-
+        self.__on_change = on_change
+        self.__notified = self.__value  # Último valor avisado a on_change
 
         # Cursor
-        self.__cursorThickness = 5
-        self.__cursorSize = (rect[2], self.__cursorThickness)
-        self.__cursorPos = (0,0)
+        self.__cursorThickness = 8
         self.__cursor = Layer()
-        self.__arrastrar = False # variable auxiliar para el arrastrado del cursor
+        self.__cursor.normal_color = Color.DimGray
+        self.__cursor.hover_color = Color.SlateGray
+        self.__cursor.down_color = Color.Black
+        self.__cursor.disable_color = Color.LightGray
+        self.__sprites = {}     # estado -> superficie del cursor
+        self.__sprites_sig = None
+        self.__frame = None     # Superficie del estado con el cursor ya pegado
+        self.__frame_sig = None
+        self.__drag = None      # Distancia entre el mouse y el comienzo del cursor mientras se arrastra
+
+        # Línea central
+        self.__centralLine = Border()
+        self.__centralLine.color = Color.Gray
+        self.__centralLine.size = 2
 
-        # Linea central
-        self.__centralLine = Line()  #  Grosor de la linea central del control
 
-        self.__setCursorPos()  # Actualiza la posicion del cursor
+    # PROPIEDADES
+
+    @property
+    def orientation(self):
+        '''Orientación del control, O_HORIZONTAL u O_VERTICAL. Solo lectura'''
+        return self.__orientation
+
+    @property
+    def cursor(self):
+        '''Capa con los colores o imágenes del cursor en cada estado'''
+        return self.__cursor
 
+    @cursor.setter
+    def cursor(self, val):
+        self.__cursor = val
+        self.mark_dirty()
 
     @property
     def cursorThickness(self):
-        '''Establece el ancho del cursor'''
+        '''Ancho del cursor en el sentido del desplazamiento'''
         return self.__cursorThickness
-    
+
     @cursorThickness.setter
     def cursorThickness(self, v):
         self.__cursorThickness = v
+        self.mark_dirty()
 
+    @property
+    def cursorSize(self):
+        '''Tupla con el tamaño del cursor. Solo lectura'''
         if self.__orientation == O_HORIZONTAL:
-            self.cursorSize = (self.__cursorThickness, self.get_height()) 
-        elif self.__orientation == O_VERTICAL:
-            self.cursorSize = (self.get_width(), self.__cursorThickness) 
-
+            return (self.__cursorThickness, self.get_height())
+        return (self.get_width(), self.__cursorThickness)
 
     @property
-    def cursorSize(self):
-        '''Tupla con el tamaño del cursor.'''
-        return self.__cursorSize
-    
-    @cursorSize.setter
-    def cursorSize(self, val):
-        self.__cursorSize = val
-        self.__cursor.normal_image = pygame.Surface(val, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__cursor.hover_image = pygame.Surface(val, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__cursor.down_image = pygame.Surface(val, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.__cursor.disable_image = pygame.Surface(val, pygame.HWSURFACE|pygame.SRCALPHA)
-        
-        self.__setCursorPos()
-
-    
+    def cursorPos(self):
+        '''Posición del cursor en el display. Solo lectura'''
+        x, y = self.__cursor_offset()
+        return (self.left + x, self.top + y)
+
     @property
     def centralLine(self):
-        '''Ancho de la línea central del control'''
-
+        '''Objeto Border con el color, el grosor y la visibilidad (show) de la línea central'''
         return self.__centralLine
 
-
     @centralLine.setter
     def centralLine(self, val):
         self.__centralLine = val
-
-        
-
-
-    @property
-    def orientation(self):
-        '''Orientacion del control. Solo lectura'''
-        return self.__orientation
-
-
-    @property
-    def cursorPos(self):
-        '''Posicion del cursor. Solo lectura'''
-        return self.__cursorPos
-    
-    def __setCursorPos(self):
-        '''Setea la posicion del cursor en funcion del valor max, valor min y el valor actual. Es de uso privado'''
-
-        if self.orientation == O_HORIZONTAL:
-            self.__cursorPos = ((self.get_width()-self.cursorThickness)*(self.__value-self.__min)/(self.__max-self.__min)+self.left, self.top +(self.get_height()-self.__cursorSize[1])/2 )
-        
-        elif self.orientation == O_VERTICAL:
-            self.__cursorPos = (self.left +(self.get_width()-self.__cursorSize[0])/2, (-1*(self.get_height()-self.cursorThickness)*(self.__value-self.__min)/(self.__max-self.__min)+self.top+self.get_height()-self.cursorThickness )) #-self.height)
-
+        self.invalidate()
 
     @property
     def maxValue(self):
@@ -111,9 +119,7 @@ class SliderV(Control):
     @maxValue.setter
     def maxValue(self, v):
         self.__max = v
-
-        if (self.__max-self.__min):  # Esto es para evitar division por cero
-            self.value = self.__value  # Recalcula la posicion actual, por si quedo fuera del nuevo limite
+        self.value = self.__value  # Recalcula el valor actual, por si quedó fuera del nuevo límite
 
     @property
     def minValue(self):
@@ -123,169 +129,1556 @@ class SliderV(Control):
     @minValue.setter
     def minValue(self, v):
         self.__min = v
+        self.value = self.__value  # Recalcula el valor actual, por si quedó fuera del nuevo límite
+
+    @property
+    def step(self):
+        '''Incremento entre valores posibles. Con 0 el valor es continuo'''
+        return self.__step
 
-        if (self.__max-self.__min):  # Esto es para evitar division por cero
-            self.value = self.__value  # Recalcula la posicion actual, por si quedo fuera del nuevo limite
+    @step.setter
+    def step(self, v):
+        self.__step = v
+        self.value = self.__value
 
     @property
     def value(self):
-        '''Valor actual'''
+        '''Valor actual. Se ajusta a los límites y al incremento (step)'''
         return self.__value
 
     @value.setter
     def value(self, v):
-        if v < self._min:
-            self.__value = self.__min
-        elif v > self.__max:
-            self.__value = self.__max
-        else:            
+        v = max(self.__min, min(self.__max, v))
+
+        if self.__step:
+            v = self.__min + round((v - self.__min) / float(self.__step)) * self.__step
+            v = min(v, self.__max)
+            if all(isinstance(x, int) for x in (self.__min, self.__max, self.__step)):
+                v = int(v)
+
+        if v != self.__value:
             self.__value = v
-    
-        self.__setCursorPos()
-        
+            self.mark_dirty()  # Solo cambia la posición del cursor: las superficies del control siguen valiendo
+
+    @property
+    def on_change(self):
+        '''Función que recibe el valor nuevo cuando cambia. Se llama como máximo una vez por frame'''
+        return self.__on_change
+
+    @on_change.setter
+    def on_change(self, val):
+        self.__on_change = val
+
+    @property
+    def dragging(self):
+        '''True mientras se arrastra el cursor. Solo lectura'''
+        return self.__drag != None
+
+
+    # POSICIONES
+
+    def __fraction(self):
+        '''Proporción del valor actual entre el mínimo y el máximo, de 0 a 1. Es de uso privado'''
+        rango = self.__max - self.__min
+        if rango == 0:
+            return 0.0
+        return (self.__value - self.__min) / float(rango)
+
+    def __track(self):
+        '''Largo en pixeles del recorrido del cursor. Es de uso privado'''
+        if self.__orientation == O_HORIZONTAL:
+            return max(self.get_width() - self.__cursorThickness, 1)
+        return max(self.get_height() - self.__cursorThickness, 1)
+
+    def __cursor_offset(self):
+        '''Posición del cursor relativa al control. El vertical tiene el mínimo abajo. Es de uso privado'''
+        recorrido = int(round(self.__fraction() * self.__track()))
+        if self.__orientation == O_HORIZONTAL:
+            return (recorrido, 0)
+        return (0, self.__track() - recorrido)
+
+    def __value_at(self, pos, agarre):
+        '''Valor que corresponde a la posición del mouse pos, tomando el cursor a agarre pixeles de su comienzo. Es de
+        uso privado'''
+
+        if self.__orientation == O_HORIZONTAL:
+            fraccion = (pos[0] - self.left - agarre) / float(self.__track())
+        else:
+            fraccion = 1 - (pos[1] - self.top - agarre) / float(self.__track())
+
+        fraccion = max(0.0, min(1.0, fraccion))
+        return self.__min + fraccion * (self.__max - self.__min)
 
-    def render(self, target, b=None):
-        '''Dibuja el control en la superficie indicada en target.'''
+    def __axis(self, pos):
+        '''Coordenada de pos en el sentido del desplazamiento, relativa al control. Es de uso privado'''
+        if self.__orientation == O_HORIZONTAL:
+            return pos[0] - self.left
+        return pos[1] - self.top
+
+
+    # VERIFICACIONES
+
+    def is_hover(self):
+        '''Devuelve un entero mayor que cero cuando el mouse está sobre el control:
+            0 --> No está sobre el control
+            1 --> Está sobre el cursor
+            2 --> Está sobre el control, fuera del cursor'''
+
+        if not super(Slider, self).is_hover():
+            return 0
+
+        cursor = pygame.Rect(self.cursorPos, self.cursorSize)
+        return 1 if cursor.collidepoint(self.get_input().pos) else 2
+
+    def get_state(self):
+        '''Mientras se arrastra el control se ve presionado, aunque el mouse salga de él'''
+        if self.__drag != None and self.enable:
+            return ST_DOWN
+        return super(Slider, self).get_state()
 
-        r = super(Slider, self).render(target, b)
 
-        #  Las siguientes instrucciones solo dibujan el cursor en la posicion correspondiente,
-        #  el rectangulo del control ya fue dibujado por el render de la clase base
+    # DIBUJADO
 
-        #  Si no hay presionado ningun boton detiene la operacion de arrastrar si se ha iniciado
-        btns = pygame.mouse.get_pressed()
-        if not (btns[0] or btns[1] or btns[2]):  
-            self.__arrastrar = False
+    def draw_state(self, estado, superficie):
+        '''Dibuja la línea central sobre el fondo. El cursor no forma parte de estas superficies'''
 
-        if r :
-            h = self.is_hover()
+        super(Slider, self).draw_state(estado, superficie)
 
-            if not self.enable:
-                target.blit(self.cursor.disable_image, self.cursorPos)
+        linea = self.__centralLine
+        if linea.show:
+            w, h = self.size
+            if self.__orientation == O_HORIZONTAL:
+                pygame.draw.line(superficie, linea.color, (0, h // 2), (w, h // 2), linea.size)
             else:
-                if h: 
-                    if self.is_down(b):
+                pygame.draw.line(superficie, linea.color, (w // 2, 0), (w // 2, h), linea.size)
+
+            # Dibuja el borde del control sobre la línea
+            if self.border.show:
+                pygame.draw.rect(superficie, self.border.color, (0, 0, w, h), self.border.size)
+
+    def __sprite(self, estado):
+        '''Superficie del cursor en el estado indicado. Se dibuja la primera vez y se guarda hasta que cambien la
+        capa del cursor o su tamaño. Es de uso privado'''
+
+        sig = (id(self.__cursor), self.__cursor.version, self.cursorSize)
+        if sig != self.__sprites_sig:
+            self.__sprites = {}
+            self.__sprites_sig = sig
+
+        sup = self.__sprites.get(estado)
+        if sup == None:
+            sup = pygame.Surface(self.cursorSize, pygame.HWSURFACE|pygame.SRCALPHA)
+            blend_fill(sup, self.__cursor.get_color(estado))
+            if self.__cursor.type == T_IMAGE and self.__cursor.get_image(estado) != None:
+                sup.blit(self.__cursor.get_image(estado), (0, 0))
+            self.__sprites[estado] = sup
+
+        return sup
+
+    def notify(self):
+        '''Llama a on_change si el valor cambió desde el último aviso. La pantalla lo hace una vez por frame al dibujar
+        el control; llamarlo a mano solo hace falta si el control no se dibuja'''
+
+        if self.__value != self.__notified:
+            self.__notified = self.__value
+            if self.__on_change != None:
+                self.__on_change(self.__value)
+
+    def get_blit(self):
+        '''Devuelve la superficie del control con el cursor pegado en su posición, y avisa el cambio de valor de este
+        frame, si lo hubo'''
+
+        item = super(Slider, self).get_blit()
+        self.notify()
+        if item == None:
+            return None
 
-                        if self.__arrastrar:
-                            if self.orientation == O_HORIZONTAL:
-                                self.value = ((self.maxValue-self.minValue+1)*(pygame.mouse.get_pos()[0]-self.left)/self.get_width())+self.minValue
+        sprite = self.__sprite(self.get_state())
+        offset = self.__cursor_offset()
 
-                            elif self.orientation == O_VERTICAL:
-                                self.value = self.minValue + (pygame.mouse.get_pos()[1]-self.top-self.get_height())*(self.maxValue-self.minValue)/(-1*self.get_height())
+        # La firma guarda las superficies mismas, no sus id, para que una superficie nueva nunca se confunda con la vieja
+        sig = (item[0], sprite, offset)
+        if sig != self.__frame_sig:
+            self.__frame = item[0].copy()  # Copia exacta, también de la transparencia
+            self.__frame.blit(sprite, offset)
+            self.__frame_sig = sig
 
-                        target.blit(self.cursor.down_image, self.cursorPos)
-                    else:
-                        target.blit(self.cursor.hover_image, self.cursorPos)
+        return self.__frame, item[1]
+
+
+    # EVENTOS
+
+    def click(self, boton=None):
+        '''Con el botón izquierdo sobre el cursor comienza a arrastrarlo. Sobre el resto del control lleva el cursor a
+        esa posición y también comienza a arrastrarlo. La rueda del mouse cambia el valor'''
+
+        hover = super(Slider, self).click(boton)
+
+        if hover and self.enable and boton != None:
+            if boton.button == 4:
+                self.value = self.__value + self.__increment()
+            elif boton.button == 5:
+                self.value = self.__value - self.__increment()
+            elif boton.button == 1:
+                if hover == 1:
+                    self.__drag = self.__axis(boton.pos) - self.__axis(self.cursorPos)
                 else:
-                    target.blit(self.cursor.normal_image, self.cursorPos)
-       
+                    self.__drag = self.__cursorThickness // 2
+                    self.value = self.__value_at(boton.pos, self.__drag)
 
+                self.mark_dirty()
+                self.screen.capture_mouse(self)
 
+        return hover
 
+    def mouse_move(self, event):
+        '''Mueve el cursor mientras se arrastra'''
 
-    def update(self):
-        '''Actualiza como se mostrará el control según el modo gráfico establecido. Debe ser llamado cada vez que la imagen del control cambie'''
+        if self.__drag != None:
+            if hasattr(event, 'buttons') and not event.buttons[0]:
+                self.mouse_up(event)  # Se soltó el botón fuera de la ventana
+                self.screen.release_mouse()
+            else:
+                self.value = self.__value_at(event.pos, self.__drag)
+
+    def mouse_up(self, event):
+        '''Termina el arrastre'''
+        self.__drag = None
+        self.mark_dirty()
+
+    def __increment(self):
+        '''Cambio de valor de una tecla o de la rueda del mouse: step, o la centésima parte del rango. Es de uso
+        privado'''
+        return self.__step or (self.__max - self.__min) / 100.0
+
+    def keydown(self, k=None):
+        '''Las flechas cambian el valor en un incremento, RePág y AvPág en diez, Inicio y Fin lo llevan al mínimo y al
+        máximo'''
+
+        if not (self.enable and self.is_focus()):
+            return False
+
+        if k.key in (pygame.K_RIGHT, pygame.K_UP):
+            self.value = self.__value + self.__increment()
+        elif k.key in (pygame.K_LEFT, pygame.K_DOWN):
+            self.value = self.__value - self.__increment()
+        elif k.key == pygame.K_PAGEUP:
+            self.value = self.__value + self.__increment() * 10
+        elif k.key == pygame.K_PAGEDOWN:
+            self.value = self.__value - self.__increment() * 10
+        elif k.key == pygame.K_HOME:
+            self.value = self.__min
+        elif k.key == pygame.K_END:
+            self.value = self.__max
+        else:
+            return False
 
+        return True
 
 
-        # Actualizo la posicion del cursor
-        self.__setCursorPos()
+class SliderH(Slider):
+    '''Barra deslizable horizontal'''
 
-        # Linea central
-        pygame.draw.line(self.normal_image, self.normal_color, (self.get_width()/2, 0), (self.get_width()/2, self.get_height()), self.__centralLine.size) #(0, (self.height-self.centralLineSize)/2, self.width, self.centralLineSize), 1)
-        pygame.draw.line(self.hover_image, self.hover_color, (self.get_width()/2, 0), (self.get_width()/2, self.get_height()), self.__centralLine.size) #(0, (self.height-self.centralLineSize)/2, self.width, self.centralLineSize), 1)
-        pygame.draw.line(self.down_image, self.down_color, (self.get_width()/2, 0), (self.get_width()/2, self.get_height()), self.__centralLine.size) #(0, (self.height-self.centralLineSize)/2, self.width, self.centralLineSize), 1)
-        # Cursor
-        pygame.draw.rect(self.__cursor.normal_image, self.__cursor.normal_color, (0,0,self.cursorSize[0], self.cursorSize[1]), 0)
-        pygame.draw.rect(self.__cursor.hover_image , self.__cursor.hover_color , (0,0,self.cursorSize[0], self.cursorSize[1]), 0)
-        pygame.draw.rect(self.__cursor.down_image, self.__cursor.down_color, (0,0,self.cursorSize[0], self.cursorSize[1]), 0)
-    
-        
+    def __init__(self, rect, name, on_change=None):
+        super(SliderH, self).__init__(rect, name, O_HORIZONTAL, on_change)
 
 
-    def is_hover(self):
-        '''Devuelve un entero mayor que cero cuando el cursor del mouse está sobre el control.
-        Tabla de valores:
-            0 --> No está sobre el control
-            1 --> Está sobre el cursor del control
-            2 --> Está sobre la línea central del control
-            3 --> Está sobre el control (pero fuera del cursor y la línea central)'''
-        
-        pos = pygame.mouse.get_pos()  #  Posicion del mouse
-        res = 0  #  Valor por defecto
-        
-        if self.visible and self.is_context():
+class SliderV(Slider):
+    '''Barra deslizable vertical. El mínimo está abajo'''
+
+    def __init__(self, rect, name, on_change=None):
+        super(SliderV, self).__init__(rect, name, O_VERTICAL, on_change)
+
+
+class TextArea(TextBox):
+    '''Caja de texto de varias líneas. Hereda del TextBox los colores, el foco y el parpadeo del cursor, pero guarda su
+    propio texto como una lista de líneas: el cursor se ubica con una tupla (línea, columna), las líneas más anchas que
+    el control se parten por palabras y el texto siempre empieza arriba a la izquierda, así que align y pos_text no se
+    pueden asignar. text_width(), char_at() y scroll se redefinen para varias líneas.
+
+    Cada línea guarda su propia disposición (anchos de los caracteres, cortes de las filas y las filas ya renderizadas),
+    que solo se recalcula cuando se edita esa línea. La vista se define por la primera fila visible, así que dibujar,
+    mover el cursor o editar solo recorre las filas que se ven, sin importar la cantidad de líneas del texto'''
+
+    line_cache_size = 256  # Cantidad máxima de líneas que guardan sus filas renderizadas
+
+    def __init__(self, rect, name, texto=""):
+
+        super(TextArea, self).__init__(rect, name)
+
+        self.__lines = texto.split('\n')
+        self.__layouts = [None] * len(self.__lines)  # Por línea: [anchos acumulados, cortes de las filas, {color: filas}]
+        self.__layouts_sig = None
+        self.__rendered = OrderedDict()  # Disposiciones que tienen filas renderizadas, de la menos a la más usada
 
-                #  Sobre el control
-            if self.get_rect().collidepoint(pos):
-                res = 3  
+        self.__row = 0     # Línea del cursor
+        self.__col = 0     # Columna del cursor
+        self.__top = (0, 0)  # Primera fila visible: (línea, fila dentro de la línea)
 
-                #  Sobre la linea
-            if (pos[0] > self.left + self.width / 2 - self.__centralLine.size / 2) and (pos[0] < self.left + self.width / 2 + self.__centralLine.size / 2):    # self._centralLineSize.move(self.left,self.top).collidepoint(pos):
-                res = 2
 
-                #  Sobre el cursor
-            if self.img_cursorNormal.get_rect(topleft = self.cursorPos).collidepoint(pos):
-                res = 1
+    @property
+    def text(self):
+        '''Texto que contiene el control, con las líneas separadas por \\n'''
+        return '\n'.join(self.__lines)
+
+    @text.setter
+    def text(self, texto):
+        self.__lines = texto.split('\n')
+        self.__layouts = [None] * len(self.__lines)
+        self.__rendered.clear()
+        self.__top = (0, 0)
+        self.cursorPos = (self.__row, self.__col)  # Ajusta el cursor al nuevo texto
+        self.invalidate()
+
+    @property
+    def line_count(self):
+        '''Cantidad de líneas del texto. Solo lectura'''
+        return len(self.__lines)
+
+    def get_line(self, linea):
+        '''Devuelve el texto de la línea indicada'''
+        return self.__lines[linea]
+
+    @property
+    def first_line(self):
+        '''Primera línea visible, completa o en parte. Solo lectura'''
+        return self.__top[0]
+
+    @property
+    def cursorPos(self):
+        '''Posición del cursor, como tupla (línea, columna)'''
+        return self.__row, self.__col
+
+    @cursorPos.setter
+    def cursorPos(self, pos):
+        self.__row = max(0, min(pos[0], len(self.__lines) - 1))
+        self.__col = max(0, min(pos[1], len(self.__lines[self.__row])))
+        self.__scroll_to_caret()
+
+    @property
+    def align(self):
+        '''El texto siempre se ubica arriba a la izquierda. Asignarla lanza AttributeError'''
+        return A_TOPLEFT
+
+    @align.setter
+    def align(self, val):
+        raise AttributeError('El TextArea no admite alineación, el texto siempre empieza arriba a la izquierda')
+
+    @property
+    def pos_text(self):
+        '''El texto siempre empieza junto al borde. Asignarla lanza AttributeError'''
+        return (0, 0)
+
+    @pos_text.setter
+    def pos_text(self, val):
+        raise AttributeError('El TextArea no admite pos_text, el texto siempre empieza arriba a la izquierda')
+
+    @property
+    def scroll(self):
+        '''Las filas se parten al ancho del control, así que la vista nunca se desplaza en horizontal y es siempre 0. La
+        primera línea visible se lee con first_line y la vista se desplaza con scroll_rows()'''
+        return 0
 
-            return res
+    def text_width(self, hasta=None):
+        '''Devuelve el ancho en pixeles de la línea más ancha, sin partirla en filas. Si se indica hasta, una posición
+        (línea, columna), devuelve el ancho de esa línea hasta la columna'''
 
+        self.__check_layouts()
+        if hasta == None:
+            return max(self.__layout(i)[0][-1] for i in range(len(self.__lines)))
+
+        linea = max(0, min(hasta[0], len(self.__lines) - 1))
+        anchos = self.__layout(linea)[0]
+        return anchos[max(0, min(hasta[1], len(anchos) - 1))]
+
+    def char_at(self, x, y=0):
+        '''Devuelve la posición de cursor (línea, columna) más cercana al punto (x, y), medido en pixeles desde la
+        esquina superior izquierda del área visible del texto'''
+
+        self.__check_layouts()
+        fila = y // self.font.get_linesize()
+        pos = self.__walk(self.__top, max(0, min(fila, self.__area()[1] - 1)))
+        return pos[0], self.__col_at(pos, x)
+
+
+    # DISPOSICION DE LAS LINEAS
+
+    def __area(self):
+        '''Ancho y cantidad de filas completas del área visible, dentro del borde. Es de uso privado'''
+
+        ancho = max(self.get_width() - 2 * self.border.size, 1)
+        filas = max((self.get_height() - 2 * self.border.size) // self.font.get_linesize(), 1)
+        return ancho, filas
+
+    def __check_layouts(self):
+        '''Descarta todas las disposiciones si cambió la fuente o el ancho del control. Es de uso privado'''
+
+        sig = (id(self.font), self.font.version, self.__area()[0])
+        if sig != self.__layouts_sig:
+            self.__layouts = [None] * len(self.__lines)
+            self.__rendered.clear()
+            self.__layouts_sig = sig
+            self.__top = (self.__top[0], 0)
+
+    def __discard(self, inicio, fin, nuevas):
+        '''Reemplaza las disposiciones de las líneas inicio a fin por nuevas líneas todavía sin disponer. Es de uso privado'''
+
+        for d in self.__layouts[inicio:fin]:
+            if d != None:
+                self.__rendered.pop(id(d), None)
+        self.__layouts[inicio:fin] = [None] * nuevas
+
+    def __layout(self, linea):
+        '''Devuelve la disposición de la línea indicada, calculándola si la línea cambió. Las filas se cortan después
+        del último espacio que entra en el ancho del control, o en el último caracter que entra si no hay ninguno. Es de
+        uso privado'''
+
+        disp = self.__layouts[linea]
+        if disp != None:
+            return disp
+
+        texto = self.__lines[linea]
+        ancho = self.__area()[0]
+
+        anchos = [0]
+        for a in self.font.advances(texto):
+            anchos.append(anchos[-1] + a)
+
+        cortes = [0]
+        espacio = -1  # Posición después del último espacio de la fila actual
+        for i in range(len(texto)):
+            while anchos[i+1] - anchos[cortes[-1]] > ancho and i > cortes[-1]:
+                cortes.append(espacio if espacio > cortes[-1] else i)
+            if texto[i] == ' ':
+                espacio = i + 1
+
+        disp = self.__layouts[linea] = [anchos, cortes, {}]
+        return disp
+
+    def __rows(self, linea):
+        '''Cantidad de filas de la línea indicada. Es de uso privado'''
+        return len(self.__layout(linea)[1])
+
+    def __row_text(self, linea, fila):
+        '''Inicio y fin de la fila indicada dentro de su línea. Es de uso privado'''
+
+        cortes = self.__layout(linea)[1]
+        fin = cortes[fila+1] if fila + 1 < len(cortes) else len(self.__lines[linea])
+        return cortes[fila], fin
+
+    def __row_surface(self, linea, fila, color):
+        '''Devuelve la fila indicada renderizada en el color pasado. Las filas renderizadas se guardan en la disposición
+        de la línea, y solo las de las últimas line_cache_size líneas usadas. Es de uso privado'''
+
+        disp = self.__layout(linea)
+        clave = tuple(color)
+
+        filas = disp[2].get(clave)
+        if filas == None:
+            filas = disp[2][clave] = [None] * len(disp[1])
+
+        if filas[fila] == None:
+            inicio, fin = self.__row_text(linea, fila)
+            filas[fila] = self.font.render(self.__lines[linea][inicio:fin], True, color)
+
+        self.__rendered.pop(id(disp), None)  # La paso al final, como la más usada
+        self.__rendered[id(disp)] = disp
+
+        while len(self.__rendered) > self.line_cache_size:
+            self.__rendered.popitem(last=False)[1][2].clear()
+
+        return filas[fila]
+
+    def __next(self, pos):
+        '''Devuelve la fila siguiente a pos = (línea, fila), o None si es la última. Es de uso privado'''
+
+        linea, fila = pos
+        if fila + 1 < self.__rows(linea):
+            return linea, fila + 1
+        if linea + 1 < len(self.__lines):
+            return linea + 1, 0
+        return None
+
+    def __prev(self, pos):
+        '''Devuelve la fila anterior a pos = (línea, fila), o None si es la primera. Es de uso privado'''
+
+        linea, fila = pos
+        if fila > 0:
+            return linea, fila - 1
+        if linea > 0:
+            return linea - 1, self.__rows(linea - 1) - 1
+        return None
+
+    def __walk(self, pos, n):
+        '''Avanza (o retrocede si n es negativo) n filas desde pos, sin pasar de la primera o la última. Es de uso
+        privado'''
+
+        paso = self.__next if n > 0 else self.__prev
+        for i in range(abs(n)):
+            otra = paso(pos)
+            if otra == None:
+                break
+            pos = otra
+        return pos
+
+    def __caret_row(self):
+        '''Devuelve la fila (línea, fila) donde está el cursor. Es de uso privado'''
+
+        cortes = self.__layout(self.__row)[1]
+        return self.__row, bisect.bisect_right(cortes, self.__col) - 1
+
+    def __visible_index(self, pos):
+        '''Devuelve la cantidad de filas entre la primera visible y pos, o None si pos no está en la vista. Es de uso
+        privado'''
+
+        filas = self.__area()[1]
+        actual = self.__top
+        for i in range(filas + 1):
+            if actual == pos:
+                return i
+            actual = self.__next(actual)
+            if actual == None:
+                break
+        return None
+
+    def __col_at(self, pos, x):
+        '''Devuelve la columna más cercana a x, medido en pixeles desde el inicio de la fila pos. Es de uso privado'''
+
+        linea, fila = pos
+        anchos = self.__layout(linea)[0]
+        inicio, fin = self.__row_text(linea, fila)
+        if fin < len(self.__lines[linea]):
+            fin -= 1  # El último límite de una fila partida ya pertenece a la fila siguiente
+
+        x += anchos[inicio]
+        i = bisect.bisect_left(anchos, x, inicio, fin + 1)
+        if i > fin:
+            return fin
+        if i > inicio and x - anchos[i-1] < anchos[i] - x:  # Más cerca del límite anterior
+            return i - 1
+        return i
+
+    def __follow_caret(self):
+        '''Desplaza la vista para que la fila del cursor quede dentro del área visible. Devuelve True si la vista
+        cambió. Es de uso privado'''
+
+        self.__check_layouts()
+
+        top = self.__top
+        if top[0] >= len(self.__lines):
+            top = (len(self.__lines) - 1, 0)
+        top = (top[0], min(top[1], self.__rows(top[0]) - 1))
+
+        cursor = self.__caret_row()
+        if cursor < top:
+            top = cursor
+        else:
+            self.__top = top
+            i = self.__visible_index(cursor)
+            if i == None:
+                top = self.__walk(cursor, 1 - self.__area()[1])  # El cursor queda en la última fila visible
+            elif i == self.__area()[1]:
+                top = self.__next(top)
+
+        cambio = top != self.__top
+        self.__top = top
+        return cambio
+
+    def __scroll_to_caret(self):
+        '''Marca el control para redibujar el cursor. Si el cursor salió del área visible la vista se desplaza y el texto
+        se vuelve a dibujar. Es de uso privado'''
+        if self.__follow_caret():
+            self.invalidate()
+        else:
+            self.mark_dirty()
+
+    def scroll_rows(self, n):
+        '''Desplaza la vista n filas hacia abajo, o hacia arriba si n es negativo, sin mover el cursor'''
+
+        self.__check_layouts()
+        top = self.__walk(self.__top, n)
+        if top != self.__top:
+            self.__top = top
+            self.invalidate()
+
+
+    # EDICION
+
+    def __edit(self, inicio, fin, nuevo):
+        '''Reemplaza el texto entre las posiciones inicio y fin, tuplas (línea, columna), por nuevo. Solo se vuelven a
+        disponer las líneas tocadas. Devuelve la posición al final del texto insertado. Es de uso privado'''
+
+        self.__check_layouts()
+
+        lineas = (self.__lines[inicio[0]][:inicio[1]] + nuevo + self.__lines[fin[0]][fin[1]:]).split('\n')
+        self.__lines[inicio[0]:fin[0]+1] = lineas
+        self.__discard(inicio[0], fin[0] + 1, len(lineas))
+
+        # Las líneas debajo de la edición se corren, la primera visible las sigue
+        linea, fila = self.__top
+        if linea > fin[0]:
+            self.__top = (linea + len(lineas) - (fin[0] - inicio[0] + 1), fila)
+        elif linea > inicio[0]:
+            self.__top = (inicio[0], 0)
+
+        self.invalidate()
+
+        partes = nuevo.split('\n')
+        if len(partes) == 1:
+            return inicio[0], inicio[1] + len(nuevo)
+        return inicio[0] + len(partes) - 1, len(partes[-1])
+
+    def movCursorIzq(self):
+        '''Mueve el cursor un caracter hacia la izquierda, pasando al final de la línea anterior si está al inicio'''
+        if self.__col > 0:
+            self.cursorPos = (self.__row, self.__col - 1)
+        elif self.__row > 0:
+            self.cursorPos = (self.__row - 1, len(self.__lines[self.__row - 1]))
+
+        return self.cursorPos
+
+    def movCursorDer(self):
+        '''Mueve el cursor un caracter hacia la derecha, pasando al inicio de la línea siguiente si está al final'''
+        if self.__col < len(self.__lines[self.__row]):
+            self.cursorPos = (self.__row, self.__col + 1)
+        elif self.__row + 1 < len(self.__lines):
+            self.cursorPos = (self.__row + 1, 0)
+
+        return self.cursorPos
+
+    def movCursorFilas(self, n):
+        '''Mueve el cursor n filas hacia abajo, o hacia arriba si n es negativo, conservando su posición horizontal'''
+
+        self.__check_layouts()
+        actual = self.__caret_row()
+        anchos = self.__layout(self.__row)[0]
+        x = anchos[self.__col] - anchos[self.__row_text(*actual)[0]]
+
+        destino = self.__walk(actual, n)
+        if destino != actual:
+            self.cursorPos = (destino[0], self.__col_at(destino, x))
+
+        return self.cursorPos
+
+    def movCursorArriba(self):
+        '''Mueve el cursor una fila hacia arriba'''
+        return self.movCursorFilas(-1)
+
+    def movCursorAbajo(self):
+        '''Mueve el cursor una fila hacia abajo'''
+        return self.movCursorFilas(1)
+
+    def keydown(self, k=None):
+
+        if self.enable and self.is_focus():
+            esKeyDown = True
+        else:
+            esKeyDown = False
+
+
+        if esKeyDown:
+            cursor = self.cursorPos
+
+            if k.key == pygame.K_LEFT:
+                self.movCursorIzq()
+
+            elif k.key == pygame.K_RIGHT:
+                self.movCursorDer()
+
+            elif k.key == pygame.K_UP:
+                self.movCursorArriba()
+
+            elif k.key == pygame.K_DOWN:
+                self.movCursorAbajo()
+
+            elif k.key == pygame.K_PAGEUP:
+                self.movCursorFilas(-self.__area()[1])
+
+            elif k.key == pygame.K_PAGEDOWN:
+                self.movCursorFilas(self.__area()[1])
+
+            elif k.key == pygame.K_HOME:
+                self.cursorPos = (self.__row, 0)
+
+            elif k.key == pygame.K_END:
+                self.cursorPos = (self.__row, len(self.__lines[self.__row]))
+
+            elif k.key == pygame.K_BACKSPACE:
+                if cursor != (0, 0):
+                    self.movCursorIzq()
+                    self.cursorPos = self.__edit(self.cursorPos, cursor, '')
+
+            elif k.key == pygame.K_DELETE:
+                if self.__col < len(self.__lines[self.__row]):
+                    self.cursorPos = self.__edit(cursor, (self.__row, self.__col + 1), '')
+                elif self.__row + 1 < len(self.__lines):
+                    self.cursorPos = self.__edit(cursor, (self.__row + 1, 0), '')
+
+            elif k.key == pygame.K_RETURN or k.key == pygame.K_KP_ENTER:
+                self.cursorPos = self.__edit(cursor, cursor, '\n')
+
+            else:
+                if k.unicode != '':  # Verifico que lo que se este presionando no sea solo un mods (shift, ctrl, alt)
+                    self.cursorPos = self.__edit(cursor, cursor, k.unicode)
+
+
+        return esKeyDown
+
+
+    # DIBUJADO
+
+    def draw_state(self, estado, superficie):
+        '''Dibuja las filas visibles del texto sobre la superficie del estado indicado'''
+        super(TextBox, self).draw_state(estado, superficie)  # Sin el dibujado de una sola línea del TextBox
+
+        self.__check_layouts()
+        blend_fill(superficie, self.midground.get_color(estado))
+
+        color = self._text_color(estado)
+        alto = self.font.get_linesize()
+        limite = self.get_height() - self.border.size
+
+        pos = self.__top
+        y = self.border.size
+        while pos != None and y < limite:
+            superficie.blit(self.__row_surface(pos[0], pos[1], color), (self.border.size, y))
+            y += alto
+            pos = self.__next(pos)
+
+        # Dibuja el borde del control, que tapa la fila cortada abajo
+        if self.border.show:
+            pygame.draw.rect(superficie, self.border.color, (0,0,self.get_width(),self.get_height()), self.border.size)
+
+    def caret_line(self):
+        '''Devuelve los extremos ((x, y0), (x, y1)) en el display de la línea del cursor, o None si el cursor no se ve'''
+
+        self.__check_layouts()
+        actual = self.__caret_row()
+        i = self.__visible_index(actual)
+        if i == None or i >= self.__area()[1]:
+            return None
+
+        anchos = self.__layout(self.__row)[0]
+        x = self.left + self.border.size + anchos[self.__col] - anchos[self.__row_text(*actual)[0]]
+        y = self.top + self.border.size + i * self.font.get_linesize()
+
+        return (x, y), (x, y + self.font.get_height())
+
+    def click(self, c=None):
+        '''Ubica el cursor en la posición del click. La rueda del mouse desplaza la vista'''
+
+        hover = super(TextBox, self).click(c)  # Sin la ubicación del cursor de una sola línea del TextBox
+
+        if hover and c != None:
+            if c.button == 4:
+                self.scroll_rows(-3)
+            elif c.button == 5:
+                self.scroll_rows(3)
+            else:
+                self.cursorPos = self.char_at(c.pos[0] - self.left - self.border.size,
+                                              c.pos[1] - self.top - self.border.size)
+
+        return hover
+
+
+class ListBox(Control):
+    '''Lista de elementos con una fila por elemento. Recibe un Rect con su tamaño y posición, un nombre que debe ser
+    único y el origen de los datos: una secuencia (lista, tupla, o cualquier objeto con len() e índices) o una función
+    que recibe el índice y devuelve el elemento. Con una función hay que indicar también count, la cantidad de
+    elementos.
+
+    Solo se obtienen y se dibujan los elementos de las filas visibles. Cada fila visible tiene su superficie ya
+    dibujada; al desplazar la vista las filas que siguen a la vista conservan la suya y las que salen la dejan libre
+    para reusarla en las que entran. Así el costo de dibujar o desplazar depende de la altura del control y no de la
+    cantidad de elementos. Si los datos cambian, llamar a update()'''
+
+    def __init__(self, rect, name, source=None, count=None):
+        super(ListBox, self).__init__(rect, name)
+
+        self.__source = source if source != None else []
+        self.__count = count
+        self.__formatter = None
+        self.__row_height = None  # None para usar el alto de línea de la fuente
+        self.__top = 0            # Primera fila visible
+        self.__selected = None    # Índice del elemento seleccionado
+        self.__on_select = None
+
+        self.selection_color = Color.SteelBlue
+        self.selection_text_color = Color.White
+
+        # Superficies de las filas visibles y superficies libres para reusar
+        self.__rows = {}    # índice -> superficie
+        self.__free = []
+        self.__rows_sig = None
+
+
+    # PROPIEDADES
+
+    @property
+    def source(self):
+        '''Origen de los datos: una secuencia o una función que recibe el índice y devuelve el elemento'''
+        return self.__source
+
+    @source.setter
+    def source(self, val):
+        self.__source = val
+        self.__top = 0
+        self.__selected = None
+        self.update()
+
+    @property
+    def count(self):
+        '''Cantidad de elementos. Con una secuencia es su largo, salvo que se asigne otro valor'''
+        if self.__count != None:
+            return self.__count
+        if callable(self.__source):
+            return 0
+        return len(self.__source)
+
+    @count.setter
+    def count(self, val):
+        self.__count = val
+        self.update()
+
+    @property
+    def formatter(self):
+        '''Función que recibe un elemento y devuelve el texto que se muestra. Por defecto se muestra como texto'''
+        return self.__formatter
+
+    @formatter.setter
+    def formatter(self, val):
+        self.__formatter = val
+        self.update()
+
+    @property
+    def row_height(self):
+        '''Alto en pixeles de cada fila. Por defecto es el alto de línea de la fuente'''
+        if self.__row_height == None:
+            return self.font.get_linesize()
+        return self.__row_height
+
+    @row_height.setter
+    def row_height(self, val):
+        self.__row_height = val
+        self.update()
+
+    @property
+    def first_row(self):
+        '''Índice del primer elemento visible'''
+        return self.__top
+
+    @first_row.setter
+    def first_row(self, val):
+        val = max(0, min(val, self.count - self.visible_rows))
+        if val != self.__top:
+            self.__top = val
+            self.invalidate()
+
+    @property
+    def visible_rows(self):
+        '''Cantidad de filas que entran completas en el control. Solo lectura'''
+        return max(self.__area()[1] // self.row_height, 1)
+
+    @property
+    def selected(self):
+        '''Índice del elemento seleccionado, o None'''
+        return self.__selected
+
+    @selected.setter
+    def selected(self, val):
+        if val != None:
+            val = max(0, min(val, self.count - 1)) if self.count > 0 else None
+
+        if val != self.__selected:
+            self.__drop_row(self.__selected)
+            self.__drop_row(val)
+            self.__selected = val
+            self.invalidate()
+
+            if val != None:
+                self.ensure_visible(val)
+            if self.__on_select != None:
+                self.__on_select(val)
+
+    @property
+    def selected_item(self):
+        '''Elemento seleccionado, o None. Solo lectura'''
+        if self.__selected == None:
+            return None
+        return self.get_item(self.__selected)
+
+    @property
+    def on_select(self):
+        '''Función que recibe el índice seleccionado cada vez que cambia la selección'''
+        return self.__on_select
+
+    @on_select.setter
+    def on_select(self, val):
+        self.__on_select = val
+
+
+    # DATOS
+
+    def get_item(self, indice):
+        '''Devuelve el elemento del índice pasado'''
+        if callable(self.__source):
+            return self.__source(indice)
+        return self.__source[indice]
+
+    def format(self, item):
+        '''Devuelve el texto con el que se muestra el elemento pasado'''
+        if self.__formatter != None:
+            return self.__formatter(item)
+        return '%s' % (item,)
+
+    def ensure_visible(self, indice):
+        '''Desplaza la vista lo mínimo necesario para que se vea el elemento del índice pasado'''
+        if indice < self.__top:
+            self.first_row = indice
+        elif indice >= self.__top + self.visible_rows:
+            self.first_row = indice - self.visible_rows + 1
+
+    def scroll_rows(self, n):
+        '''Desplaza la vista n filas hacia abajo, o hacia arriba si n es negativo, sin cambiar la selección'''
+        self.first_row = self.__top + n
+
+    def index_at(self, pos):
+        '''Devuelve el índice del elemento que está en la posición pos del display, o None si no hay ninguno'''
+
+        x, y = pos[0] - self.left - self.border.size, pos[1] - self.rows_y()
+        ancho, alto = self.__area()
+        if x < 0 or x >= ancho or y < 0 or y >= alto:
+            return None
+
+        indice = self.__top + y // self.row_height
+        return indice if indice < self.count else None
+
+    def rows_y(self):
+        '''Posición Y en el display donde empieza la primera fila'''
+        return self.top + self.border.size + self.header_height()
+
+
+    # FILAS
+
+    def __area(self):
+        '''Ancho y alto en pixeles del área de las filas, dentro del borde y debajo del encabezado. Es de uso privado'''
+        return (max(self.get_width() - 2 * self.border.size, 1),
+                max(self.get_height() - 2 * self.border.size - self.header_height(), 1))
+
+    def __drop_row(self, indice):
+        '''Deja libre la superficie de la fila pasada, para que se vuelva a dibujar. Es de uso privado'''
+        sup = self.__rows.pop(indice, None)
+        if sup != None:
+            self.__free.append(sup)
+
+    def refresh_row(self, indice):
+        '''Vuelve a dibujar la fila indicada en el próximo render, por ejemplo si cambió su elemento o si una clase
+        derivada cambia cómo la dibuja. Las demás filas conservan sus superficies'''
+        self.__drop_row(indice)
+        self.mark_dirty()
+
+    def __recycle(self, primero, ultimo):
+        '''Deja libres las superficies de las filas que quedaron fuera de la vista, y todas si cambió algo que afecta a
+        todas las filas (fuente, tamaño, colores). Es de uso privado'''
+
+        sig = (id(self.font), self.font.version, self.__area()[0], self.row_height,
+               tuple(self.selection_color), tuple(self.selection_text_color))
+
+        if sig != self.__rows_sig:
+            self.__rows = {}
+            self.__free = []  # Las superficies libres pueden tener otro tamaño
+            self.__rows_sig = sig
+            return
+
+        for indice in [i for i in self.__rows if i < primero or i >= ultimo]:
+            self.__free.append(self.__rows.pop(indice))
+
+    def __row(self, indice):
+        '''Devuelve la superficie de la fila pasada, dibujándola en una superficie libre si no la tenía. Es de uso
+        privado'''
+
+        sup = self.__rows.get(indice)
+        if sup == None:
+            if self.__free:
+                sup = self.__free.pop()
+            else:
+                sup = pygame.Surface((self.__area()[0], self.row_height), pygame.SRCALPHA)
+
+            seleccionada = indice == self.__selected
+            sup.fill(self.selection_color if seleccionada else Color.Transparent)
+            self.draw_row(indice, self.get_item(indice), sup, seleccionada)
+            self.__rows[indice] = sup
+
+        return sup
+
+    def header_height(self):
+        '''Alto del encabezado, que se dibuja arriba de las filas. La lista no tiene encabezado'''
+        return 0
+
+    def draw_header(self, superficie):
+        '''Dibuja el encabezado en la superficie pasada, que tiene el ancho del área de las filas. Las clases derivadas
+        con encabezado deben extender este método'''
+        pass
+
+    def draw_row(self, indice, item, superficie, seleccionada):
+        '''Dibuja el elemento item en la superficie de su fila, que ya tiene el fondo. Las clases derivadas pueden
+        extender este método para dibujar las filas de otra forma'''
+
+        color = self.selection_text_color if seleccionada else self.font.color
+        texto = self.font.render(self.format(item), True, color)
+        superficie.blit(texto, (2, (superficie.get_height() - texto.get_height()) // 2))
+
+
+    # DIBUJADO
+
+    def update(self):
+        '''Vuelve a obtener y dibujar los elementos visibles. Llamarlo cuando cambian los datos'''
+
+        self.__rows_sig = None
+        self.__top = max(0, min(self.__top, self.count - self.visible_rows))
+        if self.__selected != None and self.__selected >= self.count:
+            self.__selected = None
+        super(ListBox, self).update()
+
+    def draw_state(self, estado, superficie):
+        '''Dibuja el encabezado y las filas visibles sobre el fondo'''
+
+        super(ListBox, self).draw_state(estado, superficie)
+
+        b = self.border.size
+        ancho, alto = self.__area()
+        encabezado = self.header_height()
+        if encabezado:
+            self.draw_header(superficie.subsurface((b, b, ancho, encabezado)))
+
+        # Solo se recorren las filas visibles, incluida la última aunque se vea en parte
+        alto_fila = self.row_height
+        primero = self.__top
+        ultimo = min(self.count, primero + (alto + alto_fila - 1) // alto_fila)
+        self.__recycle(primero, ultimo)
+
+        area = superficie.subsurface((b, b + encabezado, ancho, alto))
+        for i in range(primero, ultimo):
+            area.blit(self.__row(i), (0, (i - primero) * alto_fila))
+
+        # Dibuja el borde del control sobre las filas
+        if self.border.show:
+            pygame.draw.rect(superficie, self.border.color, (0, 0, self.get_width(), self.get_height()), b)
+
+
+    # EVENTOS
 
     def click(self, boton=None):
-        '''Establece el valor del control según donde se hizo click. Si es sobre la línea central
-        posiciona el cursor allí y establece el valor. Si es sobre el cursor inicia una operación
-        de arrastrar para posicionarlo y establecer el valor'''
+        '''Selecciona el elemento bajo el mouse. La rueda del mouse desplaza la vista'''
+
+        hover = super(ListBox, self).click(boton)
+
+        if hover and self.enable and boton != None:
+            if boton.button == 4:
+                self.scroll_rows(-3)
+            elif boton.button == 5:
+                self.scroll_rows(3)
+            elif boton.button == 1:
+                indice = self.index_at(boton.pos)
+                if indice != None:
+                    self.selected = indice
+
+        return hover
+
+    def keydown(self, k=None):
+        '''Las flechas mueven la selección de a un elemento, RePág y AvPág de a una vista, Inicio y Fin van al primero
+        y al último'''
+
+        if not (self.enable and self.is_focus()) or self.count == 0:
+            return False
+
+        actual = self.__selected
+        if k.key == pygame.K_UP:
+            nuevo = 0 if actual == None else actual - 1
+        elif k.key == pygame.K_DOWN:
+            nuevo = 0 if actual == None else actual + 1
+        elif k.key == pygame.K_PAGEUP:
+            nuevo = 0 if actual == None else actual - self.visible_rows
+        elif k.key == pygame.K_PAGEDOWN:
+            nuevo = 0 if actual == None else actual + self.visible_rows
+        elif k.key == pygame.K_HOME:
+            nuevo = 0
+        elif k.key == pygame.K_END:
+            nuevo = self.count - 1
+        else:
+            return False
+
+        self.selected = max(0, nuevo)
+        return True
+
+
+class DataGrid(ListBox):
+    '''Tabla con un encabezado y una columna por campo. Recibe lo mismo que ListBox y además columns, una lista de
+    tuplas (título, ancho en pixeles). Cada elemento es una secuencia con un valor por columna.
+
+    TAB y SHIFT+TAB recorren las celdas de la fila seleccionada; desde la última (o la primera) pasan el foco al
+    control siguiente (o al anterior)'''
+
+    def __init__(self, rect, name, columns, source=None, count=None):
+        super(DataGrid, self).__init__(rect, name, source, count)
+
+        self.__columns = list(columns)
+        self.__column = 0  # Columna de la celda actual
+        self.header_color = Color.Gainsboro
+
+    @property
+    def columns(self):
+        '''Lista de tuplas (título, ancho en pixeles) de las columnas'''
+        return list(self.__columns)
+
+    @columns.setter
+    def columns(self, val):
+        self.__columns = list(val)
+        self.__column = min(self.__column, max(len(self.__columns) - 1, 0))
+        self.update()
+
+    @property
+    def column(self):
+        '''Índice de la columna de la celda actual'''
+        return self.__column
+
+    @column.setter
+    def column(self, val):
+        val = max(0, min(val, len(self.__columns) - 1))
+        if val != self.__column:
+            self.__column = val
+
+            # La celda actual se marca en la fila seleccionada, la única que se vuelve a dibujar
+            self.refresh_row(self.selected)
+            self.invalidate()
+
+    def header_height(self):
+        '''El encabezado tiene el alto de una fila'''
+        return self.row_height
+
+    def draw_header(self, superficie):
+        '''Dibuja los títulos de las columnas'''
+
+        superficie.fill(self.header_color)
+        x = 0
+        for titulo, ancho in self.__columns:
+            texto = self.font.render(titulo, True, self.font.color)
+            superficie.blit(texto, (x + 2, (superficie.get_height() - texto.get_height()) // 2))
+            x += ancho
+            pygame.draw.line(superficie, self.border.color, (x - 1, 0), (x - 1, superficie.get_height()))
+
+    def draw_row(self, indice, item, superficie, seleccionada):
+        '''Dibuja cada valor del elemento en su columna, y marca la celda actual en la fila seleccionada'''
+
+        color = self.selection_text_color if seleccionada else self.font.color
+        alto = superficie.get_height()
+        x = 0
+        for j, (titulo, ancho) in enumerate(self.__columns):
+            if j < len(item):
+                texto = self.font.render(self.format(item[j]), True, color)
+                superficie.blit(texto, (x + 2, (alto - texto.get_height()) // 2),
+                                (0, 0, max(ancho - 4, 0), texto.get_height()))
+            if seleccionada and j == self.__column:
+                pygame.draw.rect(superficie, color, (x, 0, ancho, alto), 1)
+            x += ancho
+
+    def change_focus(self, dir=None):
+        '''Con una fila seleccionada el foco recorre sus celdas antes de pasar al control siguiente o al anterior'''
+
+        if self.selected == None or not self.__columns:
+            return super(DataGrid, self).change_focus(dir)
+
+        ultima = len(self.__columns) - 1
+        if dir == None:
+            if ultima == 0:
+                return D_PREVNEXT
+            if self.__column == 0:
+                return D_PREV
+            return D_NEXT if self.__column == ultima else D_KEEP
+
+        if dir == D_NEXT and self.__column < ultima:
+            self.column = self.__column + 1
+            return False
+        if dir == D_PREV and self.__column > 0:
+            self.column = self.__column - 1
+            return False
+
+        return True
+
+    def keydown(self, k=None):
+        '''Además de las teclas de ListBox, izquierda y derecha cambian la celda actual'''
+
+        if self.enable and self.is_focus() and k.key in (pygame.K_LEFT, pygame.K_RIGHT):
+            self.column = self.__column + (1 if k.key == pygame.K_RIGHT else -1)
+            return True
+
+        return super(DataGrid, self).keydown(k)
+
+
+class Panel(Control):
+    '''Contenedor de controles. Los controles hijos se agregan con su posición relativa al panel y se mueven con él.
+
+    El panel dibuja todos sus hijos en una superficie propia, que solo se vuelve a componer cuando el panel o alguno de
+    sus hijos cambió. Mientras nada cambia, dibujar el panel es un solo blit, sin importar cuántos hijos tenga. Lo que
+    los hijos dibujan encima (foco, cursores) se dibuja en cada frame, recortado al panel.
+
+    Para los hijos el panel hace de pantalla: les entrega el estado del mouse, los clicks que caen sobre ellos y el foco,
+    y recibe sus avisos con el mismo protocolo de contenedor que Screen. Si algún hijo puede recibir el foco, el panel también puede; TAB y SHIFT+TAB recorren sus hijos antes de pasar al
+    control siguiente de la pantalla'''
+
+    __checks = {}    # clase -> True si tiene sus propios motivos para redibujarse (redefine is_dirty)
+
+    def __init__(self, rect, name):
+        super(Panel, self).__init__(rect, name)
+
+        self.__children = []    # Hijos en orden Z: el último se dibuja encima de los demás
+        self.__names = {}       # nombre -> hijo
+        self.__focus = None     # Hijo que tiene el foco mientras el panel lo tiene
+        self.__cache = None     # Superficie con el panel y sus hijos ya dibujados
+        self.__cache_base = None
+        self.__stale = True     # Algún hijo cambió desde la última composición
+        self.__mouse = None     # Estado del mouse de la última revisión completa de los hijos
+
+        # Un panel no se resalta con el mouse y solo recibe el foco si algún hijo puede recibirlo
+        col = self.background.normal_color
+        self.background.hover_color = col
+        self.background.down_color = col
+        self.focusable = False
+
+    @property
+    def pos(self):
+        '''Posición del panel. Al cambiarla se mueven también los hijos'''
+        return Control.pos.fget(self)
+
+    @pos.setter
+    def pos(self, val):
+        dx, dy = val[0] - self.left, val[1] - self.top
+        Control.pos.fset(self, val)
+
+        for hijo in self.__children:
+            hijo.pos = (hijo.left + dx, hijo.top + dy)
+
+
+    # MANEJO DE LOS HIJOS
+
+    def addControl(self, control):
+        '''Agrega el control pasado al panel. Su posición se toma como relativa al panel'''
+
+        if control.name in self.__names:
+            raise controlExistente(control.name)
+        if control.screen != None:
+            raise screenAsignada(control.name)
 
+        self.__children.append(control)
+        self.__names[control.name] = control
+        control._set_container(self)
+        control.pos = (self.left + control.left, self.top + control.top)
 
-        esta_encima = self.is_hover()
-        pos = pygame.mouse.get_pos()
-                   
-        if esta_encima:
-            if self.enable:
-                if self.enableFocus:
-                    ControlBase.OnFocus = self
+        if control.focusable and not self.focusable:
+            self.focusable = True
+        self.mark_dirty()
 
-            if esta_encima == 1:  # sobre el cursor
-                self._arrastrar = True
+    def addControls(self, *controles):
+        '''Agrega los controles pasados al panel'''
 
-            elif esta_encima == 2:  # Sobre la linea
-                if self.orientation == O_HORIZONTAL:
-                    self.value = ((self.maxValue-self.minValue+1)*(pos[0]-self.left)/self.width)+self.minValue
-                
-                elif self.orientation == O_VERTICAL:
-                    self.value = self.minValue + (pygame.mouse.get_pos()[1]-self.top-self.height)*(self.maxValue-self.minValue)/(-1*self.height)
+        if len(controles)==0:  # Si no paso ningún control lanzo una excepción
+            raise TypeError('addControls() takes at least 1 argument (0 given)')
 
+        for control in controles:
+            self.addControl(control)
+
+    def removeControl(self, name):
+        '''Quita del panel el control de nombre name y lo devuelve. Su posición vuelve a ser relativa al panel'''
+
+        if name not in self.__names:
+            raise controlInexistente(name)
+
+        c = self.__names.pop(name)
+        self.__children.remove(c)
+        c.pos = (c.left - self.left, c.top - self.top)
+        c._set_container(None)
+
+        if c is self.__focus:
+            self.__focus = None
+        c.stop_animations()
+        self.mark_dirty()
+
+        return c
+
+    def get_controls(self):
+        '''Devuelve una lista con los hijos del panel, en orden Z (de atrás hacia adelante)'''
+        return list(self.__children)
+
+    def get_control(self, name, raiseErr=True):
+        '''Devuelve el hijo indicado en name. Si no existe y raiseErr=True lanza una excepcion, de lo contrario devuelve
+        None'''
+
+        if name in self.__names:
+            return self.__names[name]
+        if raiseErr:
+            raise controlInexistente(name)
+        return None
+
+    def control_at(self, point):
+        '''Devuelve el hijo visible de más arriba que contiene el punto pasado, o None'''
+
+        if not self.get_rect().collidepoint(point):
+            return None
+
+        for hijo in reversed(self.__children):
+            if hijo.visible and hijo.get_rect().collidepoint(point):
+                return hijo
+
+        return None
+
+    def child_pos(self, control):
+        '''Devuelve la posición del hijo pasado relativa al panel'''
+        return (control.left - self.left, control.top - self.top)
+
+
+    # PANTALLA DE LOS HIJOS
+
+    @property
+    def input(self):
+        '''Estado del mouse del frame actual, el de la pantalla del panel. Solo lectura'''
+        return self.get_input()
+
+    @property
+    def focus_border(self):
+        '''Borde del hijo que tiene el foco, el de la pantalla del panel. Solo lectura'''
+        if self.screen != None:
+            return self.screen.focus_border
+        return Border()
+
+    def capture_mouse(self, control):
+        '''Captura el mouse para el hijo pasado (ver Screen.capture_mouse)'''
+        if self.screen != None:
+            self.screen.capture_mouse(control)
+
+    def release_mouse(self):
+        '''Termina la captura del mouse sin avisar al control'''
+        if self.screen != None:
+            self.screen.release_mouse()
+
+    def get_focus(self):
+        '''Devuelve el hijo que tiene el foco, o None si el panel no lo tiene. Cuando el panel recibe el foco sin que
+        se haya indicado un hijo, lo toma el primero'''
+
+        if self.screen == None or self.screen.get_focus() is not self:
+            return None
+
+        if self.__focus == None:
+            hijos = self.__focusables()
+            if hijos:
+                self.__focus = hijos[0]
+                self.__focus.mark_dirty()
+
+        return self.__focus
+
+    def set_focus(self, control):
+        '''Pone el foco en el hijo pasado, y en el panel dentro de su pantalla'''
+
+        if control != None and control.focusable and control.enable:
+            self.__move_focus(control)
+            if self.screen != None:
+                self.screen.set_focus(self)
+
+    def __move_focus(self, control):
+        '''Cambia el hijo que tiene el foco, marcando como sucios el que lo pierde y el que lo gana. Es de uso
+        privado'''
+
+        if control is not self.__focus:
+            if self.__focus != None:
+                self.__focus.mark_dirty()
+                self.__focus.stop_animations()
+            if control != None:
+                control.mark_dirty()
+            self.__focus = control
+
+    def __focusables(self):
+        '''Hijos que pueden recibir el foco, ordenados por focusOrder. Es de uso privado'''
+
+        hijos = [(h.focusOrder, i, h) for i, h in enumerate(self.__children) if h.focusable and h.enable and h.visible]
+        hijos.sort(key=lambda t: t[:2])
+        return [h for o, i, h in hijos]
+
+    def stop_animations(self):
+        '''Detiene las animaciones de los hijos, por ejemplo cuando el panel pierde el foco'''
+        for hijo in self.__children:
+            hijo.stop_animations()
+
+    def _reindex(self, control):
+        '''Lo llaman los hijos cuando cambian su posición o su visibilidad (protocolo de contenedor, ver Screen)'''
+        self.mark_dirty()
+
+    def _refocus(self, control):
+        '''Lo llaman los hijos cuando cambian focusable o enable (protocolo de contenedor, ver Screen)'''
+        if control is self.__focus and not (control.focusable and control.enable):
+            self.__move_focus(None)
+        if control.focusable and not self.focusable:
+            self.focusable = True
+
+    def _reorder(self, control, viejo):
+        '''Lo llaman los hijos cuando cambia su focusOrder (protocolo de contenedor, ver Screen). El panel calcula el
+        orden al recorrer el foco'''
+        pass
+
+
+    # VERIFICACIONES
+
+    @staticmethod
+    def __own_checks(cls):
+        '''Devuelve True si los controles de la clase pasada redefinen is_dirty(). Es de uso privado'''
+
+        propio = Panel.__checks.get(cls)
+        if propio == None:
+            propio = False
+            for k in cls.__mro__:
+                if 'is_dirty' in k.__dict__:
+                    propio = k is not Control
+                    break
+            Panel.__checks[cls] = propio
+
+        return propio
+
+    def is_dirty(self):
+        '''El panel está sucio si cambió él o cualquiera de sus hijos. El estado visual de los hijos (normal, hover,
+        down) solo puede cambiar si cambió el mouse, así que mientras el mouse está quieto solo se revisa si los hijos
+        cambiaron (has_changed: marcas de sucio, capas, borde y fuente) y los hijos con motivos propios para
+        redibujarse (cursores, otros paneles)'''
+
+        if super(Panel, self).is_dirty():
+            return True
+        if self.__stale:
+            return True
+
+        entrada = self.get_input()
+        mouse = (entrada.pos, entrada.buttons)
+
+        if mouse != self.__mouse:
+            self.__mouse = mouse
+            for hijo in self.__children:
+                if hijo.is_dirty():
+                    self.__stale = True
+                    break
         else:
-            ControlBase.OnFocus = None
-            
-        return esta_encima
+            for hijo in self.__children:
+                if hijo.has_changed() or (Panel.__own_checks(type(hijo)) and hijo.is_dirty()):
+                    self.__stale = True
+                    break
+
+        return self.__stale
+
+    def change_focus(self, dir=None):
+        '''Recorre los hijos que pueden recibir el foco. Desde el último (o el primero) deja pasar el foco al control
+        siguiente (o al anterior) de la pantalla'''
+
+        hijos = self.__focusables()
+        if not hijos:
+            return super(Panel, self).change_focus(dir)
+
+        actual = self.get_focus()
+        i = hijos.index(actual) if actual in hijos else -1
 
+        if dir == None:
+            if len(hijos) == 1:
+                return D_PREVNEXT
+            if i <= 0:
+                return D_PREV
+            return D_NEXT if i == len(hijos) - 1 else D_KEEP
 
+        # El hijo puede tener elementos propios que reciben el foco antes
+        if actual != None and not actual.change_focus(dir):
+            return False
 
+        j = i + 1 if dir == D_NEXT else i - 1
+        if 0 <= j < len(hijos):
+            self.__move_focus(hijos[j])
+            return False
 
+        self.__move_focus(None)
+        return True
+
+
+    # DIBUJADO
+
+    def update(self):
+        '''Actualiza el panel y todos sus hijos'''
 
+        super(Panel, self).update()
+        for hijo in self.__children:
+            hijo.update()
 
+    def get_blit(self):
+        '''Devuelve la superficie con el panel y sus hijos ya dibujados. Solo se vuelve a componer si algo cambió'''
 
+        cambio = self.is_dirty() or self.__cache == None
+        item = super(Panel, self).get_blit()
+        if item == None:
+            return None
 
+        base = item[0]
+        if cambio or base is not self.__cache_base:
+            if self.__cache == None or self.__cache.get_size() != self.size:
+                self.__cache = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
 
+            self.__cache.fill(Color.Transparent)
+            self.__cache.blit(base, (0, 0))
+            self.__cache_base = base
 
+            for hijo in self.__children:
+                sub = hijo.get_blit()
+                if sub != None:
+                    self.__cache.blit(sub[0], (sub[1][0] - self.left, sub[1][1] - self.top))
 
+            self.__stale = False
 
+        return self.__cache, self.pos
 
+    def has_overlay(self):
+        '''El panel dibuja encima si tiene el foco o si alguno de sus hijos dibuja algo encima'''
 
+        if self.is_focus():
+            return True
+        for hijo in self.__children:
+            if hijo.visible and hijo.has_overlay():
+                return True
+        return False
 
+    def render_overlay(self, display):
+        '''Dibuja lo que los hijos dibujan encima (foco, cursores), recortado al panel. El foco del panel solo se
+        dibuja si no lo tiene ninguno de sus hijos'''
+
+        enfocado = self.get_focus()
+        if enfocado == None:
+            super(Panel, self).render_overlay(display)
+
+        clip = display.get_clip()
+        display.set_clip(clip.clip(self.get_rect()))
+
+        for hijo in self.__children:
+            if hijo.visible and hijo.has_overlay():
+                hijo.render_overlay(display)
+
+        display.set_clip(clip)
+
+
+    # EVENTOS
+
+    def click(self, boton=None):
+        '''Entrega el click al hijo que está bajo el mouse. Si no hay ninguno lo recibe el panel'''
 
+        pos = boton.pos if boton != None else self.get_input().pos
+        hijo = self.control_at(pos)
+        if hijo != None:
+            return hijo.click(boton) or 1
 
+        return super(Panel, self).click(boton)
 
-        # Inicializo las superficies del control
-        self.background.normal_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.hover_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.down_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
-        self.background.disable_image = pygame.Surface(self.size, pygame.HWSURFACE|pygame.SRCALPHA)
+    def keydown(self, k=None):
+        '''Entrega la tecla al hijo que tiene el foco'''
 
-        # Limpio los background
-        self.background.normal_image.fill(self.background.normal_color)
-        self.background.hover_image.fill(self.background.hover_color)
-        self.background.down_image.fill(self.background.down_color)
-        self.background.disable_image.fill(self.background.disable_color)
-     
\ No newline at end of file
+        hijo = self.get_focus()
+        if hijo != None:
+            return hijo.keydown(k)
+        return False
@@ -1,22 +1,66 @@
 #! /usr/bin/env python
 #-*- coding: UTF-8 -*-
+import os
+import json
 import pygame
 import random
+import threading
+import weakref
+from collections import OrderedDict
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 from locales import *
 
 '''Funciones y clases utilizadas como herramientas'''
 
+# Contador de cambios de todos los Border, Layer y Font (ver style_epoch)
+_epoch = [0]
+
+def touch_style():
+    '''Registra que cambió algún Border, Layer o Font. Lo llaman esas clases cada vez que incrementan su versión'''
+    _epoch[0] += 1
+
+def style_epoch():
+    '''Devuelve un contador que aumenta con cada cambio de cualquier Border, Layer o Font. Mientras no cambia, ningún
+    control pudo cambiar el aspecto de sus capas, su borde ni su fuente, y no hace falta comparar sus versiones'''
+    return _epoch[0]
+
+
 class Border(object):
     """Clase destinada a definir los bordes de los objetos."""
 
     def __init__(self):
     
+        object.__setattr__(self, 'version', 0)
         self.color = Color.Blue
         self.size = 3
         self.style = S_SOLID
         self.show = True
         
 
+    def __setattr__(self, name, val):
+        if self.__dict__.get('frozen'):
+            raise AttributeError('El borde es compartido por un tema y no puede modificarse. Asignar una copia (copy())')
+
+        # Cada cambio incrementa la version, asi los controles saben cuando regenerar sus superficies
+        object.__setattr__(self, name, val)
+        object.__setattr__(self, 'version', self.version + 1)
+        touch_style()
+
+    def freeze(self):
+        '''Impide modificar el borde. Lo usan los temas para los bordes compartidos por muchos controles'''
+        object.__setattr__(self, 'frozen', True)
+
+    def copy(self):
+        '''Devuelve una copia modificable del borde'''
+        nuevo = Border()
+        for k, v in self.__dict__.items():
+            if k not in ('version', 'frozen'):
+                setattr(nuevo, k, v)
+        return nuevo
+
     def draw(self, surface):
         '''Dibuja el borde de la superficie pasada'''
 
@@ -30,10 +74,16 @@ class Border(object):
 
 
 class Layer(object):
-    '''Clase para definir las capas de los controles y sus variaciones'''
+    '''Clase para definir las capas de los controles y sus variaciones.
+
+    Los atributos normal_image, hover_image, down_image y disable_image son imágenes que pone el usuario y que se
+    dibujan cuando la capa es de tipo T_IMAGE. Antes update() los llenaba con la capa ya dibujada de cada estado;
+    ahora el control dibuja todas las capas juntas en una sola superficie por estado, que se obtiene con
+    Control.get_surface(estado)'''
 
     def __init__(self):
 
+        object.__setattr__(self, 'version', 0)
         self.type = T_DRAW
 
         self.normal_color = Color.Silver
@@ -45,9 +95,65 @@ class Layer(object):
         self.down_image = None
         self.disable_image = None
 
+    def __setattr__(self, name, val):
+        if self.__dict__.get('frozen'):
+            raise AttributeError('La capa es compartida por un tema y no puede modificarse. Asignar una copia (copy())')
+
+        # Cada cambio incrementa la version, asi los controles saben cuando regenerar sus superficies
+        object.__setattr__(self, name, val)
+        object.__setattr__(self, 'version', self.version + 1)
+        touch_style()
+
+    def freeze(self):
+        '''Impide modificar la capa. Lo usan los temas para las capas compartidas por muchos controles'''
+        object.__setattr__(self, 'frozen', True)
+
+    def copy(self):
+        '''Devuelve una copia modificable de la capa'''
+        nueva = Layer()
+        for k, v in self.__dict__.items():
+            if k not in ('version', 'frozen'):
+                setattr(nueva, k, v)
+        return nueva
+
+    def get_color(self, estado):
+        '''Devuelve el color de la capa para el estado indicado (ST_NORMAL, ST_HOVER, ST_DOWN o ST_DISABLE)'''
+        if estado == ST_DISABLE:
+            return self.disable_color
+        if estado == ST_DOWN:
+            return self.down_color
+        if estado == ST_HOVER:
+            return self.hover_color
+        return self.normal_color
+
+    def get_image(self, estado):
+        '''Devuelve la imagen de la capa para el estado indicado (ST_NORMAL, ST_HOVER, ST_DOWN o ST_DISABLE)'''
+        if estado == ST_DISABLE:
+            return self.disable_image
+        if estado == ST_DOWN:
+            return self.down_image
+        if estado == ST_HOVER:
+            return self.hover_image
+        return self.normal_image
+
+
+def blend_fill(surface, color):
+    '''Pinta toda la superficie con el color pasado, mezclándolo con lo que ya tiene según su transparencia'''
+
+    alfa = 255 if len(color) < 4 else color[3]
+
+    if alfa == 255:
+        surface.fill(color)
+    elif alfa > 0:
+        capa = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        capa.fill(color)
+        surface.blit(capa, (0, 0))
+
 
 class Font(object):
-    '''Clase para definir las fuentes'''
+    '''Clase para definir las fuentes. Las fuentes de pygame se obtienen de una cache compartida por todas las
+    instancias, con clave (nombre, tamaño, negrita, cursiva), así que crear muchos objetos Font iguales es barato.
+    El color no forma parte de la fuente, es solo el color por defecto que se usa en render().'''
 
     pygame.font.init()
 
@@ -57,25 +163,126 @@ class Font(object):
               'Large' : 60,
               'Scanner' : 30}
 
+    # Cache de fuentes cargadas. Cuando se supera cache_size se descarta la usada hace más tiempo
+    __cache = OrderedDict()
+    cache_size = 32
+
+    # Cache de textos renderizados, compartida por todos los controles. Se limita por memoria (bytes de pixeles)
+    __text_cache = OrderedDict()
+    __text_cache_used = 0
+    __text_hits = 0
+    __text_misses = 0
+    text_cache_bytes = 8 * 1024 * 1024
+
+    # Máximo de caracteres que advances() mide juntos de una palabra sin espacios
+    word_size = 32
+
+
+    @staticmethod
+    def get_font(name, size, bold=False, italic=False):
+        '''Devuelve el objeto pygame.font.Font con las características pedidas, cargándolo solo si no está en la cache'''
+
+        key = (name, size, bold, italic)
+        fuente = Font.__cache.pop(key, None)
+
+        if fuente == None:
+            fuente = pygame.font.SysFont(name, size, bold, italic)
+
+            while len(Font.__cache) >= Font.cache_size:
+                Font.__cache.popitem(last=False)  # Descarto la menos usada
+
+        Font.__cache[key] = fuente  # Queda al final como la más reciente
+        return fuente
+
+    @staticmethod
+    def clear_cache():
+        '''Vacía la cache de fuentes'''
+        Font.__cache.clear()
+
+    @staticmethod
+    def clear_text_cache():
+        '''Vacía la cache de textos renderizados y reinicia sus contadores'''
+        Font.__text_cache.clear()
+        Font.__text_cache_used = 0
+        Font.__text_hits = 0
+        Font.__text_misses = 0
+
+    @staticmethod
+    def text_cache_info():
+        '''Devuelve un diccionario con el estado de la cache de textos renderizados: aciertos (hits), fallos (misses),
+        cantidad de superficies guardadas (entries), memoria usada (bytes) y memoria máxima (max_bytes)'''
+        return {'hits': Font.__text_hits,
+                'misses': Font.__text_misses,
+                'entries': len(Font.__text_cache),
+                'bytes': Font.__text_cache_used,
+                'max_bytes': Font.text_cache_bytes}
+
+
     def set_fontsize(self,v):
-    	'''Devuelve una fuente con el tamaño especificado'''
-        return pygame.font.SysFont(self.__name, v)
+        '''Devuelve una fuente con el tamaño especificado'''
+        return Font.get_font(self.__name, v, self.__bold, self.__italic)
 
     def get_fontsize(self):
         '''Devuelve el tamaño de la fuente actual'''
         return self.__size
 
 
-    def __init__(self, size='Default', color=(0,0,0) ):
-    	self.__name = 'Verdana'
-    	self.__color = color
+    def __init__(self, size='Default', color=(0,0,0), bold=False, italic=False):
+        self.__name = 'Verdana'
+        self.__color = color
+        self.__bold = bold
+        self.__italic = italic
+        self.__version = 0
+        self.__frozen = False
 
         if size in Font.__size.keys():
             self.__size = Font.__size[size]
         else:
             self.__size = size
 
-    	self.__font = self.set_fontsize(self.__size)
+        self.__font = self.set_fontsize(self.__size)
+
+    def __reload(self):
+        '''Obtiene de la cache la fuente que corresponde a las propiedades actuales. Es de uso privado'''
+        self.__font = self.set_fontsize(self.__size)
+        self.__version += 1
+        touch_style()
+
+    def __check(self):
+        '''Lanza AttributeError si la fuente está congelada. Es de uso privado'''
+        if self.__frozen:
+            raise AttributeError('La fuente es compartida por un tema y no puede modificarse. Asignar una copia (copy())')
+
+    def freeze(self):
+        '''Impide modificar la fuente. Lo usan los temas para las fuentes compartidas por muchos controles'''
+        self.__frozen = True
+
+    @property
+    def frozen(self):
+        '''True si la fuente fue congelada por un tema. Solo lectura'''
+        return self.__frozen
+
+    def copy(self):
+        '''Devuelve una copia modificable de la fuente'''
+        nueva = Font(self.__size, self.__color, self.__bold, self.__italic)
+        if nueva.name != self.__name:
+            nueva.name = self.__name
+        return nueva
+
+    def __become(self, otra):
+        '''Toma todas las propiedades de la fuente otra, aunque esté congelada. Lo usan los temas al cambiar de hoja de
+        estilos. Es de uso privado'''
+        self.__name = otra.__name
+        self.__size = otra.__size
+        self.__bold = otra.__bold
+        self.__italic = otra.__italic
+        self.__color = otra.__color
+        self.__reload()
+
+    @property
+    def version(self):
+        '''Se incrementa cada vez que cambia una propiedad de la fuente. Solo lectura'''
+        return self.__version
 
     @property
     def name(self):
@@ -85,33 +292,932 @@ class Font(object):
     
     @name.setter
     def name(self, val):
+        self.__check()
         self.__name = val
+        self.__reload()
+    
+    @property
+    def bold(self):
+        '''Indica si la fuente es negrita'''
+        return self.__bold
+    
+    
+    @bold.setter
+    def bold(self, val):
+        self.__check()
+        self.__bold = val
+        self.__reload()
+
+    @property
+    def italic(self):
+        '''Indica si la fuente es cursiva'''
+        return self.__italic
+    
     
+    @italic.setter
+    def italic(self, val):
+        self.__check()
+        self.__italic = val
+        self.__reload()
     
 
     @property
     def color(self):
-        '''Color de la fuente. Si no se especifica se utiliza color negro'''
+        '''Color por defecto del texto. Si no se especifica se utiliza color negro'''
         return self.__color
     
     
     @color.setter
     def color(self, val):
+        self.__check()
         self.__color = val
+        self.__version += 1
+        touch_style()
 
 
     def render(self, text, antialias, color=None):
-    	'''Devuelve una superficie con el texto dibujado en ella'''
-    	if color == None:
-    		color = self.color
-    	
-    	return self.__font.render(text, antialias, color)
+        '''Devuelve una superficie con el texto dibujado en ella. Si no se pasa color se usa el de la fuente.
+        La superficie se guarda en una cache compartida, por lo que no debe modificarse, solo dibujarse.'''
+        if color == None:
+            color = self.color
+
+        key = (self.__name, self.__size, self.__bold, self.__italic, text, tuple(color), bool(antialias))
+        sup = Font.__text_cache.pop(key, None)
+
+        if sup != None:
+            Font.__text_hits += 1
+        else:
+            Font.__text_misses += 1
+            sup = self.__font.render(text, antialias, color)
+
+            tam = sup.get_width() * sup.get_height() * sup.get_bytesize()
+            if tam > Font.text_cache_bytes:
+                return sup  # Demasiado grande para la cache
+
+            Font.__text_cache_used += tam
+            while Font.__text_cache_used > Font.text_cache_bytes:
+                k, viejo = Font.__text_cache.popitem(last=False)  # Descarto el usado hace más tiempo
+                Font.__text_cache_used -= viejo.get_width() * viejo.get_height() * viejo.get_bytesize()
+
+        Font.__text_cache[key] = sup  # Queda al final como el más reciente
+        return sup
 
     def size(self, texto):
-    	'''Dimensiones que tendrá la imagen renderizada del texto pasado'''
-    	return self.__font.size(texto) 
+        '''Dimensiones que tendrá la imagen renderizada del texto pasado'''
+        return self.__font.size(texto) 
+
+    def get_height(self):
+        '''Alto en pixeles de una línea de texto'''
+        return self.__font.get_height()
+
+    def get_linesize(self):
+        '''Separación en pixeles recomendada entre líneas de texto. Alcanza para los trazos que bajan de la línea'''
+        return self.__font.get_linesize()
+
+    def advances(self, texto):
+        '''Devuelve una lista con el avance horizontal en pixeles de cada caracter del texto. El texto se mide por
+        palabras (cada una con el espacio que la sigue, ver words): la suma de los avances hasta un caracter es
+        size() del tramo de la palabra hasta ese caracter, así que incluye el kerning entre sus letras. Las palabras
+        de más de word_size caracteres se miden en tramos de ese largo'''
+
+        avances = []
+        for inicio, fin in self.words(texto):
+            anterior = 0
+            for k in range(inicio + 1, fin + 1):
+                ancho = self.__font.size(texto[inicio:k])[0]
+                avances.append(ancho - anterior)
+                anterior = ancho
+
+        return avances
+
+    @staticmethod
+    def words(texto, inicio=0):
+        '''Generador de los tramos (inicio, fin) en que advances() mide el texto a partir de inicio, que debe ser el
+        comienzo de un tramo. Cada tramo termina después de un espacio o a los word_size caracteres'''
+
+        while inicio < len(texto):
+            fin = texto.find(' ', inicio, inicio + Font.word_size)
+            fin = min(len(texto), inicio + Font.word_size) if fin == -1 else fin + 1
+            yield inicio, fin
+            inicio = fin
+
+    @staticmethod
+    def word_start(texto, pos):
+        '''Devuelve el comienzo del tramo de medición (ver words) que contiene la posición pos del texto'''
+
+        palabra = texto.rfind(' ', 0, pos) + 1
+        return palabra + (pos - palabra) // Font.word_size * Font.word_size
     
 
+class InputState(object):
+    '''Estado del mouse tomado una sola vez por frame. Los controles lo consultan en lugar de llamar a pygame.mouse
+    cada uno por su cuenta, así todos ven la misma posición y los mismos botones durante el frame.'''
+
+    def __init__(self):
+        self.pos = (-1, -1)
+        self.buttons = (False, False, False)
+        self.fresh = False   # True si se tomó en el frame actual y todavía no se usó para dibujar
+        self.frame = 0
+
+    def snapshot(self):
+        '''Lee el estado del mouse desde pygame'''
+        self.pos = pygame.mouse.get_pos()
+        self.buttons = tuple(pygame.mouse.get_pressed()[:3])
+        self.fresh = True
+        self.frame += 1
+
+    def update(self, event):
+        '''Actualiza el estado con la información de un evento de mouse, sin consultar a pygame'''
+        if hasattr(event, 'pos'):
+            self.pos = event.pos
+        if hasattr(event, 'buttons'):
+            self.buttons = tuple(event.buttons[:3])
+
+        # Los eventos de botón no traen buttons: se actualiza solo el botón del evento (la rueda no cuenta)
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and getattr(event, 'button', 0) in (1, 2, 3):
+            botones = list(self.buttons)
+            botones[event.button - 1] = event.type == pygame.MOUSEBUTTONDOWN
+            self.buttons = tuple(botones)
+
+    @property
+    def pressed(self):
+        '''Entero con los botones presionados: Left = 1, Right = 2, Middle = 4, sumados si hay más de uno'''
+        return int(self.buttons[0]) + int(self.buttons[1])*2 + int(self.buttons[2])*4
+
+
+class ImageCache(object):
+    '''Cache de imágenes cargadas desde archivo, compartida por todo el programa. La clave es (ruta, fecha de
+    modificación, tamaño), así que si el archivo cambia se vuelve a cargar, y cada tamaño al que se ajusta una imagen
+    se guarda por separado. Las imágenes se convierten una sola vez al formato del display (si ya hay uno creado) para
+    que dibujarlas sea lo más rápido posible. Se limita por memoria: al superar cache_bytes se descartan las usadas
+    hace más tiempo. Las superficies son compartidas, por lo que no deben modificarse, solo dibujarse.
+
+    Con load_async() la decodificación y el escalado se hacen en segundo plano, en un grupo de workers hilos. Las
+    imágenes terminadas se convierten y se entregan en el hilo principal al llamar a poll(), que Screen.render() llama
+    en cada frame.'''
+
+    __cache = OrderedDict()  # clave -> [superficie, convertida al formato del display]
+    __used = 0
+    __hits = 0
+    __misses = 0
+    cache_bytes = 64 * 1024 * 1024
+
+    # Carga en segundo plano
+    workers = 2
+    __threads = []
+    __jobs = queue.Queue()     # Claves a cargar
+    __done = queue.Queue()     # (clave, superficie o None si falló) ya cargadas, todavía sin convertir
+    __waiting = {}             # clave -> funciones a llamar cuando termine la carga
+
+
+    @staticmethod
+    def __bytes(sup):
+        '''Memoria que ocupan los pixeles de la superficie. Es de uso privado'''
+        return sup.get_width() * sup.get_height() * sup.get_bytesize()
+
+    @staticmethod
+    def __display_format(sup):
+        '''Devuelve [superficie, convertida]: la superficie convertida al formato del display y True, o la misma
+        superficie y False si todavía no hay display. Es de uso privado'''
+
+        if pygame.display.get_surface() == None:
+            return [sup, False]
+
+        if sup.get_flags() & pygame.SRCALPHA:
+            return [sup.convert_alpha(), True]
+        return [sup.convert(), True]
+
+    @staticmethod
+    def __convert(entrada):
+        '''Convierte la superficie de la entrada al formato del display, si existe y todavía no se convirtió. Es de uso
+        privado'''
+
+        if entrada[1]:
+            return
+
+        viejo = ImageCache.__bytes(entrada[0])
+        entrada[:] = ImageCache.__display_format(entrada[0])
+        ImageCache.__used += ImageCache.__bytes(entrada[0]) - viejo
+
+    @staticmethod
+    def __store(key, sup):
+        '''Guarda la superficie en la cache, descartando las usadas hace más tiempo si no alcanza la memoria. Es de uso
+        privado'''
+
+        entrada = [sup, False]
+        ImageCache.__convert(entrada)
+
+        tam = ImageCache.__bytes(entrada[0])
+        if tam <= ImageCache.cache_bytes:
+            ImageCache.__used += tam
+            while ImageCache.__used > ImageCache.cache_bytes:
+                k, viejo = ImageCache.__cache.popitem(last=False)  # Descarto la usada hace más tiempo
+                ImageCache.__used -= ImageCache.__bytes(viejo[0])
+            ImageCache.__cache[key] = entrada
+
+        return entrada[0]
+
+    @staticmethod
+    def scale(sup, size, mode=F_STRETCH, smooth=True):
+        '''Devuelve una copia de la superficie ajustada al tamaño pasado según mode: F_STRETCH la estira al tamaño
+        exacto, F_FIT la achica o agranda sin deformarla hasta que entra completa y F_FILL sin deformarla hasta cubrir
+        todo el tamaño, recortando lo que sobra. Con smooth usa smoothscale si el formato lo permite'''
+
+        ancho, alto = size
+        imgWidth, imgHeight = sup.get_size()
+        if imgWidth == 0 or imgHeight == 0:
+            return sup.copy()
+
+        destino = (ancho, alto)
+        if mode == F_FIT or mode == F_FILL:
+            escalas = (ancho / float(imgWidth), alto / float(imgHeight))
+            f = min(escalas) if mode == F_FIT else max(escalas)
+            destino = (max(1, int(round(imgWidth * f))), max(1, int(round(imgHeight * f))))
+
+        if smooth and sup.get_bitsize() in (24, 32):
+            nueva = pygame.transform.smoothscale(sup, destino)
+        else:
+            nueva = pygame.transform.scale(sup, destino)
+
+        if mode == F_FILL and destino != (ancho, alto):
+            recorte = pygame.Rect(0, 0, min(ancho, destino[0]), min(alto, destino[1]))
+            recorte.center = (destino[0] // 2, destino[1] // 2)
+            nueva = nueva.subsurface(recorte).copy()
+
+        return nueva
+
+    @staticmethod
+    def __key(path, size, mode, smooth, mtime=os.path.getmtime):
+        '''Clave de la cache para el archivo y el ajuste pasados. Es de uso privado'''
+        ruta = os.path.abspath(path)
+        return (ruta, mtime(ruta), None if size == None else (tuple(size), mode, bool(smooth)))
+
+    @staticmethod
+    def __get(key):
+        '''Devuelve la superficie guardada con la clave pasada, o None si no está. Es de uso privado'''
+
+        entrada = ImageCache.__cache.pop(key, None)
+        if entrada == None:
+            return None
+
+        ImageCache.__hits += 1
+        ImageCache.__convert(entrada)  # Por si se cargó antes de crear el display
+        ImageCache.__cache[key] = entrada  # Queda al final como la más reciente
+        return entrada[0]
+
+    @staticmethod
+    def load(path, size=None, mode=F_STRETCH, smooth=True):
+        '''Devuelve la imagen del archivo path, cargándola solo si no está en la cache o si el archivo cambió. Si se
+        pasa size, se devuelve la imagen ajustada a ese tamaño con mode y smooth (ver scale), calculada a partir de la
+        imagen original'''
+
+        key = ImageCache.__key(path, size, mode, smooth)
+        ruta = key[0]
+
+        sup = ImageCache.__get(key)
+        if sup != None:
+            return sup
+
+        ImageCache.__misses += 1
+        if size == None:
+            sup = pygame.image.load(ruta)
+        else:
+            sup = ImageCache.scale(ImageCache.load(ruta), *key[2])
+
+        return ImageCache.__store(key, sup)
+
+    @staticmethod
+    def load_async(path, callback, size=None, mode=F_STRETCH, smooth=True):
+        '''Pide la imagen del archivo path (ajustada como en load() si se pasa size) sin bloquear. Si ya está en la
+        cache la devuelve directamente y no llama a callback. Si no, devuelve None, la carga en segundo plano y al
+        terminar llama a callback con la superficie, o con None si no se pudo cargar, desde poll() en el hilo principal'''
+
+        try:
+            key = ImageCache.__key(path, size, mode, smooth)
+        except (IOError, OSError):
+            # El archivo no existe o no se puede leer: el error se entrega al callback desde poll(), como cualquier
+            # otra carga que falla, y no en quien hizo el pedido
+            key = ImageCache.__key(path, size, mode, smooth, lambda ruta: None)
+            ImageCache.__waiting.setdefault(key, []).append(callback)
+            ImageCache.__done.put((key, None))
+            return None
+
+        sup = ImageCache.__get(key)
+        if sup != None:
+            return sup
+
+        if key in ImageCache.__waiting:
+            ImageCache.__waiting[key].append(callback)  # Ya se está cargando
+            return None
+
+        ImageCache.__misses += 1
+        ImageCache.__waiting[key] = [callback]
+        ImageCache.__jobs.put(key)
+
+        # Los hilos se crean recién con el primer pedido
+        while len(ImageCache.__threads) < ImageCache.workers:
+            hilo = threading.Thread(target=ImageCache.__work)
+            hilo.daemon = True
+            hilo.start()
+            ImageCache.__threads.append(hilo)
+
+        return None
+
+    @staticmethod
+    def __work():
+        '''Bucle de los hilos de carga: decodifica y escala las imágenes pedidas. La conversión al formato del display
+        usa el display, que no puede tocarse fuera del hilo principal, así que la hace poll(). Es de uso privado'''
+
+        while True:
+            key = ImageCache.__jobs.get()
+            try:
+                sup = pygame.image.load(key[0])
+                if key[2] != None:
+                    sup = ImageCache.scale(sup, *key[2])
+            except (pygame.error, IOError, OSError, ValueError):
+                sup = None
+            ImageCache.__done.put((key, sup))
+
+    @staticmethod
+    def pending():
+        '''Cantidad de imágenes pedidas con load_async() que todavía no se entregaron'''
+        return len(ImageCache.__waiting)
+
+    @staticmethod
+    def poll():
+        '''Convierte al formato del display y guarda en la cache las imágenes que terminaron de cargarse en segundo
+        plano, y llama a sus callbacks. Debe llamarse desde el hilo principal. Devuelve la cantidad de imágenes
+        entregadas'''
+
+        entregadas = 0
+        while True:
+            try:
+                key, sup = ImageCache.__done.get_nowait()
+            except queue.Empty:
+                return entregadas
+
+            if sup != None:
+                sup = ImageCache.__store(key, sup)
+
+            for callback in ImageCache.__waiting.pop(key, []):
+                callback(sup)
+            entregadas += 1
+
+    @staticmethod
+    def clear():
+        '''Vacía la cache de imágenes y reinicia sus contadores'''
+        ImageCache.__cache.clear()
+        ImageCache.__used = 0
+        ImageCache.__hits = 0
+        ImageCache.__misses = 0
+
+    @staticmethod
+    def info():
+        '''Devuelve un diccionario con el estado de la cache de imágenes: aciertos (hits), fallos (misses), cantidad de
+        superficies guardadas (entries), memoria usada (bytes) y memoria máxima (max_bytes)'''
+        return {'hits': ImageCache.__hits,
+                'misses': ImageCache.__misses,
+                'entries': len(ImageCache.__cache),
+                'bytes': ImageCache.__used,
+                'max_bytes': ImageCache.cache_bytes}
+
+
+class Tween(object):
+    '''Animación de un atributo desde su valor actual hasta un valor final. Se crea con Animator.tween()'''
+
+    def __init__(self, target, attr, end, duration, easing, on_done, inicio):
+        self.target = target
+        self.attr = attr
+        self.end = end
+        self.duration = max(duration, 1)
+        self.easing = easing
+        self.on_done = on_done
+        self.begin = inicio     # Momento de inicio, en ms del reloj de Animator
+        self.start = Animator.get_attr(target, attr)
+        self.done = False
+
+    def cancel(self):
+        '''Detiene la animación dejando el atributo en el valor que tiene'''
+        self.done = True
+
+    def step(self, ahora):
+        '''Asigna el valor que corresponde al momento ahora. Devuelve True si la animación terminó'''
+
+        t = min((ahora - self.begin) / float(self.duration), 1.0)
+        if t < 0:
+            return False
+
+        Animator.set_attr(self.target, self.attr, Animator.interpolate(self.start, self.end, self.easing(t)))
+        return t >= 1.0
+
+
+class Timer(object):
+    '''Llamado a una función después de un tiempo, una sola vez o repetido. Se crea con Animator.timer()'''
+
+    def __init__(self, delay, callback, repeat, inicio):
+        self.delay = max(delay, 1)
+        self.callback = callback
+        self.repeat = repeat
+        self.due = inicio + self.delay  # Momento del próximo llamado, en ms del reloj de Animator
+        self.done = False
+
+    def cancel(self):
+        '''Cancela los llamados pendientes'''
+        self.done = True
+
+
+class Blink(object):
+    '''Ciclo de parpadeo compartido: on se alterna cada period milisegundos. Se obtiene con Animator.blink(), así todos
+    los que parpadean con el mismo período lo hacen juntos. Los controles que se registran con watch() se marcan como
+    sucios en cada cambio, y mientras haya alguno registrado el ciclo cuenta como activo para Animator.next_event()'''
+
+    def __init__(self, period, inicio):
+        self.period = max(period, 1)
+        self.epoch = inicio
+        self.on = True
+        self.__watchers = weakref.WeakKeyDictionary()
+
+    def watch(self, control):
+        '''Registra el control para marcarlo como sucio en cada cambio del parpadeo'''
+        self.__watchers[control] = True
+
+    def unwatch(self, control):
+        '''Deja de marcar el control en cada cambio'''
+        self.__watchers.pop(control, None)
+
+    @property
+    def watched(self):
+        '''True si hay algún control registrado. Solo lectura'''
+        return len(self.__watchers) > 0
+
+    def restart(self):
+        '''Vuelve a empezar el ciclo encendido, por ejemplo al escribir para que el cursor se vea'''
+        self.epoch = Animator.now()
+        self.__set(True)
+
+    def next_toggle(self):
+        '''Momento, en ms del reloj de Animator, del próximo cambio'''
+        return self.epoch + ((Animator.now() - self.epoch) // self.period + 1) * self.period
+
+    def step(self, ahora):
+        '''Actualiza el estado para el momento ahora'''
+        self.__set(((ahora - self.epoch) // self.period) % 2 == 0)
+
+    def __set(self, on):
+        '''Cambia el estado y marca los controles registrados. Es de uso privado'''
+        if on != self.on:
+            self.on = on
+            for control in list(self.__watchers.keys()):
+                control.mark_dirty()
+
+
+class Animator(object):
+    '''Planificador de animaciones, compartido por todo el programa. Lleva un único reloj de frames: tick(), que
+    Screen.render() llama al comenzar cada frame, toma la hora una sola vez y con ella avanza las animaciones de
+    atributos (tween), los llamados diferidos (timer) y los ciclos de parpadeo (blink). Las animaciones asignan los
+    valores con los setters de los controles, así que solo quedan sucios los controles animados.
+
+    next_event() indica cuánto falta para que haga falta otro frame, y wait() duerme hasta entonces o hasta que llegue
+    un evento, así el programa no usa CPU mientras no hay nada que animar.'''
+
+    __now = 0
+    __tweens = []
+    __timers = []
+    __blinks = {}   # período -> Blink
+
+    # FUNCIONES DE SUAVIZADO: reciben y devuelven un valor entre 0 y 1
+
+    @staticmethod
+    def linear(t):
+        '''Velocidad constante'''
+        return t
+
+    @staticmethod
+    def ease_in(t):
+        '''Empieza despacio y acelera'''
+        return t * t
+
+    @staticmethod
+    def ease_out(t):
+        '''Empieza rápido y frena'''
+        return t * (2 - t)
+
+    @staticmethod
+    def ease_in_out(t):
+        '''Acelera hasta la mitad y después frena'''
+        return 2 * t * t if t < 0.5 else -1 + (4 - 2 * t) * t
+
+    # ATRIBUTOS
+
+    @staticmethod
+    def get_attr(target, attr):
+        '''Devuelve el atributo attr de target. attr puede ser un camino con puntos, como background.normal_color'''
+        for nombre in attr.split('.'):
+            target = getattr(target, nombre)
+        return target
+
+    @staticmethod
+    def set_attr(target, attr, valor):
+        '''Asigna el atributo attr de target, que puede ser un camino con puntos. Si target es un control se marca como
+        sucio, ya que un cambio en un objeto interno (una capa, un borde) no pasa por sus setters. Si en el camino hay
+        un objeto congelado por un tema (una capa, un borde o una fuente compartidos) se reemplaza por una copia
+        propia antes de modificarlo, así la animación no cambia a los demás controles del tema'''
+
+        nombres = attr.split('.')
+        objeto = target
+        for nombre in nombres[:-1]:
+            interno = getattr(objeto, nombre)
+            if getattr(interno, 'frozen', False):
+                interno = interno.copy()
+                setattr(objeto, nombre, interno)
+            objeto = interno
+        setattr(objeto, nombres[-1], valor)
+
+        if objeto is not target and hasattr(target, 'mark_dirty'):
+            target.mark_dirty()
+
+    @staticmethod
+    def interpolate(inicio, fin, t):
+        '''Valor entre inicio y fin para la proporción t. Los números y las secuencias (posiciones, colores) se
+        interpolan elemento a elemento; los enteros se mantienen enteros'''
+
+        if isinstance(inicio, (tuple, list, pygame.Color)):
+            return tuple(Animator.interpolate(a, b, t) for a, b in zip(inicio, fin))
+
+        valor = inicio + (fin - inicio) * t
+        if isinstance(inicio, int) and isinstance(fin, int):
+            return int(round(valor))
+        return valor
+
+    # RELOJ
+
+    @staticmethod
+    def __clock():
+        '''Hora actual en ms. Es de uso privado'''
+        return pygame.time.get_ticks()
+
+    @staticmethod
+    def now():
+        '''Hora del frame actual en ms, la que tomó el último tick()'''
+        return Animator.__now
+
+    @staticmethod
+    def tick(ahora=None):
+        '''Avanza todas las animaciones a la hora actual (o a la pasada en ahora, en ms). Se llama una vez por frame.
+        Devuelve True si queda alguna animación de atributos en curso.
+
+        Si una animación o un llamado lanza una excepción, se da por terminado (aunque sea un timer repetido) y la
+        excepción sigue hacia quien llamó a tick(); las demás continúan en el próximo frame'''
+
+        Animator.__now = ahora = Animator.__clock() if ahora == None else ahora
+
+        if Animator.__tweens:
+            actual = None
+            try:
+                for tw in Animator.__tweens:  # Los tweens creados en on_done se agregan al final y se recorren también
+                    actual = tw
+                    if not tw.done and tw.step(ahora):
+                        tw.done = True
+                        if tw.on_done != None:
+                            tw.on_done()
+                actual = None
+            finally:
+                if actual != None:
+                    actual.done = True  # Falló: no se vuelve a intentar en cada frame
+                Animator.__tweens = [tw for tw in Animator.__tweens if not tw.done]
+
+        if Animator.__timers:
+            actual = None
+            try:
+                for tm in [tm for tm in Animator.__timers if not tm.done and tm.due <= ahora]:
+                    actual = tm
+                    if tm.repeat:
+                        tm.due = max(tm.due + tm.delay, ahora)
+                    else:
+                        tm.done = True
+                    tm.callback()
+                actual = None
+            finally:
+                if actual != None:
+                    actual.done = True
+                Animator.__timers = [tm for tm in Animator.__timers if not tm.done]
+
+        for bl in Animator.__blinks.values():
+            bl.step(ahora)
+
+        return len(Animator.__tweens) > 0
+
+    # ANIMACIONES
+
+    @staticmethod
+    def tween(target, attr, end, duration, easing=None, on_done=None):
+        '''Anima el atributo attr de target desde su valor actual hasta end en duration milisegundos. easing es una
+        función de suavizado (por defecto linear) y on_done una función a llamar al terminar. Si el atributo ya se
+        estaba animando, esa animación se reemplaza. Devuelve el objeto Tween, que se puede cancelar'''
+
+        for tw in Animator.__tweens:
+            if tw.target is target and tw.attr == attr:
+                tw.cancel()
+
+        tw = Tween(target, attr, end, duration, easing or Animator.linear, on_done, Animator.__clock())
+        Animator.__tweens.append(tw)
+        return tw
+
+    @staticmethod
+    def timer(delay, callback, repeat=False):
+        '''Llama a callback dentro de delay milisegundos, o cada delay milisegundos si repeat es True. Devuelve el
+        objeto Timer, que se puede cancelar'''
+
+        tm = Timer(delay, callback, repeat, Animator.__clock())
+        Animator.__timers.append(tm)
+        return tm
+
+    @staticmethod
+    def blink(period):
+        '''Devuelve el ciclo de parpadeo compartido de period milisegundos'''
+
+        bl = Animator.__blinks.get(period)
+        if bl == None:
+            bl = Animator.__blinks[period] = Blink(period, Animator.__now)
+        return bl
+
+    @staticmethod
+    def animating():
+        '''True si hay alguna animación de atributos en curso, que necesita un frame tras otro'''
+        return any(not tw.done for tw in Animator.__tweens)
+
+    @staticmethod
+    def clear():
+        '''Cancela todas las animaciones y llamados pendientes'''
+        for tw in Animator.__tweens:
+            tw.done = True
+        for tm in Animator.__timers:
+            tm.done = True
+        Animator.__tweens = []
+        Animator.__timers = []
+        Animator.__blinks = {}
+
+    # ESPERA
+
+    @staticmethod
+    def next_event():
+        '''Milisegundos que faltan hasta que alguna animación necesite un frame: 0 si hay animaciones en curso, el
+        tiempo hasta el próximo timer o cambio de un parpadeo observado, o None si no hay nada pendiente'''
+
+        if Animator.animating():
+            return 0
+
+        momentos = [tm.due for tm in Animator.__timers if not tm.done]
+        momentos += [bl.next_toggle() for bl in Animator.__blinks.values() if bl.watched]
+        if not momentos:
+            return None
+
+        return max(min(momentos) - Animator.__clock(), 0)
+
+    @staticmethod
+    def wait(timeout=None):
+        '''Duerme hasta que llegue un evento o alguna animación necesite un frame, lo que pase primero, sin superar
+        timeout milisegundos si se indica. Devuelve la lista de eventos recibidos, para pasarla a
+        Screen.process_events()'''
+
+        espera = Animator.next_event()
+        if timeout != None:
+            espera = timeout if espera == None else min(espera, timeout)
+
+        eventos = pygame.event.get()
+        if eventos or espera == 0:
+            return eventos
+
+        try:
+            evento = pygame.event.wait(espera) if espera != None else pygame.event.wait()
+        except TypeError:  # pygame anterior a 2.0: wait() no acepta un tiempo máximo
+            if espera == None:
+                evento = pygame.event.wait()
+            else:
+                pygame.time.wait(espera)
+                return pygame.event.get()
+
+        if evento.type == pygame.NOEVENT:
+            return []
+        return [evento] + pygame.event.get()
+
+
+class Atlas(object):
+    '''Atlas de texturas: junta muchas imágenes chicas (íconos, imágenes de las capas) en una o pocas superficies
+    grandes, las páginas. Cada imagen registrada con add() se obtiene con get() como una subsuperficie de su página,
+    así que dibujarla es dibujar un rectángulo de la página y todas comparten la misma memoria y formato.
+
+    Las imágenes se acomodan por estantes: ordenadas de la más alta a la más baja, cada una va en el estante donde
+    menos alto sobra, o en un estante nuevo, o en una página nueva cuando la actual se llena. El atlas armado se
+    guarda con save() y se lee con load(), así al iniciar no hace falta volver a acomodarlo. stale() indica si
+    cambió alguno de los archivos de los que se cargaron las imágenes.
+
+    Uso:
+        atlas = Atlas()
+        atlas.add('ok', 'iconos/ok.png')
+        boton.background.normal_image = atlas.get('ok')'''
+
+    def __init__(self, page_size=(1024, 1024), padding=1):
+        self.__page_size = tuple(page_size)
+        self.__padding = padding          # Pixeles libres alrededor de cada imagen
+        self.__sources = OrderedDict()    # nombre -> [superficie, (ruta, fecha de modificación) o None]
+        self.__pages = []
+        self.__rects = {}                 # nombre -> (página, pygame.Rect)
+        self.__images = {}                # nombre -> subsuperficie de la página
+        self.__built = False
+
+    @property
+    def page_size(self):
+        '''Tamaño máximo de cada página. Solo lectura'''
+        return self.__page_size
+
+    @property
+    def pages(self):
+        '''Lista con las superficies de las páginas. Solo lectura'''
+        if not self.__built:
+            self.build()
+        return list(self.__pages)
+
+    def names(self):
+        '''Lista con los nombres de las imágenes registradas'''
+        return list(self.__sources.keys())
+
+    def __contains__(self, name):
+        return name in self.__sources
+
+    def add(self, name, image):
+        '''Registra una imagen con el nombre pasado. image puede ser una superficie o la ruta de un archivo. El atlas
+        se vuelve a armar la próxima vez que se pida una imagen'''
+
+        origen = None
+        if not isinstance(image, pygame.Surface):
+            ruta = os.path.abspath(image)
+            origen = (ruta, os.path.getmtime(ruta))
+            image = pygame.image.load(ruta)
+
+        p = 2 * self.__padding
+        if image.get_width() + p > self.__page_size[0] or image.get_height() + p > self.__page_size[1]:
+            raise ValueError('La imagen %s no entra en una página de %dx%d' % ((name,) + self.__page_size))
+
+        self.__sources[name] = [image, origen]
+        self.__built = False
+
+    def remove(self, name):
+        '''Quita del atlas la imagen del nombre pasado'''
+        del self.__sources[name]
+        self.__built = False
+
+    def __pack(self):
+        '''Calcula la página y el rectángulo de cada imagen. Devuelve el tamaño usado de cada página y un
+        diccionario nombre -> (página, Rect). Es de uso privado'''
+
+        ancho, alto = self.__page_size
+        p = self.__padding
+        orden = sorted(self.__sources.keys(),
+                       key=lambda n: (-self.__sources[n][0].get_height(), -self.__sources[n][0].get_width()))
+
+        paginas = []  # Por página: [estantes [y, alto, x libre], alto usado, ancho usado]
+        rects = {}
+        for nombre in orden:
+            w, h = self.__sources[nombre][0].get_size()
+            w, h = w + 2 * p, h + 2 * p
+
+            lugar = None
+            for i, (estantes, usado, maximo) in enumerate(paginas):
+                # El estante donde menos alto sobra
+                libres = [e for e in estantes if e[1] >= h and e[2] + w <= ancho]
+                if libres:
+                    lugar = i, min(libres, key=lambda e: e[1] - h)
+                    break
+                if usado + h <= alto:
+                    estante = [usado, h, 0]
+                    estantes.append(estante)
+                    paginas[i][1] += h
+                    lugar = i, estante
+                    break
+
+            if lugar == None:
+                estante = [0, h, 0]
+                paginas.append([[estante], h, 0])
+                lugar = len(paginas) - 1, estante
+
+            i, estante = lugar
+            rects[nombre] = (i, pygame.Rect(estante[2] + p, estante[0] + p, w - 2 * p, h - 2 * p))
+            estante[2] += w
+            paginas[i][2] = max(paginas[i][2], estante[2])
+
+        return [(max(pag[2], 1), max(pag[1], 1)) for pag in paginas], rects
+
+    def __publish(self, paginas, rects):
+        '''Convierte las páginas al formato del display, si existe, y crea las subsuperficies. Es de uso privado'''
+
+        if pygame.display.get_surface() != None:
+            paginas = [pag.convert_alpha() for pag in paginas]
+
+        self.__pages = paginas
+        self.__rects = rects
+        self.__images = dict((n, paginas[i].subsurface(r)) for n, (i, r) in rects.items())
+        self.__built = True
+
+    def build(self):
+        '''Acomoda todas las imágenes registradas en las páginas del atlas'''
+
+        tamanios, rects = self.__pack()
+
+        paginas = []
+        for tam in tamanios:
+            pag = pygame.Surface(tam, pygame.SRCALPHA)
+            pag.fill(Color.Transparent)
+            paginas.append(pag)
+
+        for nombre, (i, r) in rects.items():
+            img = self.__sources[nombre][0]
+            if img.get_colorkey() != None and pygame.display.get_surface() != None:
+                img = img.convert_alpha()  # El color transparente pasa a ser transparencia por pixel
+
+            if img.get_flags() & pygame.SRCALPHA:
+                paginas[i].blit(img, r, special_flags=pygame.BLEND_RGBA_MAX)  # Copia exacta, con su transparencia
+            else:
+                paginas[i].blit(img, r)  # Respeta el color transparente (colorkey), si tiene
+
+        viejas = self.__pages
+        self.__publish(paginas, rects)
+
+        # Las imágenes que venían de las páginas anteriores (un atlas leído con load) pasan a las nuevas
+        for nombre, entrada in self.__sources.items():
+            if any(entrada[0].get_parent() is pag for pag in viejas):
+                entrada[0] = self.__images[nombre]
+
+    def get(self, name):
+        '''Devuelve la imagen del nombre pasado, como subsuperficie de su página. Siempre devuelve el mismo objeto
+        mientras no se vuelva a armar el atlas'''
+
+        if not self.__built:
+            self.build()
+        return self.__images[name]
+
+    def rect_of(self, name):
+        '''Devuelve una tupla (número de página, Rect) con la ubicación de la imagen del nombre pasado'''
+
+        if not self.__built:
+            self.build()
+        i, r = self.__rects[name]
+        return i, r.copy()
+
+    def stale(self):
+        '''Devuelve True si cambió o ya no existe alguno de los archivos de los que se cargaron las imágenes'''
+
+        for imagen, origen in self.__sources.values():
+            if origen != None:
+                if not os.path.exists(origen[0]) or os.path.getmtime(origen[0]) != origen[1]:
+                    return True
+        return False
+
+    def save(self, path):
+        '''Guarda el atlas: un índice JSON en path y cada página como PNG al lado, con el mismo nombre terminado en
+        _0.png, _1.png, etc.'''
+
+        if not self.__built:
+            self.build()
+
+        base = os.path.splitext(path)[0]
+        archivos = []
+        for i, pag in enumerate(self.__pages):
+            archivo = '%s_%d.png' % (base, i)
+            pygame.image.save(pag, archivo)
+            archivos.append(os.path.basename(archivo))
+
+        indice = {'page_size': list(self.__page_size),
+                  'padding': self.__padding,
+                  'pages': archivos,
+                  'images': dict((n, [i, r.x, r.y, r.w, r.h]) for n, (i, r) in self.__rects.items()),
+                  'sources': dict((n, list(o)) for n, (s, o) in self.__sources.items() if o != None)}
+
+        with open(path, 'w') as f:
+            json.dump(indice, f, indent=1, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        '''Devuelve el atlas guardado con save() en path, sin volver a acomodar las imágenes'''
+
+        with open(path) as f:
+            indice = json.load(f)
+
+        carpeta = os.path.dirname(os.path.abspath(path))
+        atlas = Atlas(indice['page_size'], indice['padding'])
+
+        paginas = [pygame.image.load(os.path.join(carpeta, archivo)) for archivo in indice['pages']]
+        rects = dict((n, (v[0], pygame.Rect(v[1:]))) for n, v in indice['images'].items())
+        atlas.__publish(paginas, rects)
+
+        # Las imágenes de origen pasan a ser las del atlas, por si se agregan otras y hay que volver a armarlo
+        for nombre in sorted(rects.keys()):
+            origen = indice['sources'].get(nombre)
+            atlas.__sources[nombre] = [atlas.__images[nombre], tuple(origen) if origen != None else None]
+
+        return atlas
+
+
 class Color(object):
 
     # Color Variables
@@ -154,7 +1260,6 @@ class Color(object):
     # Orange Shades
     Orange = (255, 150, 0)
     LightOrange = (255, 200, 0)
-    DarkOrange = (255, 100, 0)
     Salmon = (250, 128, 114)
     Tomato = (255, 99, 71)
     DarkSalmon = (233,150,122)
@@ -310,7 +1415,7 @@ class Color(object):
     Black,    Fog,    DimGray,    Gray,    Mist,
     Silver,    LightGray,    Gainsboro,    WhiteSmoke,    White,
     Red,    Blood,    Maroon,    DarkRed,    Brown,    RedBrown,    Mud,    Firebrick,    IndianRed,    LightCoral,    RosyBrown,    MistyRose,
-    Orange,    LightOrange,    DarkOrange,    Salmon,    Tomato,    DarkSalmon,    Coral,    OrangeRed,    LightSalmon,    Sienna,    SeaShell,    Chocolate,    SaddleBrown,    SandyBrown,    PeachPuff,    Peru,    DarkOrange,    BurlyWood,    Tan,
+    Orange,    LightOrange,    DarkOrange,    Salmon,    Tomato,    DarkSalmon,    Coral,    OrangeRed,    LightSalmon,    Sienna,    SeaShell,    Chocolate,    SaddleBrown,    SandyBrown,    PeachPuff,    Peru,    BurlyWood,    Tan,
     Yellow,    Linen,    Bisque,    AntiqueWhite,    NavajoWhite,    BlanchedAlmond,    PapayaWhip,    Moccasin,    Wheat,    OldLace,    FloralWhite,    DarkGoldenrod,    Goldenrod,    Cornsilk,    Gold,    Khaki,    LemonChiffon,    PaleGoldenrod,    DarkKhaki,    Beige,    LightGoldenrodYellow,    LightYellow,    Ivory,
     Green,    Olive,    OliveDrab,    YellowGreen,    DarkOliveGreen,    GreenYellow,    Chartreuse,    LawnGreen,    DarkSeaGreen,    LightGreen,    ForestGreen,    LimeGreen,    PaleGreen,    DarkGreen,    Lime,    HoneyDew,    SeaGreen,    MediumSeaGreen,    SpringGreen,    MintCream,    MediumSpringGreen,
     Blue,    MediumAquamarine,    Aquamarine,    Turquoise,    LightSeaGreen,    MediumTurquoise,    DarkSlateGray,    PaleTurquoise,    Teal,    DarkCyan,    Aqua,    Cyan,    LightCyan,    Azure,    DarkTurqoise,    CadetBlue,    PowderBlue,    LightBlue,    DeepSkyBlue,    SkyBlue,    LightSkyBlue,    SteelBlue,    AliceBlue,    DodgerBlue,    SlateGray,    LightSlateGray,    LightSteelBlue,    CornflowerBlue,    RoyalBlue,    MidnightBlue,    Lavender,    Navy,    DarkBlue,    MediumBlue,    GhostWhite,    SlateBlue,
@@ -322,7 +1427,7 @@ class Color(object):
     "Black",    "Fog",    "DimGray",    "Gray",    "Mist",
     "Silver",    "LightGray",    "Gainsboro",    "WhiteSmoke",    "White",
     "Red",    "Blood",    "Maroon",    "DarkRed",    "Brown",    "RedBrown",    "Mud",    "Firebrick",    "IndianRed",    "LightCoral",    "RosyBrown",    "MistyRose",
-    "Orange",    "LightOrange",    "DarkOrange",    "Salmon",    "Tomato",    "DarkSalmon",    "Coral",    "OrangeRed",    "LightSalmon",    "Sienna",    "SeaShell",    "Chocolate",    "SaddleBrown",    "SandyBrown",    "PeachPuff",    "Peru",    "DarkOrange",    "BurlyWood",    "Tan",
+    "Orange",    "LightOrange",    "DarkOrange",    "Salmon",    "Tomato",    "DarkSalmon",    "Coral",    "OrangeRed",    "LightSalmon",    "Sienna",    "SeaShell",    "Chocolate",    "SaddleBrown",    "SandyBrown",    "PeachPuff",    "Peru",    "BurlyWood",    "Tan",
     "Yellow",    "Linen",    "Bisque",    "AntiqueWhite",    "NavajoWhite",    "BlanchedAlmond",    "PapayaWhip",    "Moccasin",    "Wheat",    "OldLace",    "FloralWhite",    "DarkGoldenrod",    "Goldenrod",    "Cornsilk",    "Gold",    "Khaki",    "LemonChiffon",    "PaleGoldenrod",    "DarkKhaki",    "Beige",    "LightGoldenrodYellow",    "LightYellow",    "Ivory",
     "Green",    "Olive",    "OliveDrab",    "YellowGreen",    "DarkOliveGreen",    "GreenYellow",    "Chartreuse",    "LawnGreen",    "DarkSeaGreen",    "LightGreen",    "ForestGreen",    "LimeGreen",    "PaleGreen",    "DarkGreen",    "Lime",    "HoneyDew",    "SeaGreen",    "MediumSeaGreen",    "SpringGreen",    "MintCream",    "MediumSpringGreen",
     "Blue",    "MediumAquamarine",    "Aquamarine",    "Turquoise",    "LightSeaGreen",    "MediumTurquoise",    "DarkSlateGray",    "PaleTurquoise",    "Teal",    "DarkCyan",    "Aqua",    "Cyan",    "LightCyan",    "Azure",    "DarkTurqoise",    "CadetBlue",    "PowderBlue",    "LightBlue",    "DeepSkyBlue",    "SkyBlue",    "LightSkyBlue",    "SteelBlue",    "AliceBlue",    "DodgerBlue",    "SlateGray",    "LightSlateGray",    "LightSteelBlue",    "CornflowerBlue",    "RoyalBlue",    "MidnightBlue",    "Lavender",    "Navy",    "DarkBlue",    "MediumBlue",    "GhostWhite",    "SlateBlue",
@@ -330,8 +1435,274 @@ class Color(object):
     ]
 
     colDict = {}
+    colNames = {}  # Índice inverso: color -> primer nombre con ese valor
     for c in range(len(colores)):
         colDict[str_colores[c]] = colores[c]
+        colNames.setdefault(colores[c], str_colores[c])
+
+    @staticmethod
+    def name_of(color):
+        '''Devuelve el nombre del color pasado, o None si no tiene nombre. Si varios nombres tienen el mismo valor
+        devuelve el primero de la lista (por ejemplo Transparent y no Null)'''
+
+        color = tuple(color)
+        if len(color) == 4 and color[3] == 255:
+            color = color[:3]
+        return Color.colNames.get(color)
+
+    @staticmethod
+    def parse(valor):
+        '''Devuelve como tupla el color pasado, que puede ser una tupla, un pygame.Color, el nombre de un color de esta
+        clase o un texto hexadecimal '#RRGGBB' o '#RRGGBBAA'. Lanza ValueError si no es un color válido'''
+
+        if isinstance(valor, (tuple, list, pygame.Color)):
+            return tuple(valor)
+
+        try:
+            if valor in Color.colDict:
+                return Color.colDict[valor]
+
+            if valor[:1] == '#' and len(valor) in (7, 9):
+                return tuple(int(valor[i:i+2], 16) for i in range(1, len(valor), 2))
+        except (TypeError, ValueError):  # No es un texto (un número, None, un diccionario) o no es hexadecimal
+            pass
+
+        raise ValueError('Color desconocido: %r' % (valor,))
+
+
+
+class Theme(object):
+    '''Tema visual compilado a partir de una hoja de estilos declarativa. Cada estilo se compila una sola vez en
+    objetos Layer, Border y Font congelados, que comparten todos los controles a los que se aplica el tema. Cambiar de
+    tema con swap() modifica esos objetos en el lugar, así que no hay que tocar ningún control: alcanza con llamar a
+    update() de la pantalla.
+
+    La hoja es un diccionario con una paleta opcional y los estilos, por nombre de clase de control. Los colores pueden
+    ser nombres de la paleta, nombres de la clase Color, textos '#RRGGBB' o '#RRGGBBAA', o tuplas:
+
+        {'palette': {'fondo': '#202020', 'acento': 'DarkOrange'},
+         'styles': {'*': {'background': {'color': 'fondo'},
+                          'font': {'size': 'Default', 'color': 'White'}},
+                    'Button': {'background': {'hover': 'acento', 'down': 'White'},
+                               'border': {'color': 'acento', 'size': 1}},
+                    'Aceptar': {'extends': 'Button', 'font': {'bold': True}}}}
+
+    Las capas (background, midground y foreground) aceptan color (los cuatro estados), normal, hover, down, disable y
+    type. El borde acepta color, size, style y show, y la fuente name, size, color, bold e italic. Cada estilo hereda
+    del indicado en extends, o de '*' si no indica ninguno, y solo reemplaza las partes que nombra.'''
+
+    LAYERS = ('background', 'midground', 'foreground')
+    PARTS = LAYERS + ('border', 'font')
+
+    __states = (('normal', 'normal_color'), ('hover', 'hover_color'), ('down', 'down_color'),
+                ('disable', 'disable_color'))
+
+
+    def __init__(self, sheet):
+        self.__compiled = {}    # nombre del estilo -> {parte: objeto compartido}
+        self.__by_class = {}    # clase de control -> nombre del estilo
+        self.__applied = weakref.WeakKeyDictionary()  # control -> nombre del estilo que se le aplicó
+        self.__load(sheet)
+
+    def __load(self, sheet):
+        '''Toma la hoja de estilos y precalcula la paleta. Es de uso privado'''
+
+        self.__styles = dict(sheet.get('styles', {}))
+        self.__palette = {}     # nombre -> pygame.Color
+        self.__packed = {}      # nombre -> entero 0xRRGGBBAA
+
+        for nombre, valor in sheet.get('palette', {}).items():
+            color = pygame.Color(*Color.parse(valor))
+            self.__palette[nombre] = color
+            self.__packed[nombre] = (color.r << 24) | (color.g << 16) | (color.b << 8) | color.a
+
+        self.__by_class.clear()
+
+    # CONSULTAS
+
+    @property
+    def styles(self):
+        '''Nombres de los estilos de la hoja actual'''
+        return list(self.__styles.keys())
+
+    def color(self, name):
+        '''Devuelve el pygame.Color de la paleta con el nombre pasado'''
+        return self.__palette[name]
+
+    def packed(self, name):
+        '''Devuelve el color de la paleta con el nombre pasado como entero 0xRRGGBBAA'''
+        return self.__packed[name]
+
+    def __resolve(self, valor):
+        '''Devuelve como tupla RGBA un color de la paleta o cualquier valor que acepte Color.parse(). Es de uso
+        privado'''
+
+        if not isinstance(valor, (tuple, list, pygame.Color)) and valor in self.__palette:
+            return tuple(self.__palette[valor])
+        return tuple(pygame.Color(*Color.parse(valor)))
+
+    def style_for(self, control):
+        '''Devuelve el nombre del estilo que corresponde al control: el de su clase o el de la clase base más cercana
+        que tenga estilo, o el estilo '*' '''
+
+        cls = type(control)
+        nombre = self.__by_class.get(cls)
+        if nombre == None:
+            nombre = '*'
+            for base in cls.__mro__:
+                if base.__name__ in self.__styles:
+                    nombre = base.__name__
+                    break
+            self.__by_class[cls] = nombre
+
+        return nombre
+
+    # COMPILACION
+
+    def __merged(self, nombre, visitados=()):
+        '''Devuelve el estilo pasado combinado con los estilos de los que hereda. Es de uso privado'''
+
+        if nombre in visitados:
+            raise ValueError('Herencia circular en el estilo %r' % (nombre,))
+
+        estilo = self.__styles.get(nombre)
+        if estilo == None:
+            if nombre == '*':
+                return {}
+            raise KeyError(nombre)
+
+        base = estilo.get('extends', None if nombre == '*' else '*')
+        resultado = {} if base == None else self.__merged(base, visitados + (nombre,))
+
+        for parte in Theme.PARTS:
+            if parte in estilo:
+                combinada = dict(resultado.get(parte, {}))
+                combinada.update(estilo[parte])
+                resultado[parte] = combinada
+
+        return resultado
+
+    def __build(self, nombre):
+        '''Crea los objetos de cada parte del estilo pasado, sin congelar. Es de uso privado'''
+
+        partes = {}
+        for parte, valores in self.__merged(nombre).items():
+            if parte in Theme.LAYERS:
+                obj = Layer()
+                if 'type' in valores:
+                    obj.type = valores['type']
+                if 'color' in valores:
+                    color = self.__resolve(valores['color'])
+                    for clave, atributo in Theme.__states:
+                        setattr(obj, atributo, color)
+                for clave, atributo in Theme.__states:
+                    if clave in valores:
+                        setattr(obj, atributo, self.__resolve(valores[clave]))
+
+            elif parte == 'border':
+                obj = Border()
+                for clave, valor in valores.items():
+                    setattr(obj, clave, self.__resolve(valor) if clave == 'color' else valor)
+
+            else:
+                color = self.__resolve(valores['color']) if 'color' in valores else (0, 0, 0)
+                obj = Font(valores.get('size', 'Default'), color, valores.get('bold', False),
+                           valores.get('italic', False))
+                if 'name' in valores:
+                    obj.name = valores['name']
+
+            partes[parte] = obj
+
+        return partes
+
+    def compile(self, name):
+        '''Devuelve un diccionario con los objetos compartidos (parte -> Layer, Border o Font) del estilo pasado. Se
+        compilan la primera vez que se piden'''
+
+        partes = self.__compiled.get(name)
+        if partes == None:
+            partes = self.__build(name)
+            for obj in partes.values():
+                obj.freeze()
+            self.__compiled[name] = partes
+
+        return partes
+
+    # USO
+
+    def apply(self, target, style=None):
+        '''Aplica el tema a los controles de target, que puede ser una pantalla, un control o una lista de controles.
+        Los contenedores (todo lo que tiene get_controls(), como Screen y Panel) se recorren hasta el último hijo, y si
+        además son controles también reciben su estilo. Cada control usa el estilo de su clase, o el estilo pasado en
+        style. Los controles quedan apuntando a los objetos compartidos del tema, sin copiarlos. Esos objetos están
+        congelados: para cambiar una parte en un solo control se le asigna una copia (control.background =
+        control.background.copy()). Animator.tween() lo hace solo cuando anima una parte compartida'''
+
+        if hasattr(target, 'background'):
+            nombre = style if style != None else self.style_for(target)
+            for parte, obj in self.compile(nombre).items():
+                if getattr(target, parte) is not obj:
+                    setattr(target, parte, obj)
+            self.__applied[target] = nombre
+            hijos = target.get_controls() if hasattr(target, 'get_controls') else ()
+        elif hasattr(target, 'get_controls'):
+            hijos = target.get_controls()
+        else:
+            hijos = target
+
+        for control in hijos:
+            self.apply(control, style)
+
+    def swap(self, sheet):
+        '''Cambia la hoja de estilos del tema. Los objetos compartidos se actualizan en el lugar y cambian de versión,
+        así que los controles que ya usan el tema se ven con la hoja nueva después del próximo update() de su pantalla'''
+
+        self.__load(sheet)
+
+        anteriores = self.__compiled
+        self.__compiled = {}
+        nuevas = {}  # estilos que ganaron o perdieron partes
+
+        for nombre, partes in anteriores.items():
+            if nombre not in self.__styles and nombre != '*':
+                continue  # El estilo ya no existe: los controles conservan su último aspecto
+
+            compiladas = self.__build(nombre)
+            for parte, obj in compiladas.items():
+                viejo = partes.get(parte)
+                if viejo == None:
+                    obj.freeze()
+                    continue
 
+                if parte == 'font':
+                    viejo._Font__become(obj)
+                else:
+                    version = viejo.version
+                    viejo.__dict__.update(obj.__dict__)
+                    object.__setattr__(viejo, 'version', version + 1)
+                    touch_style()
+                    object.__setattr__(viejo, 'frozen', True)
+                compiladas[parte] = viejo
 
+            if set(compiladas) != set(partes):
+                nuevas[nombre] = compiladas
+            self.__compiled[nombre] = compiladas
 
+        # Las partes que el estilo ganó se asignan a los controles; las que perdió vuelven a los valores por defecto
+        if nuevas:
+            for control, nombre in list(self.__applied.items()):
+                partes = nuevas.get(nombre)
+                if partes == None:
+                    continue
+                for parte in Theme.PARTS:
+                    actual = getattr(control, parte)
+                    if parte in partes:
+                        if actual is not partes[parte]:
+                            setattr(control, parte, partes[parte])
+                    elif actual is anteriores[nombre].get(parte):
+                        if parte == 'font':
+                            setattr(control, parte, Font('Default'))
+                        elif parte == 'border':
+                            setattr(control, parte, Border())
+                        else:
+                            setattr(control, parte, Layer())
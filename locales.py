@@ -82,3 +82,31 @@ D_PREVNEXT = 3 # Puede moverse en ambos sentidos
 M_BUTTON1 = 1
 M_BUTTON2 = 2
 M_BUTTON3 = 4
+
+
+###################################################
+##                                               ##
+##                  ESTADOS                      ##
+##                                               ##
+##  Estados visuales de un control. Se usan para ##
+##  saber que superficie debe dibujarse y para   ##
+##  detectar cambios entre un frame y el otro.   ##
+###################################################
+ST_NORMAL = 0
+ST_HOVER = 1
+ST_DOWN = 2
+ST_DISABLE = 3
+
+
+###################################################
+##                                               ##
+##                  AJUSTES                      ##
+##                                               ##
+##  Formas de ajustar una imagen a un tamaño.    ##
+##  F_STRETCH la estira sin conservar la         ##
+##  proporción, F_FIT la hace entrar completa y  ##
+##  F_FILL cubre todo el tamaño recortándola.    ##
+###################################################
+F_STRETCH = 0
+F_FIT = 1
+F_FILL = 2
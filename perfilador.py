@@ -0,0 +1,211 @@
+#! /usr/bin/env python
+#-*- coding: UTF-8 -*-
+import pygame
+from collections import deque
+from timeit import default_timer
+from controles import *
+
+'''Perfilador de frames. Mide cuánto tarda cada control y cada pantalla en render, update, click y keydown.
+
+Mientras está deshabilitado no agrega ningún costo: los métodos se envuelven recién al llamar a Profiler.enable() y se
+restauran los originales con Profiler.disable(). Los controles definidos en módulos importados después de enable()
+no se miden hasta volver a llamarlo.
+
+Uso:
+    Profiler.enable()
+    ...
+    Screen.get_current().render(display)
+    Profiler.draw_overlay(display)  # Muestra los controles más costosos de la pantalla actual'''
+
+
+class Profiler(object):
+    '''Registro de tiempos por control, por clase y por pantalla, con historial circular de los últimos llamados'''
+
+    CONTROL_PHASES = ('render', 'update', 'click', 'keydown')
+    SCREEN_PHASES = ('render', 'update')
+
+    history = 120  # Cantidad de mediciones que se guardan por fase
+
+    __enabled = False
+    __originals = []   # (clase, nombre del método, función original)
+    __active = set()   # Llamados en curso, para no medir dos veces los que llaman al método de la clase base
+    __controls = {}    # nombre del control -> {fase: deque de milisegundos}
+    __classes = {}     # nombre de la clase -> {fase: deque de milisegundos}
+    __screens = {}     # nombre de la pantalla -> {fase: deque de milisegundos}
+
+
+    @staticmethod
+    def __record(tabla, clave, fase, ms):
+        '''Guarda una medición en la tabla pasada. Es de uso privado'''
+
+        fases = tabla.get(clave)
+        if fases == None:
+            fases = tabla[clave] = {}
+
+        historial = fases.get(fase)
+        if historial == None:
+            historial = fases[fase] = deque(maxlen=Profiler.history)
+
+        historial.append(ms)
+
+    @staticmethod
+    def __wrap(cls, fase, original, es_pantalla):
+        '''Devuelve una función que mide el tiempo de original. Es de uso privado'''
+
+        def medido(self, *args, **kwargs):
+            clave = (id(self), fase)
+            if clave in Profiler.__active:
+                return original(self, *args, **kwargs)  # Llamado desde la misma fase de una clase derivada
+
+            Profiler.__active.add(clave)
+            inicio = default_timer()
+            try:
+                return original(self, *args, **kwargs)
+            finally:
+                ms = (default_timer() - inicio) * 1000
+                Profiler.__active.discard(clave)
+
+                if es_pantalla:
+                    Profiler.__record(Profiler.__screens, self.name, fase, ms)
+                else:
+                    Profiler.__record(Profiler.__controls, self.name, fase, ms)
+                    Profiler.__record(Profiler.__classes, type(self).__name__, fase, ms)
+
+        medido.__name__ = original.__name__
+        medido.__doc__ = original.__doc__
+        medido.__wrapped__ = original  # Así Screen no lo junta con los demás en un solo blits()
+        return medido
+
+    @staticmethod
+    def __subclasses(cls):
+        '''Devuelve la clase pasada y todas sus derivadas. Es de uso privado'''
+
+        clases = [cls]
+        for sub in cls.__subclasses__():
+            clases.extend(Profiler.__subclasses(sub))
+        return clases
+
+    @staticmethod
+    def enable():
+        '''Comienza a medir. Envuelve los métodos de Screen, Control y de todas las clases derivadas de Control'''
+
+        if Profiler.__enabled:
+            Profiler.disable()
+
+        objetivos = [(Screen, Profiler.SCREEN_PHASES, True)]
+        objetivos += [(c, Profiler.CONTROL_PHASES, False) for c in Profiler.__subclasses(Control)]
+
+        for cls, fases, es_pantalla in objetivos:
+            for fase in fases:
+                original = cls.__dict__.get(fase)  # Solo los métodos definidos en la propia clase
+                if original != None:
+                    Profiler.__originals.append((cls, fase, original))
+                    setattr(cls, fase, Profiler.__wrap(cls, fase, original, es_pantalla))
+
+        Profiler.__enabled = True
+
+    @staticmethod
+    def disable():
+        '''Deja de medir y restaura los métodos originales. Las mediciones se conservan'''
+
+        for cls, fase, original in Profiler.__originals:
+            setattr(cls, fase, original)
+
+        Profiler.__originals = []
+        Profiler.__active.clear()
+        Profiler.__enabled = False
+
+    @staticmethod
+    def is_enabled():
+        '''Devuelve True si el perfilador está midiendo'''
+        return Profiler.__enabled
+
+    @staticmethod
+    def reset():
+        '''Borra todas las mediciones'''
+        Profiler.__controls.clear()
+        Profiler.__classes.clear()
+        Profiler.__screens.clear()
+
+
+    # CONSULTAS
+
+    @staticmethod
+    def __summary(tabla, clave):
+        '''Devuelve un diccionario con el tiempo promedio en ms de cada fase. Es de uso privado'''
+
+        fases = tabla.get(clave, {})
+        return dict((f, sum(h) / len(h)) for f, h in fases.items() if h)
+
+    @staticmethod
+    def control_stats(name):
+        '''Tiempo promedio en ms de cada fase del control de nombre name'''
+        return Profiler.__summary(Profiler.__controls, name)
+
+    @staticmethod
+    def class_stats(name):
+        '''Tiempo promedio en ms de cada fase de todos los controles de la clase de nombre name'''
+        return Profiler.__summary(Profiler.__classes, name)
+
+    @staticmethod
+    def screen_stats(name):
+        '''Tiempo promedio en ms de cada fase de la pantalla de nombre name'''
+        return Profiler.__summary(Profiler.__screens, name)
+
+    @staticmethod
+    def history_of(name, phase):
+        '''Lista con las últimas mediciones en ms de la fase phase del control de nombre name'''
+        return list(Profiler.__controls.get(name, {}).get(phase, ()))
+
+    @staticmethod
+    def top(n=5, screen=None):
+        '''Devuelve una lista de tuplas (ms, nombre, clase) con los n controles más costosos de la pantalla pasada, o
+        de la pantalla actual si no se pasa ninguna. El costo es la suma de los promedios de todas las fases'''
+
+        if screen == None:
+            screen = Screen.get_current()
+        if screen == None:
+            return []
+
+        costos = []
+        for c in screen.get_controls():
+            stats = Profiler.__summary(Profiler.__controls, c.name)
+            if stats:
+                costos.append((sum(stats.values()), c.name, type(c).__name__))
+
+        costos.sort(reverse=True)
+        return costos[:n]
+
+
+    # DIBUJADO
+
+    @staticmethod
+    def draw_overlay(display, n=5, pos=(0, 0), font=None):
+        '''Dibuja sobre el display un recuadro con los n controles más costosos de la pantalla actual. Llamarlo después
+        del render de la pantalla. Devuelve el rectángulo dibujado'''
+
+        if font == None:
+            font = Font('Small', Color.White)
+
+        pantalla = Screen.get_current()
+        lineas = []
+        if pantalla != None:
+            stats = Profiler.screen_stats(pantalla.name)
+            lineas.append('%s  render %.2f ms  update %.2f ms' % (pantalla.name, stats.get('render', 0),
+                                                                   stats.get('update', 0)))
+
+        for ms, nombre, clase in Profiler.top(n):
+            lineas.append('%7.3f ms  %s (%s)' % (ms, nombre, clase))
+
+        imagenes = [font.render(l, True) for l in lineas]
+        ancho = max([i.get_width() for i in imagenes] or [0]) + 8
+        alto = sum([i.get_height() for i in imagenes]) + 8
+
+        fondo = pygame.Surface((ancho, alto), pygame.SRCALPHA)
+        fondo.fill((0, 0, 0, 180))
+        y = 4
+        for i in imagenes:
+            fondo.blit(i, (4, y))
+            y += i.get_height()
+
+        return display.blit(fondo, pos)
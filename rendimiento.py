@@ -0,0 +1,250 @@
+#! /usr/bin/env python
+#-*- coding: UTF-8 -*-
+'''Pruebas de rendimiento de los controles. Se ejecutan sin ventana, con el driver de video "dummy" de SDL.
+
+Para cada cantidad N de controles se arma una pantalla sintética con Buttons, Labels, TextBoxes, CheckBoxes e Images
+y se mide el tiempo de construcción, de update(), de render() por frame (completo y por regiones sucias), la latencia
+de despacho de eventos, el renderizado de textos (con la cache de textos vacía y llena) y el pico de memoria. Los
+resultados se imprimen y se guardan en un archivo JSON para poder comparar entre versiones.
+
+La memoria se informa de tres formas: el pico del heap de Python (tracemalloc, solo Python 3), el pico de memoria
+residente del proceso y lo que ocupan los pixeles de las superficies de estado, que SDL reserva fuera de Python.
+
+Uso:
+    python rendimiento.py
+    python rendimiento.py --sizes 10,100,1000 --frames 50 --output resultados.json'''
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+
+import pygame
+
+try:
+    import tracemalloc  # Solo en Python 3
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource  # Solo en sistemas Unix
+except ImportError:
+    resource = None
+
+from controles import *
+
+
+TIPOS = ('Button', 'Label', 'TextBox', 'CheckBox', 'Image')
+TAMANIO_PANTALLA = (1024, 768)
+
+
+def peak_memory():
+    '''Devuelve el pico de memoria de Python en KB desde el último reinicio de tracemalloc, o None si no se está
+    midiendo. No incluye los pixeles de las superficies, que reserva SDL fuera del heap de Python'''
+
+    if tracemalloc != None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] // 1024
+    return None
+
+
+def max_rss():
+    '''Devuelve el pico de memoria residente del proceso en KB, que sí incluye los pixeles de SDL, o None si no se
+    puede obtener. Es el máximo de todo el proceso, así que solo crece entre una medición y la siguiente'''
+
+    if resource == None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # En macOS ru_maxrss está en bytes, en Linux en KB
+        rss //= 1024
+    return rss
+
+
+def surface_memory(controles):
+    '''Devuelve los KB que ocupan los pixeles de las superficies de estado ya dibujadas de los controles. Las
+    superficies compartidas entre estados se cuentan una sola vez'''
+
+    vistas = {}
+    for c in controles:
+        sup = c.get_surface(c.get_state())
+        vistas[id(sup)] = sup.get_pitch() * sup.get_height()
+    return sum(vistas.values()) // 1024
+
+
+def imagen_sintetica(ancho, alto):
+    '''Devuelve una superficie de ancho x alto con un degradé, para que las Images tengan algo que escalar y dibujar
+    sin depender de archivos'''
+
+    sup = pygame.Surface((ancho, alto), pygame.SRCALPHA)
+    for y in range(alto):
+        tono = 255 * y // max(alto - 1, 1)
+        pygame.draw.line(sup, (tono, 128, 255 - tono, 255), (0, y), (ancho - 1, y))
+    return sup
+
+
+def crear_controles(n, prefijo):
+    '''Crea n controles de los tipos de TIPOS distribuidos en una grilla que cubre la pantalla. Todas las Images
+    muestran la misma imagen sintética'''
+
+    columnas = int(n ** 0.5) + 1
+    ancho = max(TAMANIO_PANTALLA[0] // columnas, 8)
+    alto = max(TAMANIO_PANTALLA[1] // columnas, 8)
+    imagen = imagen_sintetica(ancho, alto)
+
+    controles = []
+    for i in range(n):
+        rect = ((i % columnas) * ancho, (i // columnas) * alto, ancho, alto)
+        nombre = '%s_%d' % (prefijo, i)
+        tipo = TIPOS[i % len(TIPOS)]
+
+        if tipo == 'Button':
+            c = Button(rect, nombre, lambda: None)
+        elif tipo == 'Label':
+            c = Label(rect, nombre, 'OK')
+        elif tipo == 'TextBox':
+            c = TextBox(rect, nombre, '123')
+        elif tipo == 'CheckBox':
+            c = CheckBox(rect, nombre, i % 2 == 0)
+        else:
+            c = Image(rect, nombre, imagen)
+
+        controles.append(c)
+
+    return controles
+
+
+def cronometrar(funcion, veces):
+    '''Ejecuta funcion la cantidad de veces indicada y devuelve el tiempo promedio en segundos'''
+
+    inicio = time.time()
+    for i in range(veces):
+        funcion()
+    return (time.time() - inicio) / veces
+
+
+def medir(n, frames, display):
+    '''Mide todas las fases para una pantalla de n controles y devuelve un diccionario con los resultados'''
+
+    gc.collect()
+    if tracemalloc != None:
+        tracemalloc.start()
+
+    prefijo = 'bench%d_%d' % (n, int(time.time() * 1000))
+
+    # Construcción: creación de los controles y alta en la pantalla
+    inicio = time.time()
+    pantalla = Screen(prefijo)
+    controles = crear_controles(n, prefijo)
+    pantalla.addControls(*controles)
+    construccion = time.time() - inicio
+
+    # Update de todos los controles. update() solo descarta las superficies, así que se fuerza el dibujo de la
+    # superficie del estado actual de cada control para medir el trabajo que antes hacía update()
+    inicio = time.time()
+    pantalla.update()
+    for c in controles:
+        c.get_surface(c.get_state())
+    actualizacion = time.time() - inicio
+
+    Screen.set_current(prefijo)
+
+    # Render completo por frame
+    pantalla.dirty_mode = False
+    pantalla.render(display)  # El primer frame compone las superficies
+    render = cronometrar(lambda: pantalla.render(display), frames)
+
+    # Render por regiones sucias, con un control cambiando en cada frame
+    pantalla.dirty_mode = True
+    pantalla.render(display)
+    checks = [c for c in controles if isinstance(c, CheckBox)] or controles
+
+    def frame_sucio():
+        c = random.choice(checks)
+        c.mark_dirty()
+        pantalla.render(display)
+
+    render_sucio = cronometrar(frame_sucio, frames)
+
+    # Latencia de despacho de un click en una posición al azar
+    eventos = [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1,
+                                  pos=(random.randrange(TAMANIO_PANTALLA[0]), random.randrange(TAMANIO_PANTALLA[1])))
+               for i in range(frames)]
+    pendientes = list(eventos)
+    despacho = cronometrar(lambda: pantalla.handle_event(pendientes.pop()), frames)
+
+    # Renderizado de textos: en frío se vacía la cache de textos antes de cada pasada, en caliente se reutiliza
+    textos = ['%d %s' % (i % 50, TIPOS[i % len(TIPOS)]) for i in range(n)]
+    fuente = Font()
+
+    def textos_en_frio():
+        Font.clear_text_cache()
+        for t in textos:
+            fuente.render(t, True)
+
+    def textos_en_caliente():
+        for t in textos:
+            fuente.render(t, True)
+
+    texto_frio = cronometrar(textos_en_frio, frames)
+    textos_en_caliente()  # Llena la cache
+    texto_caliente = cronometrar(textos_en_caliente, frames)
+
+    memoria = peak_memory()
+    if tracemalloc != None:
+        tracemalloc.stop()
+    superficies = surface_memory(controles)
+
+    return {'n': n,
+            'construction_s': construccion,
+            'update_s': actualizacion,
+            'render_frame_ms': render * 1000,
+            'render_dirty_frame_ms': render_sucio * 1000,
+            'dispatch_us': despacho * 1000000,
+            'text_render_cold_s': texto_frio,
+            'text_render_warm_s': texto_caliente,
+            'peak_memory_kb': memoria,
+            'max_rss_kb': max_rss(),
+            'surface_memory_kb': superficies}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pruebas de rendimiento de los controles')
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='Cantidades de controles separadas por coma')
+    parser.add_argument('--frames', type=int, default=30, help='Cantidad de frames a promediar en cada medición')
+    parser.add_argument('--output', default='rendimiento.json', help='Archivo JSON donde guardar los resultados')
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    display = pygame.display.set_mode(TAMANIO_PANTALLA)
+    random.seed(0)
+
+    resultados = []
+    for n in [int(x) for x in args.sizes.split(',')]:
+        r = medir(n, args.frames, display)
+        resultados.append(r)
+        print('N=%(n)6d  construccion=%(construction_s).3fs  update=%(update_s).3fs  '
+              'render=%(render_frame_ms).2fms  render_sucio=%(render_dirty_frame_ms).2fms  '
+              'despacho=%(dispatch_us).1fus  textos=%(text_render_cold_s).4fs/%(text_render_warm_s).4fs  memoria=%(peak_memory_kb)sKB  rss=%(max_rss_kb)sKB  '
+              'superficies=%(surface_memory_kb)sKB' % r)
+
+    salida = {'python': platform.python_version(),
+              'pygame': pygame.version.ver,
+              'driver': os.environ['SDL_VIDEODRIVER'],
+              'frames': args.frames,
+              'results': resultados}
+
+    with open(args.output, 'w') as f:
+        json.dump(salida, f, indent=2, sort_keys=True)
+
+    pygame.quit()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())